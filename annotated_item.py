@@ -1,11 +1,20 @@
+from datetime import datetime
+
+from dateutil import tz
+
+
 class AnnotatedItem:
     """
     Utility class to simplify access to holding dictionary and annotation for an item.
     """
 
-    def __init__(self, id, source):
+    def __init__(self, id, source, index=None):
         self.id = id
-        self.doc = source["doc"]
+        # Concrete index of the item (the manager may search an alias), used to update the item.
+        self.index = index
+        # Items of tasks created with a document index only reference their document (docId), which is set later by a
+        # DocumentStore (see document_store.py).
+        self.doc = source.get("doc")
         self.docId = source["docId"]
         self.contextDescription = None
         if "context" in source:
@@ -21,6 +30,9 @@ class AnnotatedItem:
                     "time": ann["time"]
                 }
 
+        # Scores written by offline models (e.g. uncertainty of a classifier), used by some selection policies.
+        self.scores = source.get("scores", {})
+
         # Holding annotators dictionary (key is annotatorId).
         self.holdingAnnotators = {}
 
@@ -42,7 +54,8 @@ class AnnotatedItem:
 
         source = {
             "numValidAnnotations": self.numValidAnnotations,
-            "annotations": annotations
+            "annotations": annotations,
+            "updated": datetime.now(tz.tzlocal())
         }
 
         if self.invalid is not None:
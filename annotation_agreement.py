@@ -0,0 +1,194 @@
+# coding=utf-8
+import numpy as np
+
+
+class AgreementAccumulator:
+    """
+    Accumulate label distributions and inter-annotator agreement statistics over a stream of items, in constant memory
+    with respect to the number of items.
+
+    Items are buffered and processed in chunks: each chunk becomes a matrix of label counts (one row per item, one
+    column per label) and all sums needed by the statistics are updated with vectorized NumPy operations. Labels are
+    discovered on the fly, so the accumulators grow only with the number of distinct labels and annotator pairs.
+
+    Statistics:
+        - label distribution;
+        - percent agreement: mean over items (with two or more annotations) of the fraction of agreeing annotation
+          pairs;
+        - Fleiss' kappa, with the per-item agreement generalized to a variable number of annotators per item;
+        - Cohen's kappa for each pair of annotators, computed over the items annotated by both.
+    """
+
+    def __init__(self, chunkSize=10000, ignoredLabels=("skip",)):
+        """
+        :param chunkSize: number of items buffered before updating the accumulators.
+        :param ignoredLabels: labels that are not considered annotations (e.g. skips).
+        """
+        self.chunkSize = chunkSize
+        self.ignoredLabels = set(ignoredLabels)
+
+        # Label names and their column indices.
+        self.labels = []
+        self.__labelIndex = {}
+
+        # Annotator pairs and their indices in the confusion matrices.
+        self.pairs = []
+        self.__pairIndex = {}
+
+        # Buffered items: each one is a list of (annotatorId, labelIndex) pairs.
+        self.__buffer = []
+
+        # Accumulators.
+        self.numItems = 0
+        self.labelCounts = np.zeros(0, dtype=np.int64)
+        self.numAgreementItems = 0
+        self.sumItemAgreement = 0.0
+        self.agreementLabelCounts = np.zeros(0, dtype=np.int64)
+        self.confusion = np.zeros((0, 0, 0), dtype=np.int64)
+
+    def add(self, annotations):
+        """
+        Add one item.
+
+        :param annotations: list of (annotatorId, label) pairs.
+        """
+        row = []
+        for (annotatorId, label) in annotations:
+            if label in self.ignoredLabels:
+                continue
+            idx = self.__labelIndex.get(label)
+            if idx is None:
+                idx = self.__labelIndex[label] = len(self.labels)
+                self.labels.append(label)
+            row.append((annotatorId, idx))
+        self.__buffer.append(row)
+        if len(self.__buffer) >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Process the buffered items.
+        """
+        if len(self.__buffer) == 0:
+            return
+
+        numLabels = len(self.labels)
+        self.__grow(numLabels)
+
+        # Label count matrix of this chunk.
+        rows = []
+        cols = []
+        for (i, row) in enumerate(self.__buffer):
+            for (_, idx) in row:
+                rows.append(i)
+                cols.append(idx)
+        counts = np.zeros((len(self.__buffer), numLabels), dtype=np.int64)
+        np.add.at(counts, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), 1)
+
+        self.numItems += counts.shape[0]
+        self.labelCounts += counts.sum(axis=0)
+
+        # Per-item agreement (items with two or more annotations).
+        n = counts.sum(axis=1)
+        multi = n >= 2
+        if multi.any():
+            c = counts[multi]
+            nm = n[multi].astype(np.float64)
+            itemAgreement = ((c * (c - 1)).sum(axis=1)) / (nm * (nm - 1))
+            self.numAgreementItems += c.shape[0]
+            self.sumItemAgreement += itemAgreement.sum()
+            self.agreementLabelCounts += c.sum(axis=0)
+
+        # Confusion matrices of annotator pairs.
+        pairIdx = []
+        first = []
+        second = []
+        for row in self.__buffer:
+            if len(row) < 2:
+                continue
+            row = sorted(row)
+            for a in xrange(len(row)):
+                for b in xrange(a + 1, len(row)):
+                    pairIdx.append(self.__pair(row[a][0], row[b][0]))
+                    first.append(row[a][1])
+                    second.append(row[b][1])
+        if len(pairIdx) > 0:
+            self.__grow(numLabels)
+            np.add.at(self.confusion, (np.asarray(pairIdx), np.asarray(first), np.asarray(second)), 1)
+
+        self.__buffer = []
+
+    def percentAgreement(self):
+        self.flush()
+        if self.numAgreementItems == 0:
+            return None
+        return self.sumItemAgreement / self.numAgreementItems
+
+    def fleissKappa(self):
+        self.flush()
+        if self.numAgreementItems == 0:
+            return None
+        p = self.agreementLabelCounts / float(self.agreementLabelCounts.sum())
+        pe = (p ** 2).sum()
+        if pe == 1.0:
+            return None
+        return (self.percentAgreement() - pe) / (1 - pe)
+
+    def cohenKappas(self, minItems=1):
+        """
+        Return a list of (annotatorA, annotatorB, numItems, kappa) for each pair of annotators with at least minItems
+        items annotated by both.
+        """
+        self.flush()
+        if len(self.pairs) == 0:
+            return []
+        n = self.confusion.sum(axis=(1, 2)).astype(np.float64)
+        po = np.trace(self.confusion, axis1=1, axis2=2) / np.maximum(n, 1)
+        pe = (self.confusion.sum(axis=2) * self.confusion.sum(axis=1)).sum(axis=1) / np.maximum(n, 1) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            kappa = np.where(pe < 1.0, (po - pe) / (1 - pe), np.nan)
+        result = []
+        for (i, (a, b)) in enumerate(self.pairs):
+            if n[i] >= minItems:
+                result.append((a, b, int(n[i]), None if np.isnan(kappa[i]) else float(kappa[i])))
+        return result
+
+    def summary(self, minPairItems=1):
+        """
+        Return a dictionary with all statistics.
+        """
+        self.flush()
+        return {
+            "numItems": self.numItems,
+            "labelDistribution": dict((label, int(self.labelCounts[i])) for (i, label) in enumerate(self.labels)),
+            "numItemsWithMultipleAnnotations": self.numAgreementItems,
+            "percentAgreement": self.percentAgreement(),
+            "fleissKappa": self.fleissKappa(),
+            "cohenKappa": [
+                {"annotators": [a, b], "numItems": numItems, "kappa": kappa}
+                for (a, b, numItems, kappa) in self.cohenKappas(minPairItems)
+            ]
+        }
+
+    def __pair(self, a, b):
+        key = (a, b)
+        idx = self.__pairIndex.get(key)
+        if idx is None:
+            idx = self.__pairIndex[key] = len(self.pairs)
+            self.pairs.append(key)
+        return idx
+
+    def __grow(self, numLabels):
+        """
+        Resize the accumulators to the current number of labels and annotator pairs.
+        """
+        if self.labelCounts.shape[0] < numLabels:
+            self.labelCounts = np.concatenate(
+                [self.labelCounts, np.zeros(numLabels - self.labelCounts.shape[0], dtype=np.int64)])
+            self.agreementLabelCounts = np.concatenate(
+                [self.agreementLabelCounts, np.zeros(numLabels - self.agreementLabelCounts.shape[0], dtype=np.int64)])
+        (numPairs, k, _) = self.confusion.shape
+        if numPairs < len(self.pairs) or k < numLabels:
+            confusion = np.zeros((max(len(self.pairs), numPairs), numLabels, numLabels), dtype=np.int64)
+            confusion[:numPairs, :k, :k] = self.confusion
+            self.confusion = confusion
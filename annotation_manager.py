@@ -1,14 +1,24 @@
 # coding=utf-8
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
-from threading import Thread, Condition
+from thread import get_ident
+from threading import Condition, Lock
 
 from dateutil import tz
-from elasticsearch.helpers import scan
+from elasticsearch.helpers import scan, bulk
 
+import metrics
+from tracing import tracer
 from annotated_item import AnnotatedItem
+from prefetch_sizer import PrefetchSizer
+from selection_policy import FinishPartialsFirstPolicy
 
 
-class AnnotationManager(Thread):
+class AnnotationManager(object):
     """
     The annotation manager is responsible to retrieve items to be annotated to coming annotators. It takes care
     of how many annotations were attached to each item and which item is held by each annotator. In order to manage all
@@ -26,112 +36,290 @@ class AnnotationManager(Thread):
     In fact, since each item (potentially) needs to be annotated by more than one annotator, the manager adds a copy
     of an unannotated item for each annotation required for this item.
 
+    The partially annotated items are kept in a priority queue given by a SelectionPolicy (see selection_policy.py).
+    The default policy (FinishPartialsFirstPolicy) returns them in the order they were included. Other policies prefer
+    items whose annotations conflict (and request extra annotations for them) or items with higher scores given by an
+    offline model.
+
     There other two data structures used by the manager to control which annotator is holding which item. When an
     annotator gets a item to be annotated, the manager does not know whether the annotator will really annotate the
     item or will just leave the system, for instance. So, the manager stays on the safe side and considers that the
     annotator will eventually annotated the given item. The manger then includes an entry in the heldItems dictionary
-    in which the key is the annotator id and the value is the associated item.
+    in which the key is the annotator id and the value is the list of associated items. Usually, each annotator
+    holds one item at a time, but an annotator can lease a batch of items (see leaseItems) and annotate them in batch
+    (see annotateBatch), so that it does not need one request to obtain each item.
+
+    The list of unannotated items is refilled by an AnnotationScheduler, which refills the lists of all managers of
+    the application with one multi-search request per cycle. The manager only builds its refill query
+    (refillSearch) and incorporates the results (applyRefill). The number of unannotated items kept in memory is not
+    fixed. A PrefetchSizer measures how fast annotators consume unannotated items and how long the refill queries take,
+    and adapts the buffer size (and thus the refill batch) to the current throughput, within the given bounds.
+
+    Contexts with many concurrent annotators may partition the pools of items in shards (numShards), each one with its
+    own lock, so that the annotators do not contend for a single lock. Items are assigned to shards by their id and
+    annotators to home shards by their id. An annotator gets items from its home shard and, when there is no item
+    for it there, takes items from the other shards (work stealing). Thus, the preference for partially annotated
+    items holds within each shard. Refills are shared by all shards (one query per manager) and the retrieved items
+    are distributed to their shards.
 
     The annotation manager object is a singleton within the application, i.e., there is only one object that is
     shared by all requests/users.
     """
 
-    def __init__(self, name, esClient, index, annotationType, annotationName, numAnnotationsPerItem, logger):
+    # Annotation value used to mark skipped items.
+    SKIP = "skip"
+
+    def __init__(self, name, esClient, index, annotationType, annotationName, numAnnotationsPerItem, logger,
+                 minUnannotatedItems=20, maxUnannotatedItems=2000, maxLeasedItems=20, selectionPolicy=None,
+                 documentStore=None, numShards=1):
         """
-        Create a new annotation manager object and spawn a new thread to produce new annotation items.
+        Create a new annotation manager object. The manager must be registered in an AnnotationScheduler, which loads
+        the partially annotated items and refills the list of unannotated items.
 
         :param name: friendly, but unique, name for this manager.
         :param esClient: Elasticsearch client.
-        :param index: index in ES to be used.
+        :param index: index in ES to be used. It can be an alias of several indices (items are updated in the
+            concrete index they were read from).
         :param annotationType: document type for annotations (tweets).
         :param annotationName: task name which identifies the annotation task (all items have this name).
         :param numAnnotationsPerItem: number of annotations to be collected for each item.
         :param logger: logger object.
+        :param minUnannotatedItems: minimum size of the queue of unannotated items.
+        :param maxUnannotatedItems: maximum size of the queue of unannotated items.
+        :param maxLeasedItems: maximum number of items held by one annotator at the same time.
+        :param selectionPolicy: SelectionPolicy that orders the partially annotated items (default is
+            FinishPartialsFirstPolicy).
+        :param documentStore: DocumentStore that resolves the documents of items that only reference them (tasks
+            created with a document index). The documents are retrieved when items are loaded, before they are
+            available to annotators.
+        :param numShards: number of shards of the pools of items (see _Shard). Contexts with many concurrent
+            annotators may use several shards, so that annotators do not contend for a single lock.
         """
-        super(AnnotationManager, self).__init__(name="AnnotationManager-%s" % name)
-
         self.name = name
         self.es = esClient
         self.index = index
         self.annotationType = annotationType
         self.annotationName = annotationName
         self.numAnnotationsPerItem = numAnnotationsPerItem
+        self.maxLeasedItems = maxLeasedItems
         self.logger = logger
+        self.documentStore = documentStore
 
-        # Condition variable used to coordinate the producer (the manager thread) and the consumers (request threads).
-        self.__condition = Condition()
+        # Selection policy of the task. It gives the order of the unannotated items (refillSort) and it is the
+        # priority queue of partially annotated items of the first shard (the other shards get empty copies).
+        self.selectionPolicy = selectionPolicy if selectionPolicy is not None else FinishPartialsFirstPolicy()
 
-        # Size of the queue of unannotated items. The producer thread will keep this number of items always available.
-        self.numUnannotatedItems = 100
+        # Pools of items. Each shard has its own lock (condition variable), used to coordinate the producer (the
+        # scheduler thread) and the consumers (request threads).
+        self.shards = [_Shard(i, self.selectionPolicy if i == 0 else self.selectionPolicy.emptyCopy())
+                       for i in xrange(numShards)]
 
-        # List of unannotated items retrieved and, thus, available to be annotated by any annotator.
-        self.unannotatedItems = []
+        # Lock of the refill state below (self.prefetchSizer, self.searchFrom). It may be acquired while holding shard
+        # locks, but never the other way round.
+        self.__refillLock = Lock()
 
-        # List of items which have been annotated by some annotator but has not yet been annotated by the required
-        # number of annotators (self.numAnnotationsPerItem).
-        self.partiallyAnnotatedItems = []
-
-        # This dictionary stores, for each annotator, the item it is holding (the one returned by self.getItem()).
-        self.heldItems = {}
+        # Size of the queue of unannotated items (of all shards). The producer thread tries to keep this number of
+        # items always available. The size is adapted according to the consumption rate and the refill latency.
+        self.prefetchSizer = PrefetchSizer(initialSize=100, minSize=minUnannotatedItems, maxSize=maxUnannotatedItems)
 
         # Number of items already returned within the query for unannotated items since the AnnotationManager started.
         # This index allows to query only new items and it is needed.
         self.searchFrom = 0
 
-        # Flag to indicate whether the AnnotationManager thread is running or not.
+        # Flag to indicate whether the manager is running or not. It is cleared when there is no unannotated item left.
+        self.running = True
+
+        # Flag to indicate whether the partially annotated items were loaded. Annotators wait for them, so that
+        # partially annotated items are always preferred.
+        self.partialsLoaded = False
+
+        # Scheduler that refills the list of unannotated items (set by AnnotationScheduler.register).
+        self.scheduler = None
+
+    def stop(self):
         self.running = False
+        self.__notifyAll()
 
-        # Spawn the AnnotationManager thread. This thread takes care of filling the list of unannotated items.
-        self.start()
+    def loadPartiallyAnnotatedItems(self):
+        """
+        Fill the selection policy queues with all items from Elasticsearch that includes some annotation but
+        not the required number (self.numAnnotationsPerItem). Called by the scheduler when the manager is registered.
+        """
+        items = self.__scanPartiallyAnnotatedItems()
+        if self.documentStore is not None:
+            self.documentStore.resolve(items)
+        for (shard, shardItems) in self.__byShard(items):
+            with self.__locked(shard):
+                for item in shardItems:
+                    # Include one copy of this item for each missing annotation.
+                    required = shard.selectionPolicy.requiredAnnotations(item, self.numAnnotationsPerItem)
+                    shard.selectionPolicy.add(item, required - item.numValidAnnotations)
+        self.partialsLoaded = True
+        self.__notifyAll()
+
+    def refillSize(self):
+        """
+        Return the number of unannotated items to be retrieved by the next refill (0 if no refill is needed).
+        """
+        with self.__refillLock:
+            numUnannotated = self.__numUnannotated()
+            if not self.running or numUnannotated >= self.prefetchSizer.lowWatermark():
+                return 0
+            return self.prefetchSizer.batchSize(numUnannotated)
 
-    def run(self):
+    def refillSearch(self, numItems):
         """
-        Keep self.numUnannotatedItems in the self.unannotatedItems list. This thread is notified by the cosumers
-        every time one item is removed from this list.
-        :return:
+        Return the header and the body of the search for the next numItems unannotated items, in the format of a
+        multi-search request. Only the scheduler thread calls this method and applyRefill, so self.searchFrom is
+        consistent between both calls.
+
+        :param numItems: number of items to retrieve.
+        :return: pair (header, body).
         """
-        self.running = True
-        with self.__condition:
-            self.__fillPartiallyAnnotatedItems()
+        # Search n new items from the previous point (self.searchFrom).
+        # annotations == None and invalid == None
+        header = {
+            "index": self.index,
+            "type": self.annotationType
+        }
+        body = {
+            "from": self.searchFrom,
+            "size": numItems,
+            "query": {
+                "function_score": {
+                    "query": {
+                        "bool": {
+                            "filter": [
+                                {
+                                    "term": {
+                                        "name": self.annotationName
+                                    }
+                                }
+                            ],
+                            "must_not": {
+                                "bool": {
+                                    "should": [
+                                        {
+                                            "exists": {
+                                                "field": "annotations"
+                                            }
+                                        },
+                                        {
+                                            "exists": {
+                                                "field": "invalid"
+                                            }
+                                        }
+                                    ]
+                                }
+                            }
+                        }
+                    },
+                    "random_score": {
+                        "seed": 13
+                    },
+                    "boost_mode": "replace"
+                }
+            }
+        }
 
-            while self.running:
-                lenUn = len(self.unannotatedItems)
-                if lenUn < self.numUnannotatedItems / 2:
-                    self.__fillUnannotatedItems()
+        # The selection policy may define the order of unannotated items (instead of random).
+        sort = self.selectionPolicy.refillSort()
+        if sort is not None:
+            body["query"] = body["query"]["function_score"]["query"]
+            body["sort"] = sort + ["_doc"]
+        return header, body
 
-                    if len(self.unannotatedItems) == 0:
-                        self.running = False
-                        self.__condition.notifyAll()
-                        break
+    def applyRefill(self, hits, latency):
+        """
+        Append the items retrieved by a refill (see refillSearch) to the lists of unannotated items and notify the
+        waiting annotators. If there is no unannotated item left, stop the manager.
 
-                    # Notify consumers if the list was empty.
-                    if lenUn == 0 and len(self.unannotatedItems) > 0:
-                        self.__condition.notifyAll()
+        :param hits: hits returned by the refill search.
+        :param latency: time (in seconds) spent by the refill request.
+        """
+        items = [AnnotatedItem(hit["_id"], hit["_source"], hit.get("_index")) for hit in hits]
+        if self.documentStore is not None:
+            # Out of the lock: annotators are not blocked by the multi-get request.
+            self.documentStore.resolve(items)
 
-                self.__condition.wait()
+        with self.__refillLock:
+            # Register the refill latency, which is used to adapt the queue size.
+            self.prefetchSizer.refilled(latency, len(hits))
 
-    def stop(self):
-        self.running = False
-        with self.__condition:
-            self.__condition.notifyAll()
+            # Update from index.
+            self.searchFrom += len(hits)
+
+        # Append the retrieved items to the lists.
+        for (shard, shardItems) in self.__byShard(items):
+            with self.__locked(shard):
+                shard.unannotatedItems.extend(shardItems)
+
+        if self.__numUnannotated() == 0:
+            self.logger.error("Unavailable items to annotate")
+            self.running = False
+
+        # Notify consumers waiting for items (of any shard, since they can take items from other shards).
+        self.__notifyAll()
+
+    def getPrefetchStats(self):
+        """
+        Return the current sizing of the queue of unannotated items (see PrefetchSizer.getState) including the
+        number of items currently available in the queue.
+
+        :return: dictionary with the prefetch statistics.
+        """
+        with self.__refillLock:
+            stats = self.prefetchSizer.getState()
+            stats["available"] = self.__numUnannotated()
+            return stats
+
+    def getPoolSizes(self):
+        """
+        Return the number of items in each pool of this manager (summed over the shards): unannotated items, partially
+        annotated item copies and items held by annotators.
+
+        :return: dictionary with the pool sizes.
+        """
+        sizes = {"unannotated": 0, "partial": 0, "held": 0}
+        for shard in self.shards:
+            with self.__locked(shard):
+                sizes["unannotated"] += len(shard.unannotatedItems)
+                sizes["partial"] += len(shard.selectionPolicy)
+                sizes["held"] += sum(len(held) for held in shard.heldItems.itervalues())
+        return sizes
 
     def getItem(self, annotatorId):
         """
         Return the item associated with the given annotator (annotatorId) or, in case this annotator is not holding
-        any item, get a new item to be annotated.
+        any item, get a new item to be annotated. If the annotator is holding several items (see leaseItems), the first
+        one is returned.
 
         :param annotatorId:
         :return:
         """
-        with self.__condition:
+        home = self.__homeShard(annotatorId)
+        with self.__locked(home):
             # Check if the annotator is holding some item.
-            if annotatorId in self.heldItems:
-                item = self.heldItems[annotatorId]
+            held = home.heldItems.get(annotatorId)
+            if held:
+                item = held[0]
                 # Update the obtained time for this item.
                 item.holdingAnnotators[annotatorId]["time"] = datetime.now(tz.tzlocal())
                 return item
 
-            return self.__nextItem(annotatorId)
+        return self.__nextItem(annotatorId)
+
+    def leaseItems(self, annotatorId, numItems):
+        """
+        Return a batch of items to be annotated by the given annotator: the items it is already holding plus new items
+        until numItems (bounded by self.maxLeasedItems) items are held. The same item is never leased twice to the
+        same annotator, and each item is leased to at most as many annotators as the number of missing annotations.
+
+        :param annotatorId:
+        :param numItems: number of items to be held by the annotator.
+        :return: list of items held by the annotator (in the order they should be annotated).
+        """
+        return self.__lease(annotatorId, numItems)
 
     def annotate(self, annotatorId, itemId, annotation):
         """
@@ -142,35 +330,61 @@ class AnnotationManager(Thread):
         :param annotation:
         :return: a new associated item for the given annotator.
         """
-        with self.__condition:
+        home = self.__homeShard(annotatorId)
+        with self.__locked(home, self.__shard(itemId)):
             # Check holding dictionaries.
-            if not self.__checkHeldItem(annotatorId, itemId):
-                return self.__nextItem(annotatorId)
+            item = self.__heldItem(home, annotatorId, itemId)
+            if item is not None:
+                self.__registerAnnotation(home, annotatorId, item, annotation)
 
-            # Item held by the given annotator.
-            item = self.heldItems[annotatorId]
+                # Update Elasticsearch.
+                self.es.update(index=item.index or self.index, doc_type=self.annotationType, id=item.id,
+                               body={"doc": item.getSourceToUpdate()})
 
-            # Append the given annotation.
-            item.annotations[annotatorId] = {
-                "annotation": annotation,
-                "time": datetime.now(tz.tzlocal())
-            }
+        # Return a new item.
+        return self.__firstItem(annotatorId)
 
-            # Increment valid annotations count.
-            item.numValidAnnotations += 1
-
-            # Update Elasticsearch.
-            self.es.update(index=self.index, doc_type=self.annotationType, id=item.id,
-                           body={"doc": item.getSourceToUpdate()})
-
-            # Remove annotator from the item's holding dictionary.
-            del item.holdingAnnotators[annotatorId]
+    def annotateBatch(self, annotatorId, annotations, numItems):
+        """
+        Save a batch of annotations (or skips) of the given annotator with one bulk request to Elasticsearch per shard
+        of the annotated items and lease new items to the annotator (see leaseItems).
 
-            # Remove item from the held-items dictionary.
-            del self.heldItems[annotatorId]
+        The annotations of each shard are registered and written with the home shard and that shard locked (at most two
+        shards, like annotate), so a batch does not block the annotators of the other shards during the requests. The
+        write is kept within the lock because each update sends the whole annotation list of the item: updates of the
+        same item must reach Elasticsearch in the order they were registered, otherwise an older list could overwrite
+        a newer one.
 
-            # Return a new item.
-            return self.__nextItem(annotatorId)
+        :param annotatorId:
+        :param annotations: list of pairs (itemId, annotation). The annotation AnnotationManager.SKIP skips the item.
+        :param numItems: number of items to be held by the annotator after saving the annotations.
+        :return: list of items held by the annotator.
+        """
+        home = self.__homeShard(annotatorId)
+        for (shard, shardAnnotations) in self.__byShard(annotations, key=lambda (itemId, _): itemId):
+            with self.__locked(home, shard):
+                actions = []
+                for (itemId, annotation) in shardAnnotations:
+                    # Check holding dictionaries.
+                    item = self.__heldItem(home, annotatorId, itemId)
+                    if item is None:
+                        continue
+
+                    self.__registerAnnotation(home, annotatorId, item, annotation)
+
+                    actions.append({
+                        "_op_type": "update",
+                        "_index": item.index or self.index,
+                        "_type": self.annotationType,
+                        "_id": item.id,
+                        "doc": item.getSourceToUpdate()
+                    })
+
+                # Update Elasticsearch.
+                if len(actions) > 0:
+                    bulk(self.es, actions)
+
+        return self.__lease(annotatorId, numItems)
 
     def invalidate(self, annotatorId, itemId, cause):
         """
@@ -181,33 +395,32 @@ class AnnotationManager(Thread):
         :param cause:
         :return:
         """
-        with self.__condition:
+        home = self.__homeShard(annotatorId)
+        shard = self.__shard(itemId)
+        with self.__locked(home, shard):
             # Check holding dictionaries.
-            if not self.__checkHeldItem(annotatorId, itemId):
-                return self.__nextItem(annotatorId)
-
-            item = self.heldItems[annotatorId]
-            item.invalid = {
-                "annotatorId": annotatorId,
-                "cause": cause,
-                "time": datetime.now(tz.tzlocal())
-            }
+            item = self.__heldItem(home, annotatorId, itemId)
+            if item is not None:
+                item.invalid = {
+                    "annotatorId": annotatorId,
+                    "cause": cause,
+                    "time": datetime.now(tz.tzlocal())
+                }
 
-            # Update Elasticsearch.
-            self.es.update(index=self.index, doc_type=self.annotationType, id=item.id,
-                           body={"doc": item.getSourceToUpdate()})
+                # Update Elasticsearch.
+                self.es.update(index=item.index or self.index, doc_type=self.annotationType, id=item.id,
+                               body={"doc": item.getSourceToUpdate()})
 
-            # Remove annotator from the item's holding dictionary.
-            del item.holdingAnnotators[annotatorId]
+                # Unlink item and annotator.
+                self.__release(home, annotatorId, item)
 
-            # Unlink item and annotator.
-            del self.heldItems[annotatorId]
+                # Remove other occurrences of the invalidated item from the queue of partially annotated items.
+                shard.selectionPolicy.remove(item)
 
-            # Remove other occurrences of the invalidated item from the list of partially annotated items.
-            self.partiallyAnnotatedItems = [i for i in self.partiallyAnnotatedItems if i != item]
+                metrics.annotationsTotal.labels(self.name, "invalidate").inc()
 
-            # Return next item.
-            return self.__nextItem(annotatorId)
+        # Return next item.
+        return self.__firstItem(annotatorId)
 
     def skip(self, annotatorId, itemId):
         """
@@ -217,97 +430,283 @@ class AnnotationManager(Thread):
         :param itemId:
         :return:
         """
-        with self.__condition:
-            # Check holding dictionaries.
-            if not self.__checkHeldItem(annotatorId, itemId):
-                return self.__nextItem(annotatorId)
+        return self.annotate(annotatorId, itemId, self.SKIP)
 
-            item = self.heldItems[annotatorId]
-
-            # Append the given annotation.
-            item.annotations[annotatorId] = {
-                "annotation": "skip",
-                "time": datetime.now(tz.tzlocal())
-            }
+    @contextmanager
+    def __locked(self, *shards):
+        """
+        Acquire the locks of the given shards and record the time spent waiting for them. The locks are always acquired
+        in the order of the shards, so threads that lock two shards (an annotator and an item of different shards) do
+        not deadlock.
+        """
+        if len(shards) > 1:
+            shards = sorted(set(shards), key=lambda shard: shard.index)
+        ident = get_ident()
+        start = time.time()
+        with tracer.span("lock.wait", context=self.name):
+            for shard in shards:
+                # Record the waiting and holding threads (see getLockSnapshot).
+                shard.lockWaiters[ident] = time.time()
+                shard.condition.acquire()
+                del shard.lockWaiters[ident]
+                shard.holder = (ident, time.time())
+        try:
+            metrics.lockWaitSeconds.labels(self.name).observe(time.time() - start)
+            yield
+        finally:
+            for shard in reversed(shards):
+                shard.holder = None
+                shard.condition.release()
+
+    def __wait(self, shard):
+        """
+        Wait on the condition of the given (locked) shard.
+        """
+        ident = get_ident()
+        shard.holder = None
+        shard.conditionWaiters[ident] = time.time()
+        try:
+            shard.condition.wait()
+        finally:
+            del shard.conditionWaiters[ident]
+            shard.holder = (ident, time.time())
+
+    def getLockSnapshot(self):
+        """
+        Return a snapshot of the locks of the shards of this manager: the thread holding each lock, the threads waiting
+        for it and the threads waiting on its condition (for partially annotated items to be loaded or for a refill).
+        Each thread is given by its name and the time (in seconds) it has been holding or waiting. The snapshot is
+        taken without the locks, so it is consistent only per field.
 
-            # Update Elasticsearch.
-            self.es.update(index=self.index, doc_type=self.annotationType, id=item.id,
-                           body={"doc": item.getSourceToUpdate()})
+        :return: list with one dictionary per shard.
+        """
+        now = time.time()
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+
+        def entry(ident, since):
+            return {"thread": names.get(ident, "thread-%d" % ident), "seconds": now - since}
+
+        snapshot = []
+        for shard in self.shards:
+            holder = shard.holder
+            snapshot.append({
+                "shard": shard.index,
+                "holder": entry(*holder) if holder is not None else None,
+                "lockWaiters": [entry(i, s) for (i, s) in shard.lockWaiters.items()],
+                "conditionWaiters": [entry(i, s) for (i, s) in shard.conditionWaiters.items()]
+            })
+        return snapshot
+
+    def __notifyAll(self):
+        for shard in self.shards:
+            with shard.condition:
+                shard.condition.notifyAll()
+
+    def __numUnannotated(self):
+        """
+        Return the number of unannotated items of all shards. The shard locks are not needed (the length of a deque is
+        read atomically), since this number is only used to size the refills.
+        """
+        return sum(len(shard.unannotatedItems) for shard in self.shards)
 
-            # Remove annotator from the item's holding dictionary.
-            del item.holdingAnnotators[annotatorId]
+    def __shard(self, itemId):
+        """
+        Return the shard of the given item.
+        """
+        return self.shards[_shardIndex(itemId, len(self.shards))]
 
-            # Unlink item and annotator.
-            del self.heldItems[annotatorId]
+    def __homeShard(self, annotatorId):
+        """
+        Return the home shard of the given annotator, where the items it holds are recorded and where it looks for new
+        items first.
+        """
+        return self.shards[_shardIndex(annotatorId, len(self.shards))]
 
-            # Include back the skipped item in the list of partially annotated items,
-            # so that some other annotator can pick it later.
-            self.partiallyAnnotatedItems.append(item)
+    def __byShard(self, items, key=lambda item: item.id):
+        """
+        Group the given items by shard (in the order of the shards, keeping the order of the items of each shard).
+        Return a list of pairs (shard, items).
 
-            # Return the next item associated to the given annotator.
-            return self.__nextItem(annotatorId)
+        :param key: function that returns the item id of each element of items.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(_shardIndex(key(item), len(self.shards)), []).append(item)
+        return [(self.shards[i], shardItems) for (i, shardItems) in sorted(groups.iteritems())]
 
-    def __nextItem(self, annotatorId):
+    def __nextItem(self, annotatorId, maxHeld=1):
         """
-        Get a new item to be annotated by the given annotator.
+        Get a new item to be annotated by the given annotator, unless it already holds maxHeld items (taken by
+        concurrent requests of the same annotator), in which case its first held item is returned.
 
-        First, check if there is an item within the self.partiallyAnnotatedItems.
-        If there is not, then get an unannotated item.
+        First, check if there is an item within the selection policy queue of the home shard of the annotator (the best
+        one according to the policy). If there is not, then get an unannotated item of the home shard. When the home
+        shard has no item for the annotator, the other shards are tried in the same way (work stealing). When no shard
+        has unannotated items, wait for the next refill.
 
         :param annotatorId:
+        :param maxHeld: maximum number of items held by the annotator.
         :return:
         """
-        # Look for partially annotated items.
-        for i in xrange(len(self.partiallyAnnotatedItems)):
-            item = self.partiallyAnnotatedItems[i]
-            if annotatorId not in item.annotations:
-                # Signal item that this annotator is holding it.
-                item.holdingAnnotators[annotatorId] = {
-                    "time": datetime.now(tz.tzlocal())
-                }
+        home = self.__homeShard(annotatorId)
 
-                # Store that this annotator is holding the item.
-                self.heldItems[annotatorId] = item
+        # Wait until the partially annotated items are loaded.
+        if not self.partialsLoaded:
+            with self.__locked(home):
+                while not self.partialsLoaded and self.running:
+                    self.__wait(home)
 
-                # Remove this item copy form the list.
-                del self.partiallyAnnotatedItems[i]
+        while True:
+            for shard in self.shards[home.index:] + self.shards[:home.index]:
+                with self.__locked(home, shard):
+                    item = self.__take(home, shard, annotatorId, maxHeld)
+                if item is not None:
+                    return item
 
-                return item
+            if not self.running:
+                break
 
-        # Check if there is some unannotated item available. Otherwise, wait.
-        while len(self.unannotatedItems) == 0 and self.running:
-            self.__condition.wait()
+            # Check if there is some unannotated item available. Otherwise, wait (refills notify all shards).
+            with self.__locked(home):
+                if self.__numUnannotated() == 0 and self.running:
+                    self.__wait(home)
 
-        if self.running:
-            # Get one unannotated item.
-            item = self.unannotatedItems.pop(0)
-            if len(self.unannotatedItems) < self.numUnannotatedItems / 2:
-                # Notify producer thread if the list length is less than half of the required length.
-                self.__condition.notifyAll()
+        # Something odd occurred.
+        self.logger.error("No item could be retrieved for annotator %s" % annotatorId)
+        return None
+
+    def __take(self, home, shard, annotatorId, maxHeld):
+        """
+        Take an item of the given shard for the given annotator, whose home shard is given. Both shards must be locked.
+        If the annotator already holds maxHeld items, no item is taken and its first held item is returned. The held
+        items are checked here, with the home shard locked, since they may have been taken by concurrent requests of
+        the same annotator after the caller checked them.
 
+        :return: the item or None if the shard has no item for the annotator.
+        """
+        held = home.heldItems.get(annotatorId, [])
+        if len(held) >= maxHeld:
+            return held[0]
+
+        # Look for partially annotated items not annotated nor held by the given annotator (the item copy is removed
+        # from the queue).
+        item = shard.selectionPolicy.pop(annotatorId)
+
+        if item is None and len(shard.unannotatedItems) > 0:
+            # Get one unannotated item.
+            item = shard.unannotatedItems.popleft()
+            with self.__refillLock:
+                self.prefetchSizer.consumed()
+                refill = self.__numUnannotated() < self.prefetchSizer.lowWatermark()
+            if refill and self.scheduler is not None:
+                # Notify the scheduler if the list length is less than the low watermark.
+                self.scheduler.wakeUp()
+
+            # Insert copies of the item in the partially annotated queue, so next annotators can get this item.
+            shard.selectionPolicy.add(item, self.numAnnotationsPerItem - 1)
+
+        if item is not None:
             # Signal item that this annotator is holding it.
-            item.holdingAnnotators[annotatorId] = {
-                "time": datetime.now(tz.tzlocal())
-            }
+            self.__hold(home, annotatorId, item)
+        return item
+
+    def __firstItem(self, annotatorId):
+        """
+        Return the first item held by the given annotator or, if it holds no item, a new item.
+        """
+        home = self.__homeShard(annotatorId)
+        with self.__locked(home):
+            held = home.heldItems.get(annotatorId)
+            if held:
+                return held[0]
+        return self.__nextItem(annotatorId)
+
+    def __lease(self, annotatorId, numItems):
+        """
+        Get new items for the given annotator until it holds numItems items (bounded by self.maxLeasedItems).
+        """
+        numItems = min(numItems, self.maxLeasedItems)
+        home = self.__homeShard(annotatorId)
+
+        with self.__locked(home):
+            now = datetime.now(tz.tzlocal())
+            for item in home.heldItems.get(annotatorId, []):
+                # Update the obtained time for the already held items.
+                item.holdingAnnotators[annotatorId]["time"] = now
+            numHeld = len(home.heldItems.get(annotatorId, []))
+
+        while numHeld < numItems:
+            if self.__nextItem(annotatorId, numItems) is None:
+                break
+            # Concurrent requests of the same annotator may also have taken items.
+            with self.__locked(home):
+                numHeld = len(home.heldItems.get(annotatorId, []))
+
+        with self.__locked(home):
+            return list(home.heldItems.get(annotatorId, []))
+
+    def __hold(self, home, annotatorId, item):
+        """
+        Link the given item and annotator (whose home shard is given).
+        """
+        item.holdingAnnotators[annotatorId] = {
+            "time": datetime.now(tz.tzlocal())
+        }
+        home.heldItems.setdefault(annotatorId, []).append(item)
 
-            # Store that this annotator is holding the item.
-            self.heldItems[annotatorId] = item
+    def __release(self, home, annotatorId, item):
+        """
+        Unlink the given item and annotator (whose home shard is given).
+        """
+        # Remove annotator from the item's holding dictionary.
+        item.holdingAnnotators.pop(annotatorId, None)
 
-            # Insert copies of the item in the partially annotated list, so next annotators can get this item.
-            self.partiallyAnnotatedItems += [item] * (self.numAnnotationsPerItem - 1)
+        # Remove item from the held-items dictionary.
+        held = home.heldItems.get(annotatorId, [])
+        if item in held:
+            held.remove(item)
+        if len(held) == 0:
+            home.heldItems.pop(annotatorId, None)
 
-            return item
+    def __registerAnnotation(self, home, annotatorId, item, annotation):
+        """
+        Include the given annotation in the item (in memory) and release the item. A skip (self.SKIP) puts the item back
+        in the queue of partially annotated items, so that some other annotator can pick it later. When the item
+        reaches the required number of annotations, the selection policy may still request extra annotations (e.g.
+        when annotations conflict). The home shard of the annotator and the shard of the item must be locked.
+        """
+        selectionPolicy = self.__shard(item.id).selectionPolicy
 
-        # Something odd occurred.
-        self.logger.error("No item could be retrieved for annotator %s" % annotatorId)
-        return None
+        item.annotations[annotatorId] = {
+            "annotation": annotation,
+            "time": datetime.now(tz.tzlocal())
+        }
+
+        if annotation == self.SKIP:
+            selectionPolicy.add(item)
+            metrics.annotationsTotal.labels(self.name, "skip").inc()
+        else:
+            # Increment valid annotations count.
+            item.numValidAnnotations += 1
+            metrics.annotationsTotal.labels(self.name, "annotate").inc()
+
+            if item.numValidAnnotations == self.numAnnotationsPerItem:
+                # Extra annotations requested by the selection policy.
+                required = selectionPolicy.requiredAnnotations(item, self.numAnnotationsPerItem)
+                selectionPolicy.add(item, required - self.numAnnotationsPerItem)
+            else:
+                # The new annotation may change the priority of the remaining copies.
+                selectionPolicy.update(item)
+
+        self.__release(home, annotatorId, item)
 
-    def __fillPartiallyAnnotatedItems(self):
+    def __scanPartiallyAnnotatedItems(self):
         """
-        Fill the self.partiallyAnnotatedItems list with all items from Elasticsearch that includes some annotation but
-        not the required number (self.numAnnotationsPerItem).
+        Return all items from Elasticsearch that includes some annotation but not the required number
+        (self.numAnnotationsPerItem plus the extra annotations possibly requested by the selection policy).
         """
-        # Query: numValidAnnotations < self.numAnnotationsPerItem and annotations != None and invalid == None
+        # Query: numValidAnnotations < self.numAnnotationsPerItem + maxExtraAnnotations and annotations != None and
+        # invalid == None
         _scan = scan(self.es, index=self.index, doc_type=self.annotationType, query={
             "query": {
                 "bool": {
@@ -320,7 +719,7 @@ class AnnotationManager(Thread):
                         {
                             "range": {
                                 "numValidAnnotations": {
-                                    "lt": self.numAnnotationsPerItem
+                                    "lt": self.numAnnotationsPerItem + self.selectionPolicy.maxExtraAnnotations
                                 }
                             }
                         },
@@ -339,98 +738,78 @@ class AnnotationManager(Thread):
             }
         })
 
-        for res in _scan:
-            item = AnnotatedItem(res["_id"], res["_source"])
-            # Include one copy of this item for each missing annotation.
-            self.partiallyAnnotatedItems += [item] * (self.numAnnotationsPerItem - item.numValidAnnotations)
+        return [AnnotatedItem(res["_id"], res["_source"], res.get("_index")) for res in _scan]
 
-    def __fillUnannotatedItems(self):
+    def __heldItem(self, home, annotatorId, itemId):
         """
-        Fill the list of unannotated items with the next items.
-        These items have not been annotated by any annotator.
+        Return the given item if it is held by the given annotator. That means to verify if the item is associated with
+        the annotator in the heldItems dictionary of its home shard and if the annotator is in the list of holding
+        annotators of the item. Otherwise, return None.
+
+        :param home: home shard of the annotator.
+        :param annotatorId:
+        :param itemId:
+        :return:
         """
-        # Number of unannotated items to retrieve in order to fill the list.
-        n = self.numUnannotatedItems - len(self.unannotatedItems)
+        for item in home.heldItems.get(annotatorId, []):
+            if item.id != itemId:
+                continue
+
+            # Check if the annotator is holding the given item.
+            if annotatorId not in item.holdingAnnotators:
+                self.logger.error(
+                    "Annotator %s tried to annotate item %s but s/he was not holding this item. Getting a new one." % (
+                        annotatorId, itemId))
+                self.__release(home, annotatorId, item)
+                return None
 
-        # Search n new items from the previous point (self.searchFrom).
-        # annotations == None and invalid == None
-        res = self.es.search(index=self.index, doc_type=self.annotationType, body={
-            "from": self.searchFrom,
-            "size": n,
-            "query": {
-                "function_score": {
-                    "query": {
-                        "bool": {
-                            "filter": [
-                                {
-                                    "term": {
-                                        "name": self.annotationName
-                                    }
-                                }
-                            ],
-                            "must_not": {
-                                "bool": {
-                                    "should": [
-                                        {
-                                            "exists": {
-                                                "field": "annotations"
-                                            }
-                                        },
-                                        {
-                                            "exists": {
-                                                "field": "invalid"
-                                            }
-                                        }
-                                    ]
-                                }
-                            }
-                        }
-                    },
-                    "random_score": {
-                        "seed": 13
-                    },
-                    "boost_mode": "replace"
-                }
-            }
-        })
+            return item
 
-        hits = res["hits"]["hits"]
+        self.logger.error(
+            "Annotator %s tried to annotate item %s but s/he was not holding this item. Getting a new one." % (
+                annotatorId, itemId))
+        return None
 
-        # Update from index.
-        self.searchFrom += len(hits)
 
-        # Append the retrieved items to the list.
-        for hit in hits:
-            item = AnnotatedItem(hit["_id"], hit["_source"])
-            self.unannotatedItems.append(item)
+class _Shard(object):
+    """
+    Partition of the pools of an annotation manager, with its own lock (condition variable).
 
-        if len(self.unannotatedItems) == 0:
-            self.logger.error("Unavailable items to annotate")
+    Items belong to the shard given by their id, and each annotator has a home shard given by its id. The unannotated
+    items and the partially annotated items of a shard are its own items, whose state (annotations, holding annotators
+    and copies in the selection policy queue) is protected by the shard lock. The items held by an annotator are
+    recorded in its home shard. Thus, an operation on an item locks at most two shards: the home shard of the annotator
+    and the shard of the item (the same one, unless the item was taken from another shard).
+    """
 
-    def __checkHeldItem(self, annotatorId, itemId):
-        """
-        Check if the given item is held by the given annotator. That means to verify if the annotator is in the list of
-        holding annotators of the item and if the item is associated with the annotator in the self.heldItems
-        dictionary.
+    def __init__(self, index, selectionPolicy):
+        self.index = index
+        self.condition = Condition()
 
-        :param annotatorId:
-        :param itemId:
-        :return:
-        """
-        # Check if the annotator is holding some item.
-        if annotatorId not in self.heldItems:
-            self.logger.error(
-                "Annotator %s tried to annotate item %s but s/he was not holding this item. Getting a new one." % (
-                    annotatorId, itemId))
-            return False
-
-        # Check if the annotator is holding the given item.
-        item = self.heldItems[annotatorId]
-        if annotatorId not in item.holdingAnnotators:
-            self.logger.error(
-                "Annotator %s tried to annotate item %s but s/he was not holding this item. Getting a new one." % (
-                    annotatorId, itemId))
-            del self.heldItems[annotatorId]
-            return False
-
-        return True
+        # Queue of unannotated items retrieved and, thus, available to be annotated by any annotator.
+        self.unannotatedItems = deque()
+
+        # Priority queue of items which have been annotated by some annotator but has not yet been annotated by the
+        # required number of annotators.
+        self.selectionPolicy = selectionPolicy
+
+        # This dictionary stores, for each annotator of this home shard, the list of items it is holding (the first one
+        # is returned by AnnotationManager.getItem()).
+        self.heldItems = {}
+
+        # Thread holding the lock (pair thread ident, time since it holds it) and threads waiting for the lock and on
+        # the condition (time since they wait, by thread ident). Only used for diagnostics (see getLockSnapshot).
+        self.holder = None
+        self.lockWaiters = {}
+        self.conditionWaiters = {}
+
+
+def _shardIndex(key, numShards):
+    """
+    Return the index of the shard of the given key (item or annotator id).
+    """
+    if numShards == 1:
+        return 0
+    if isinstance(key, unicode):
+        key = key.encode("utf-8")
+    return (zlib.crc32(str(key)) & 0xffffffff) % numShards
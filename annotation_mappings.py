@@ -0,0 +1,220 @@
+# coding=utf-8
+"""
+Mappings of the annotation items (and of the near-duplicate records), shared by the task creation scripts and the
+migration tool.
+
+The mappings are lean: only the fields filtered by the annotation manager (name, numValidAnnotations, annotations and
+invalid), the docId and the time of the last update of the items (updated, filtered by the incremental export) are
+indexed. Fields that are only sorted or aggregated (e.g. created, annotations.time, scores)
+keep doc values but are not indexed, and fields that are only returned (e.g. invalid.cause, context.description) are
+kept in _source only. The embedded tweet (doc) is not parsed at all (enabled: false), so new fields of the tweets do not
+grow the mapping, and _all is disabled. Keyword fields have no norms.
+"""
+
+# Mapping of the annotation items.
+ITEM_MAPPING = {
+    "_all": {
+        "enabled": False
+    },
+    "dynamic": False,
+    "dynamic_templates": [
+        {
+            "scores": {
+                "path_match": "scores.*",
+                "mapping": {
+                    "type": "float",
+                    "index": False
+                }
+            }
+        }
+    ],
+    "properties": {
+        "name": {
+            "type": "keyword"
+        },
+        "created": {
+            "type": "date",
+            "index": False
+        },
+        "docId": {
+            "type": "keyword"
+        },
+        "doc": {
+            "type": "object",
+            "enabled": False
+        },
+        "context": {
+            "properties": {
+                "name": {
+                    "type": "keyword",
+                    "index": False
+                },
+                "terms": {
+                    "type": "keyword",
+                    "index": False
+                },
+                "description": {
+                    "type": "keyword",
+                    "index": False,
+                    "doc_values": False
+                }
+            }
+        },
+        "numValidAnnotations": {
+            "type": "integer"
+        },
+        # Time of the last update of the annotations (or of the invalid marker) of the item.
+        "updated": {
+            "type": "date"
+        },
+        "annotations": {
+            "properties": {
+                "annotatorId": {
+                    "type": "keyword"
+                },
+                "annotation": {
+                    "type": "keyword"
+                },
+                "time": {
+                    "type": "date",
+                    "index": False
+                }
+            }
+        },
+        "invalid": {
+            "properties": {
+                "annotatorId": {
+                    "type": "keyword"
+                },
+                "cause": {
+                    "type": "keyword",
+                    "index": False,
+                    "doc_values": False
+                },
+                "time": {
+                    "type": "date",
+                    "index": False
+                }
+            }
+        },
+        # Scores written by offline models (used by selection_policy.UncertaintyFirstPolicy).
+        "scores": {
+            "type": "object",
+            "dynamic": True
+        }
+    }
+}
+
+# Mapping of the near-duplicate records (see near_duplicates.py).
+DUPLICATE_MAPPING = {
+    "_all": {
+        "enabled": False
+    },
+    "dynamic": False,
+    "properties": {
+        "name": {
+            "type": "keyword"
+        },
+        "created": {
+            "type": "date",
+            "index": False
+        },
+        "docId": {
+            "type": "keyword"
+        },
+        "representativeDocId": {
+            "type": "keyword"
+        },
+        "similarity": {
+            "type": "float",
+            "index": False
+        }
+    }
+}
+
+# Mapping of the documents (tweets) shared by annotation items (see document_store.py). Documents are only retrieved by
+# id, so nothing is indexed.
+DOCUMENT_MAPPING = {
+    "_all": {
+        "enabled": False
+    },
+    "dynamic": False,
+    "properties": {
+        "tweet": {
+            "type": "object",
+            "enabled": False
+        }
+    }
+}
+
+# Name of the index template with the mappings above.
+TEMPLATE_NAME = "annotation_items"
+
+
+def putAnnotationTemplate(es, pattern, docType="relevance", duplicateType="duplicate", name=TEMPLATE_NAME):
+    """
+    Create (or replace) the index template that applies the annotation mappings to new indices whose name matches the
+    given pattern (e.g. ctrls_annotation*).
+    """
+    es.indices.put_template(name=name, body={
+        "template": pattern,
+        "mappings": {
+            docType: ITEM_MAPPING,
+            duplicateType: DUPLICATE_MAPPING
+        }
+    })
+
+
+def checkIndexAndType(es, index, docType, mapping=ITEM_MAPPING, settings=None):
+    """
+    Check if the given index and type exist. If the doc type or the index do not exist, create them and the
+    corresponding mappings.
+
+    :param es: Elasticsearch client.
+    :param index:
+    :param docType:
+    :param mapping: mapping of the type (default is the mapping of annotation items).
+    :param settings: optional settings of the index (e.g. {"number_of_shards": 1}), used only if it is created.
+    :return:
+    """
+    if not es.indices.exists(index=index):
+        body = {
+            "mappings": {
+                docType: mapping
+            }
+        }
+        if settings is not None:
+            body["settings"] = settings
+        es.indices.create(index=index, body=body)
+    elif not es.indices.exists_type(index=index, doc_type=docType):
+        es.indices.put_mapping(index=index, doc_type=docType, body=mapping)
+
+    return True
+
+
+def checkUpdatedField(es, index, docType):
+    """
+    Add the updated field to the mapping of the annotation items of an existing index (created before this field was
+    mapped). Items updated before are not found by filtering on this field.
+    """
+    es.indices.put_mapping(index=index, doc_type=docType, body={
+        "properties": {
+            "updated": ITEM_MAPPING["properties"]["updated"]
+        }
+    })
+
+
+def checkDuplicateType(es, index, docType):
+    """
+    Create the mapping of the documents that record near-duplicates (cluster membership) if it does not exist. Each
+    document records that the tweet docId is a near-duplicate of representativeDocId, which is the docId of an
+    annotation item of the task name.
+    """
+    return checkIndexAndType(es, index, docType, mapping=DUPLICATE_MAPPING)
+
+
+def checkDocumentIndex(es, index, docType="tweet"):
+    """
+    Create the index of the shared documents (see document_store.py) and its mapping if they do not exist.
+    """
+    return checkIndexAndType(es, index, docType, mapping=DOCUMENT_MAPPING)
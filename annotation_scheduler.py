@@ -0,0 +1,148 @@
+# coding=utf-8
+import time
+from threading import Thread, Condition
+
+from tracing import tracer
+
+
+class AnnotationScheduler(Thread):
+    """
+    Single producer thread shared by all annotation managers of the application. In each cycle, the scheduler asks
+    every registered manager how many unannotated items it needs (AnnotationManager.refillSize) and refills all of them
+    with one multi-search (msearch) request, whose responses are dispatched back to the managers
+    (AnnotationManager.applyRefill).
+
+    The scheduler sleeps until some manager needs items (AnnotationManager calls wakeUp when its list of unannotated
+    items falls below the low watermark) or until the polling interval elapses. When a manager is registered, the
+    scheduler also loads its partially annotated items (retried in the next cycles if it fails; the manager is not
+    refilled meanwhile). Errors are handled per manager, so a failing context does not block the others.
+    """
+
+    def __init__(self, esClient, logger, interval=1.0):
+        """
+        Create a new scheduler and spawn its thread.
+
+        :param esClient: Elasticsearch client.
+        :param logger: logger object.
+        :param interval: maximum time (in seconds) between two cycles.
+        """
+        super(AnnotationScheduler, self).__init__(name="AnnotationScheduler")
+        self.daemon = True
+
+        self.es = esClient
+        self.logger = logger
+        self.interval = interval
+
+        self.__condition = Condition()
+
+        # Registered managers.
+        self.managers = []
+
+        # Managers whose partially annotated items were not loaded yet.
+        self.__newManagers = []
+
+        # Whether some manager requested a refill since the last cycle.
+        self.__pending = False
+
+        self.running = True
+
+        self.start()
+
+    def register(self, manager):
+        """
+        Register the given manager. Its lists will be filled in the next cycle.
+        """
+        with self.__condition:
+            manager.scheduler = self
+            self.managers.append(manager)
+            self.__newManagers.append(manager)
+            self.__pending = True
+            self.__condition.notifyAll()
+
+    def wakeUp(self):
+        """
+        Request a new cycle as soon as possible.
+        """
+        with self.__condition:
+            self.__pending = True
+            self.__condition.notifyAll()
+
+    def stop(self):
+        with self.__condition:
+            self.running = False
+            self.__condition.notifyAll()
+        for manager in self.managers:
+            manager.stop()
+        self.join()
+
+    def run(self):
+        while True:
+            with self.__condition:
+                if not self.__pending and self.running:
+                    self.__condition.wait(self.interval)
+                if not self.running:
+                    break
+                self.__pending = False
+                newManagers = self.__newManagers
+                self.__newManagers = []
+                managers = list(self.managers)
+
+            failed = []
+            for manager in newManagers:
+                try:
+                    with tracer.trace("loadPartiallyAnnotatedItems %s" % manager.name):
+                        manager.loadPartiallyAnnotatedItems()
+                except Exception:
+                    self.logger.exception("Error loading the partially annotated items of annotation manager %s" %
+                                          manager.name)
+                    failed.append(manager)
+
+            if len(failed) > 0:
+                # Retry in the next cycles. Their refills wait, so partially annotated items are still preferred.
+                with self.__condition:
+                    self.__newManagers = failed + self.__newManagers
+                managers = [manager for manager in managers if manager not in failed]
+
+            refillFailed = False
+            try:
+                with tracer.trace("refill"):
+                    self.refill(managers)
+            except Exception:
+                self.logger.exception("Error refilling annotation managers")
+                refillFailed = True
+
+            if len(failed) > 0 or refillFailed:
+                # Avoid a busy loop when Elasticsearch is unavailable.
+                time.sleep(self.interval)
+
+    def refill(self, managers):
+        """
+        Refill the lists of unannotated items of the given managers with one multi-search request.
+        """
+        requests = []
+        body = []
+        for manager in managers:
+            try:
+                numItems = manager.refillSize()
+                if numItems > 0:
+                    header, search = manager.refillSearch(numItems)
+                    body += [header, search]
+                    requests.append(manager)
+            except Exception:
+                self.logger.exception("Error preparing the refill of annotation manager %s" % manager.name)
+
+        if len(requests) == 0:
+            return
+
+        start = time.time()
+        res = self.es.msearch(body=body)
+        latency = time.time() - start
+
+        for (manager, response) in zip(requests, res["responses"]):
+            if "error" in response:
+                self.logger.error("Refill of annotation manager %s failed: %s" % (manager.name, response["error"]))
+                continue
+            try:
+                manager.applyRefill(response["hits"]["hits"], latency)
+            except Exception:
+                self.logger.exception("Error applying the refill of annotation manager %s" % manager.name)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks of AnnotationManager scheduling (getItem, annotate, skip and invalidate) with a fake Elasticsearch.
+With --batch, the annotators lease batches of items and save them with annotateBatch instead (as the batch API does).
+
+Every combination of the given pool sizes, annotations per item, numbers of annotators and numbers of shards is run
+with a fresh manager. For each run, the benchmark reports the throughput (ops/s), latency percentiles per operation
+and the lock contention (mean and total time waiting for the manager locks, as measured by the
+annotation_lock_wait_seconds metric).
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_manager --pool-sizes 1000,10000 --annotations-per-item 1,3 --annotators 1,8,32 \\
+        --shards 1,4
+
+In batch mode, the "get" columns report leaseItems and the "ann" columns report annotateBatch (ops/s counts the
+manager calls, so a whole batch is one op).
+"""
+import argparse
+import logging
+import random
+import sys
+import time
+from threading import Thread
+
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.harness import populateTask, percentile, ANNOTATION_INDEX, ANNOTATION_TYPE
+
+import metrics
+from annotation_manager import AnnotationManager
+from annotation_scheduler import AnnotationScheduler
+
+
+def _intList(value):
+    return [int(v) for v in value.split(",")]
+
+
+class BenchmarkAnnotator(Thread):
+    """
+    Annotator that gets items and annotates, skips or invalidates them as fast as possible. With batchSize > 0, it
+    leases batches of items and annotates or skips them with annotateBatch (items are not invalidated in this mode).
+    """
+
+    def __init__(self, annotatorId, manager, numOps, skipRatio, invalidateRatio, seed, batchSize=0):
+        super(BenchmarkAnnotator, self).__init__(name="BenchmarkAnnotator-%s" % annotatorId)
+        self.annotatorId = annotatorId
+        self.manager = manager
+        self.numOps = numOps
+        self.skipRatio = skipRatio
+        self.invalidateRatio = invalidateRatio
+        self.rand = random.Random(seed)
+        self.batchSize = batchSize
+        self.latencies = {"getItem": [], "annotate": [], "skip": [], "invalidate": []}
+
+    def run(self):
+        if self.batchSize > 0:
+            self.runBatches()
+            return
+
+        manager = self.manager
+        for _ in xrange(self.numOps):
+            start = time.time()
+            item = manager.getItem(self.annotatorId)
+            self.latencies["getItem"].append(time.time() - start)
+            if item is None:
+                break
+
+            r = self.rand.random()
+            start = time.time()
+            if r < self.invalidateRatio:
+                manager.invalidate(self.annotatorId, item.id, "benchmark")
+                op = "invalidate"
+            elif r < self.invalidateRatio + self.skipRatio:
+                manager.skip(self.annotatorId, item.id)
+                op = "skip"
+            else:
+                manager.annotate(self.annotatorId, item.id, self.rand.choice(["Sim", "Nao"]))
+                op = "annotate"
+            self.latencies[op].append(time.time() - start)
+
+    def runBatches(self):
+        manager = self.manager
+        start = time.time()
+        items = manager.leaseItems(self.annotatorId, self.batchSize)
+        self.latencies["getItem"].append(time.time() - start)
+
+        numItems = 0
+        while len(items) > 0 and numItems < self.numOps:
+            annotations = []
+            for item in items[:self.numOps - numItems]:
+                if self.rand.random() < self.skipRatio:
+                    annotations.append((item.id, AnnotationManager.SKIP))
+                else:
+                    annotations.append((item.id, self.rand.choice(["Sim", "Nao"])))
+            numItems += len(annotations)
+
+            start = time.time()
+            items = manager.annotateBatch(self.annotatorId, annotations,
+                                          self.batchSize if numItems < self.numOps else 0)
+            self.latencies["annotate"].append(time.time() - start)
+
+
+def runBenchmark(poolSize, numAnnotationsPerItem, numAnnotators, numOps, skipRatio, invalidateRatio, esLatency,
+                 seed, logger, numShards=1, batchSize=0):
+    """
+    Run one benchmark configuration and return a dictionary with its results.
+    """
+    name = "bench-%d-%d-%d-%d" % (poolSize, numAnnotationsPerItem, numAnnotators, numShards)
+    es = FakeElasticsearch()
+    populateTask(es, name, poolSize, seed=seed)
+    es.latency = esLatency
+
+    manager = AnnotationManager(name=name, esClient=es, index=ANNOTATION_INDEX, annotationType=ANNOTATION_TYPE,
+                                annotationName=name, numAnnotationsPerItem=numAnnotationsPerItem, logger=logger,
+                                numShards=numShards)
+    scheduler = AnnotationScheduler(esClient=es, logger=logger)
+    scheduler.register(manager)
+
+    # Wait for the first refill.
+    while manager.getPoolSizes()["unannotated"] == 0:
+        time.sleep(0.01)
+
+    annotators = [BenchmarkAnnotator("annotator%d" % i, manager, numOps, skipRatio, invalidateRatio, seed + i,
+                                     batchSize)
+                  for i in xrange(numAnnotators)]
+    start = time.time()
+    for annotator in annotators:
+        annotator.start()
+    for annotator in annotators:
+        annotator.join()
+    elapsed = time.time() - start
+    scheduler.stop()
+
+    latencies = {}
+    for op in ("getItem", "annotate", "skip", "invalidate"):
+        latencies[op] = sorted(l for a in annotators for l in a.latencies[op])
+
+    lockWait = metrics.lockWaitSeconds.labels(name)
+    numOpsDone = sum(len(l) for l in latencies.itervalues())
+    return {
+        "elapsed": elapsed,
+        "ops": numOpsDone,
+        "opsPerSec": numOpsDone / elapsed,
+        "latencies": latencies,
+        "lockWaitMean": lockWait.sum / lockWait.count if lockWait.count > 0 else 0.0,
+        "lockWaitTotal": lockWait.sum
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of AnnotationManager scheduling.")
+    parser.add_argument("--pool-sizes", type=_intList, default=[1000, 10000], help="comma-separated numbers of items")
+    parser.add_argument("--annotations-per-item", type=_intList, default=[1, 3],
+                        help="comma-separated numbers of annotations per item")
+    parser.add_argument("--annotators", type=_intList, default=[1, 8, 32],
+                        help="comma-separated numbers of concurrent annotators")
+    parser.add_argument("--shards", type=_intList, default=[1],
+                        help="comma-separated numbers of shards of the manager pools")
+    parser.add_argument("--ops", type=int, default=200, help="number of items handled by each annotator")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="lease and annotate batches of this size (0 handles one item at a time)")
+    parser.add_argument("--skip-ratio", type=float, default=0.1, help="fraction of items skipped")
+    parser.add_argument("--invalidate-ratio", type=float, default=0.02, help="fraction of items invalidated")
+    parser.add_argument("--es-latency", type=float, default=0.0, help="latency (in seconds) of each ES call")
+    parser.add_argument("--seed", type=int, default=13, help="random seed")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench_manager")
+    logger.addHandler(logging.NullHandler())
+
+    out = sys.stdout
+    out.write("%8s %5s %5s %6s %9s %10s %10s %10s %10s %12s %12s\n" % (
+        "pool", "k", "ann", "shards", "ops/s", "get p50", "get p99", "ann p50", "ann p99", "lock mean", "lock total"))
+    for poolSize in args.pool_sizes:
+        for numAnnotationsPerItem in args.annotations_per_item:
+            for numAnnotators in args.annotators:
+                for numShards in args.shards:
+                    res = runBenchmark(poolSize, numAnnotationsPerItem, numAnnotators, args.ops, args.skip_ratio,
+                                       args.invalidate_ratio, args.es_latency, args.seed, logger, numShards,
+                                       args.batch)
+                    lat = res["latencies"]
+                    out.write("%8d %5d %5d %6d %9.0f %9.3fms %9.3fms %9.3fms %9.3fms %10.3fms %11.3fs\n" % (
+                        poolSize, numAnnotationsPerItem, numAnnotators, numShards, res["opsPerSec"],
+                        percentile(lat["getItem"], 50) * 1000, percentile(lat["getItem"], 99) * 1000,
+                        percentile(lat["annotate"], 50) * 1000, percentile(lat["annotate"], 99) * 1000,
+                        res["lockWaitMean"] * 1000, res["lockWaitTotal"]))
+                    out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,679 @@
+# coding=utf-8
+import hashlib
+import calendar
+import fnmatch
+import json
+import time
+from collections import OrderedDict, Counter
+from threading import RLock
+from uuid import uuid4
+
+from dateutil import parser as dateParser
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch.serializer import JSONSerializer
+
+
+class FakeElasticsearch(object):
+    """
+    In-process stand-in for the Elasticsearch client. It implements the subset of the client API used by this project
+    (search, msearch, scroll, clear_scroll, update, get, index and bulk, the aggregations used by the statistics, plus
+    the indices calls used to manage indices, mappings, templates, settings and aliases) over plain dictionaries, so
+    the web app, the annotation manager and the ingest tools can be benchmarked offline.
+
+    Documents are serialized with the same serializer of the real client, so values stored and returned have the same
+    types (e.g. dates become strings). An optional latency (in seconds) is added to every call to mimic the network
+    round trip to a real cluster.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        :param latency: time (in seconds) added to every call.
+        """
+        self.latency = latency
+        self.transport = _FakeTransport()
+        self.indices = _FakeIndicesClient(self)
+
+        self._lock = RLock()
+
+        # Documents by index. Each index is an ordered dictionary from id to a pair (docType, source).
+        self._docs = {}
+
+        # Mappings by index and document type.
+        self._mappings = {}
+
+        # Index templates by name.
+        self._templates = {}
+
+        # Settings by index and sets of indices by alias.
+        self._settings = {}
+        self._aliases = {}
+
+        # Open scroll contexts: remaining hits and page size for each scroll id.
+        self._scrolls = {}
+
+    #
+    # Document APIs.
+    #
+
+    def index(self, index, doc_type, body, id=None, params=None, **kwargs):
+        self._sleep()
+        with self._lock:
+            docs = self._createIndex(self._concreteIndex(index))
+            if id is None:
+                id = _newId()
+            created = id not in docs
+            docs[id] = (doc_type, self._copy(body))
+            return {"_index": index, "_type": doc_type, "_id": id, "created": created,
+                    "result": "created" if created else "updated"}
+
+    def get(self, index, id, doc_type=None, ignore=(), params=None, **kwargs):
+        self._sleep()
+        with self._lock:
+            entry = self._docs.get(self._concreteIndex(index), {}).get(id)
+            if entry is None or (doc_type is not None and entry[0] != doc_type):
+                if _ignored(404, ignore):
+                    return {"_index": index, "_type": doc_type, "_id": id, "found": False}
+                raise NotFoundError(404, "document_missing_exception", {"_id": id})
+            return {"_index": index, "_type": entry[0], "_id": id, "found": True, "_source": self._copy(entry[1])}
+
+    def mget(self, body, index=None, doc_type=None, params=None, **kwargs):
+        self._sleep()
+        specs = body.get("docs") or [{"_id": id} for id in body["ids"]]
+        docs = []
+        with self._lock:
+            for spec in specs:
+                _index = spec.get("_index", index)
+                _type = spec.get("_type", doc_type)
+                entry = self._docs.get(self._concreteIndex(_index), {}).get(spec["_id"])
+                if entry is None or (_type is not None and entry[0] != _type):
+                    docs.append({"_index": _index, "_type": _type, "_id": spec["_id"], "found": False})
+                else:
+                    docs.append({"_index": _index, "_type": entry[0], "_id": spec["_id"], "found": True,
+                                 "_source": self._copy(entry[1])})
+        return {"docs": docs}
+
+    def update(self, index, doc_type, id, body, params=None, **kwargs):
+        self._sleep()
+        with self._lock:
+            docs = self._docs.get(self._concreteIndex(index), {})
+            if id not in docs:
+                raise NotFoundError(404, "document_missing_exception", {"_id": id})
+            source = docs[id][1]
+            _merge(source, self._copy(body["doc"]))
+            return {"_index": index, "_type": doc_type, "_id": id, "result": "updated"}
+
+    def bulk(self, body, index=None, doc_type=None, params=None, **kwargs):
+        self._sleep()
+        lines = [l for l in body.split("\n") if len(l.strip()) > 0]
+        items = []
+        with self._lock:
+            i = 0
+            while i < len(lines):
+                action = json.loads(lines[i])
+                (opType, meta) = action.items()[0]
+                _index = self._concreteIndex(meta.get("_index", index))
+                _type = meta.get("_type", doc_type)
+                _id = meta.get("_id")
+                i += 1
+                if opType == "delete":
+                    self._docs.get(_index, {}).pop(_id, None)
+                    items.append({opType: {"_index": _index, "_type": _type, "_id": _id, "status": 200}})
+                    continue
+
+                data = json.loads(lines[i])
+                i += 1
+                docs = self._createIndex(_index)
+                if opType in ("index", "create"):
+                    if _id is None:
+                        _id = _newId()
+                    docs[_id] = (_type, data)
+                    items.append({opType: {"_index": _index, "_type": _type, "_id": _id, "status": 201}})
+                elif opType == "update":
+                    if _id not in docs:
+                        items.append({opType: {"_index": _index, "_type": _type, "_id": _id, "status": 404,
+                                               "error": "document_missing_exception"}})
+                    else:
+                        _merge(docs[_id][1], data["doc"])
+                        items.append({opType: {"_index": _index, "_type": _type, "_id": _id, "status": 200}})
+        return {"took": 0, "errors": any(v["status"] >= 300 for it in items for v in it.values()), "items": items}
+
+    #
+    # Search APIs.
+    #
+
+    def search(self, index=None, doc_type=None, body=None, scroll=None, size=None, params=None, **kwargs):
+        self._sleep()
+        return self._searchResponse(index, doc_type, body, scroll, size)
+
+    def msearch(self, body, index=None, doc_type=None, params=None, **kwargs):
+        # One round trip for the whole request.
+        self._sleep()
+        if isinstance(body, basestring):
+            body = [json.loads(l) for l in body.split("\n") if len(l.strip()) > 0]
+        responses = []
+        for i in xrange(0, len(body), 2):
+            (header, search) = (body[i], body[i + 1])
+            try:
+                responses.append(self._searchResponse(header.get("index", index), header.get("type", doc_type),
+                                                      search))
+            except Exception as e:
+                responses.append({"error": {"type": type(e).__name__, "reason": str(e)}})
+        return {"responses": responses}
+
+    def _searchResponse(self, index, doc_type, body, scroll=None, size=None):
+        body = body or {}
+        with self._lock:
+            hits = self._search(index, doc_type, body.get("query"), body.get("sort"))
+
+        total = len(hits)
+        if size is None:
+            size = body.get("size", 10)
+
+        if scroll is not None:
+            scrollId = _newId()
+            with self._lock:
+                self._scrolls[scrollId] = (hits[size:], size)
+            return self._response(hits[:size], total, scrollId)
+
+        _from = body.get("from", 0)
+        resp = self._response(hits[_from:_from + size], total)
+        aggs = body.get("aggs", body.get("aggregations"))
+        if aggs is not None:
+            with self._lock:
+                resp["aggregations"] = _aggregate(aggs, hits)
+        return resp
+
+    def scroll(self, scroll_id=None, body=None, scroll=None, params=None, **kwargs):
+        self._sleep()
+        if scroll_id is None:
+            scroll_id = body["scroll_id"]
+        with self._lock:
+            if scroll_id not in self._scrolls:
+                raise NotFoundError(404, "search_context_missing_exception", {"scroll_id": scroll_id})
+            (hits, size) = self._scrolls[scroll_id]
+            self._scrolls[scroll_id] = (hits[size:], size)
+        return self._response(hits[:size], len(hits), scroll_id)
+
+    def clear_scroll(self, scroll_id=None, body=None, params=None, **kwargs):
+        self._sleep()
+        scrollIds = [scroll_id] if scroll_id is not None else body["scroll_id"]
+        with self._lock:
+            for _id in scrollIds:
+                self._scrolls.pop(_id, None)
+        return {"succeeded": True}
+
+    #
+    # Internal helpers (also used by _FakeIndicesClient).
+    #
+
+    def _sleep(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _copy(self, source):
+        serializer = self.transport.serializer
+        return serializer.loads(serializer.dumps(source))
+
+    def _createIndex(self, index):
+        if index not in self._docs:
+            self._docs[index] = OrderedDict()
+            self._mappings[index] = {}
+            self._settings[index] = {"number_of_shards": "5", "number_of_replicas": "1"}
+            # Apply the mappings of the matching templates.
+            for template in self._templates.itervalues():
+                if fnmatch.fnmatch(index, template["template"]):
+                    for (docType, mapping) in template.get("mappings", {}).iteritems():
+                        _merge(self._mappings[index].setdefault(docType, {}), self._copy(mapping))
+        return self._docs[index]
+
+    def _resolveIndices(self, index):
+        """
+        Return the concrete indices of the given index names, aliases or wildcard patterns.
+        """
+        if index is None or index == "_all":
+            return self._docs.keys()
+        if isinstance(index, basestring):
+            index = index.split(",")
+        indices = []
+        for name in index:
+            if name in self._aliases:
+                names = sorted(self._aliases[name])
+            else:
+                names = sorted(i for i in self._docs if fnmatch.fnmatch(i, name))
+            indices += [i for i in names if i in self._docs and i not in indices]
+        return indices
+
+    def _concreteIndex(self, index):
+        """
+        Return the concrete index of the given index or alias. Like Elasticsearch, writing to an alias of several
+        indices is not allowed.
+        """
+        if index not in self._aliases:
+            return index
+        if len(self._aliases[index]) != 1:
+            raise ValueError("Alias [%s] has more than one index associated with it, can't execute a single index op" %
+                             index)
+        return iter(self._aliases[index]).next()
+
+    def _search(self, index, docType, query, sort=None):
+        """
+        Return the list of hits matching the given query, sorted by score or by the given sort clause (only numeric
+        fields, _score and _doc are supported).
+        """
+        if isinstance(docType, basestring):
+            docType = docType.split(",")
+
+        hits = []
+        for _index in self._resolveIndices(index):
+            for (_id, (_type, source)) in self._docs[_index].iteritems():
+                if docType is not None and _type not in docType:
+                    continue
+                score = _score(query, _id, source)
+                if score is not None:
+                    hits.append({"_index": _index, "_type": _type, "_id": _id, "_score": score, "_source": source})
+
+        # Stable sort: documents with the same score keep the insertion order.
+        if sort is None:
+            hits.sort(key=lambda h: -h["_score"])
+            return hits
+
+        # Apply the sort clauses from the last to the first one (each sort is stable).
+        for clause in reversed(_asList(sort)):
+            if isinstance(clause, basestring):
+                (field, spec) = (clause, {})
+            else:
+                (field, spec) = clause.items()[0]
+                if isinstance(spec, basestring):
+                    spec = {"order": spec}
+            if field == "_doc":
+                continue
+            reverse = spec.get("order", "desc" if field == "_score" else "asc") == "desc"
+            if field == "_score":
+                hits.sort(key=lambda h: h["_score"], reverse=reverse)
+                continue
+            missingFirst = spec.get("missing", "_last") == "_first"
+            present = [h for h in hits if len(_values(h["_source"], field)) > 0]
+            missing = [h for h in hits if len(_values(h["_source"], field)) == 0]
+            present.sort(key=lambda h: (max if reverse else min)(_values(h["_source"], field)), reverse=reverse)
+            hits = missing + present if missingFirst else present + missing
+        return hits
+
+    def _response(self, hits, total, scrollId=None):
+        resp = {
+            "took": 0,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "failed": 0},
+            "hits": {
+                "total": total,
+                "max_score": hits[0]["_score"] if len(hits) > 0 else None,
+                "hits": [dict(h, _source=self._copy(h["_source"])) for h in hits]
+            }
+        }
+        if scrollId is not None:
+            resp["_scroll_id"] = scrollId
+        return resp
+
+
+class _FakeIndicesClient:
+    """
+    Subset of elasticsearch.client.IndicesClient backed by a FakeElasticsearch.
+    """
+
+    def __init__(self, es):
+        self.es = es
+
+    def exists(self, index, params=None, **kwargs):
+        with self.es._lock:
+            return len(self.es._resolveIndices(index)) > 0
+
+    def create(self, index, body=None, params=None, **kwargs):
+        with self.es._lock:
+            self.es._createIndex(index)
+            if body is not None:
+                for (docType, mapping) in body.get("mappings", {}).iteritems():
+                    self.put_mapping(docType, mapping, index=index)
+                for (k, v) in body.get("settings", {}).get("index", body.get("settings", {})).iteritems():
+                    self.es._settings[index][k] = str(v)
+        return {"acknowledged": True}
+
+    def delete(self, index, params=None, **kwargs):
+        with self.es._lock:
+            for _index in self.es._resolveIndices(index):
+                del self.es._docs[_index]
+                del self.es._mappings[_index]
+                del self.es._settings[_index]
+                for indices in self.es._aliases.itervalues():
+                    indices.discard(_index)
+        return {"acknowledged": True}
+
+    def get_settings(self, index=None, name=None, params=None, **kwargs):
+        with self.es._lock:
+            return dict((i, {"settings": {"index": dict(self.es._settings[i])}})
+                        for i in self.es._resolveIndices(index))
+
+    def put_settings(self, body, index=None, params=None, **kwargs):
+        with self.es._lock:
+            for _index in self.es._resolveIndices(index):
+                for (k, v) in body.get("index", body).iteritems():
+                    if v is None:
+                        self.es._settings[_index].pop(k, None)
+                    else:
+                        self.es._settings[_index][k] = str(v)
+        return {"acknowledged": True}
+
+    def forcemerge(self, index=None, params=None, **kwargs):
+        return {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+    def update_aliases(self, body, params=None, **kwargs):
+        with self.es._lock:
+            for action in body["actions"]:
+                ((kind, spec),) = action.items()
+                indices = self.es._aliases.setdefault(spec["alias"], set())
+                if kind == "add":
+                    if spec["index"] not in self.es._docs:
+                        raise NotFoundError(404, "index_not_found_exception", {"index": spec["index"]})
+                    indices.add(spec["index"])
+                elif kind == "remove":
+                    indices.discard(spec["index"])
+                if len(indices) == 0:
+                    del self.es._aliases[spec["alias"]]
+        return {"acknowledged": True}
+
+    def exists_alias(self, index=None, name=None, params=None, **kwargs):
+        with self.es._lock:
+            return name in self.es._aliases
+
+    def get_alias(self, index=None, name=None, params=None, **kwargs):
+        with self.es._lock:
+            result = {}
+            for (alias, indices) in self.es._aliases.iteritems():
+                if name is not None and alias != name:
+                    continue
+                for i in indices:
+                    result.setdefault(i, {"aliases": {}})["aliases"][alias] = {}
+            return result
+
+    def exists_type(self, index, doc_type, params=None, **kwargs):
+        with self.es._lock:
+            return any(doc_type in self.es._mappings[i] for i in self.es._resolveIndices(index))
+
+    def put_mapping(self, doc_type, body, index=None, params=None, **kwargs):
+        with self.es._lock:
+            for _index in self.es._resolveIndices(index):
+                mapping = self.es._mappings[_index].setdefault(doc_type, {})
+                _merge(mapping, self.es._copy(body))
+        return {"acknowledged": True}
+
+    def get_mapping(self, index=None, doc_type=None, params=None, **kwargs):
+        with self.es._lock:
+            result = {}
+            for _index in self.es._resolveIndices(index):
+                mappings = dict((t, m) for (t, m) in self.es._mappings[_index].iteritems()
+                                if doc_type is None or t == doc_type)
+                result[_index] = {"mappings": self.es._copy(mappings)}
+            return result
+
+    def refresh(self, index=None, params=None, **kwargs):
+        return {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+    def put_template(self, name, body, params=None, **kwargs):
+        with self.es._lock:
+            self.es._templates[name] = self.es._copy(body)
+        return {"acknowledged": True}
+
+    def exists_template(self, name, params=None, **kwargs):
+        with self.es._lock:
+            return name in self.es._templates
+
+    def get_template(self, name=None, params=None, **kwargs):
+        with self.es._lock:
+            return dict((n, self.es._copy(t)) for (n, t) in self.es._templates.iteritems() if name in (None, n))
+
+    def stats(self, index=None, metric=None, params=None, **kwargs):
+        """
+        Return the number of documents and an estimate of the store size of the given indices: the size of the
+        sources plus the size of the values of indexed fields (all fields when the type mapping is dynamic, only the
+        indexed or doc-valued fields of the mapping otherwise).
+        """
+        with self.es._lock:
+            indices = {}
+            for _index in self.es._resolveIndices(index):
+                size = 0
+                for (docType, source) in self.es._docs[_index].itervalues():
+                    size += len(json.dumps(source)) + _indexedSize(source, self.es._mappings[_index].get(docType, {}))
+                stats = {
+                    "docs": {"count": len(self.es._docs[_index]), "deleted": 0},
+                    "store": {"size_in_bytes": size}
+                }
+                indices[_index] = {"primaries": stats, "total": stats}
+            return {"indices": indices}
+
+
+class _FakeTransport:
+    """
+    Fake transport providing the serializer used by elasticsearch.helpers.
+    """
+
+    def __init__(self):
+        self.serializer = JSONSerializer()
+
+
+def _newId():
+    return uuid4().hex
+
+
+def _ignored(status, ignore):
+    if isinstance(ignore, int):
+        ignore = (ignore,)
+    return status in ignore
+
+
+def _merge(target, source):
+    """
+    Merge the source dictionary into the target dictionary (like partial updates in Elasticsearch).
+    """
+    for (k, v) in source.iteritems():
+        if isinstance(v, dict) and isinstance(target.get(k), dict):
+            _merge(target[k], v)
+        else:
+            target[k] = v
+
+
+def _values(source, field):
+    """
+    Return the list of values of the given field (dotted path) within the source. Arrays are flattened like in
+    Elasticsearch.
+    """
+    values = [source]
+    for name in field.split("."):
+        nextValues = []
+        for v in values:
+            if isinstance(v, dict) and name in v:
+                v = v[name]
+                if isinstance(v, list):
+                    nextValues += v
+                else:
+                    nextValues.append(v)
+        values = nextValues
+    return [v for v in values if v is not None]
+
+
+def _inRange(value, spec):
+    if "gt" in spec and not value > spec["gt"]:
+        return False
+    if "gte" in spec and not value >= spec["gte"]:
+        return False
+    if "lt" in spec and not value < spec["lt"]:
+        return False
+    if "lte" in spec and not value <= spec["lte"]:
+        return False
+    return True
+
+
+def _asList(clauses):
+    if clauses is None:
+        return []
+    if isinstance(clauses, dict):
+        return [clauses]
+    return clauses
+
+
+def _score(query, _id, source):
+    """
+    Return the score of the document for the given query or None if the document does not match it. Supports the
+    queries used in this project: match_all, bool, term, terms, range, exists, ids and function_score (random_score).
+    """
+    if query is None:
+        return 1.0
+
+    (kind, spec) = query.items()[0]
+
+    if kind == "match_all":
+        return 1.0
+
+    if kind == "term":
+        (field, value) = spec.items()[0]
+        if isinstance(value, dict):
+            value = value["value"]
+        return 1.0 if value in _values(source, field) else None
+
+    if kind == "terms":
+        (field, values) = spec.items()[0]
+        return 1.0 if any(v in values for v in _values(source, field)) else None
+
+    if kind == "range":
+        (field, rangeSpec) = spec.items()[0]
+        return 1.0 if any(_inRange(v, rangeSpec) for v in _values(source, field)) else None
+
+    if kind == "exists":
+        return 1.0 if len(_values(source, spec["field"])) > 0 else None
+
+    if kind == "ids":
+        return 1.0 if _id in spec["values"] else None
+
+    if kind == "bool":
+        score = 0.0
+        for clause in _asList(spec.get("filter")):
+            if _score(clause, _id, source) is None:
+                return None
+        for clause in _asList(spec.get("must")):
+            s = _score(clause, _id, source)
+            if s is None:
+                return None
+            score += s
+        for clause in _asList(spec.get("must_not")):
+            if _score(clause, _id, source) is not None:
+                return None
+        should = _asList(spec.get("should"))
+        if len(should) > 0:
+            matched = [s for s in (_score(c, _id, source) for c in should) if s is not None]
+            minimumShouldMatch = spec.get("minimum_should_match")
+            if minimumShouldMatch is None:
+                # Like Elasticsearch: should clauses are required only when there is no filter/must clause.
+                minimumShouldMatch = 0 if "filter" in spec or "must" in spec else 1
+            if len(matched) < minimumShouldMatch:
+                return None
+            score += sum(matched)
+        return max(score, 1.0)
+
+    if kind == "function_score":
+        score = _score(spec.get("query"), _id, source)
+        if score is None:
+            return None
+        if "random_score" in spec:
+            seed = spec["random_score"].get("seed", 0)
+            digest = hashlib.md5("%s:%s" % (seed, _id)).hexdigest()
+            return int(digest[:8], 16) / float(0xffffffff)
+        return score
+
+    raise ValueError("Query %s is not supported by FakeElasticsearch" % kind)
+
+
+# Length (in milliseconds) of the date_histogram intervals supported by FakeElasticsearch.
+_INTERVALS = {
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000
+}
+
+
+def _aggregate(aggs, hits):
+    """
+    Compute the given aggregations over the given hits. Supports the aggregations used in this project: filter,
+    filters (named), terms, date_histogram (fixed intervals like 1h or 30m) and value_count, with sub-aggregations.
+    """
+    result = {}
+    for (name, agg) in aggs.iteritems():
+        subAggs = agg.get("aggs", agg.get("aggregations"))
+        (kind, spec) = [(k, v) for (k, v) in agg.iteritems() if k not in ("aggs", "aggregations")][0]
+
+        def bucket(bucketHits, **fields):
+            b = dict(fields, doc_count=len(bucketHits))
+            if subAggs is not None:
+                b.update(_aggregate(subAggs, bucketHits))
+            return b
+
+        if kind == "filter":
+            result[name] = bucket([h for h in hits if _score(spec, h["_id"], h["_source"]) is not None])
+        elif kind == "filters":
+            result[name] = {"buckets": dict(
+                (key, bucket([h for h in hits if _score(f, h["_id"], h["_source"]) is not None]))
+                for (key, f) in spec["filters"].iteritems())}
+        elif kind == "terms":
+            counts = Counter()
+            byKey = {}
+            for h in hits:
+                for v in set(_values(h["_source"], spec["field"])):
+                    counts[v] += 1
+                    byKey.setdefault(v, []).append(h)
+            result[name] = {"buckets": [bucket(byKey[k], key=k) for (k, _) in counts.most_common(spec.get("size", 10))]}
+        elif kind == "date_histogram":
+            interval = spec["interval"]
+            length = int(interval[:-1] or 1) * _INTERVALS[interval[-1]]
+            byKey = {}
+            for h in hits:
+                keys = set()
+                for v in _values(h["_source"], spec["field"]):
+                    date = dateParser.parse(v)
+                    if date.tzinfo is not None:
+                        millis = calendar.timegm(date.utctimetuple()) * 1000
+                    else:
+                        millis = calendar.timegm(date.timetuple()) * 1000
+                    keys.add(millis - millis % length)
+                for k in keys:
+                    byKey.setdefault(k, []).append(h)
+            result[name] = {"buckets": [
+                bucket(byKey[k], key=k, key_as_string=time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(k / 1000)))
+                for k in sorted(byKey) if len(byKey[k]) >= spec.get("min_doc_count", 0)]}
+        elif kind == "value_count":
+            result[name] = {"value": sum(len(_values(h["_source"], spec["field"])) for h in hits)}
+        else:
+            raise ValueError("Aggregation %s is not supported by FakeElasticsearch" % kind)
+    return result
+
+
+def _indexedSize(value, mapping, dynamic=True):
+    """
+    Estimate the size of the indexed data (inverted index and doc values) of the given value according to its mapping.
+    """
+    if isinstance(value, list):
+        return sum(_indexedSize(v, mapping, dynamic) for v in value)
+    if isinstance(value, dict):
+        if mapping.get("enabled", True) is False:
+            return 0
+        dynamic = mapping.get("dynamic", dynamic) not in (False, "false", "strict")
+        properties = mapping.get("properties", {})
+        size = 0
+        for (k, v) in value.iteritems():
+            if k in properties:
+                size += _indexedSize(v, properties[k], dynamic)
+            elif dynamic:
+                size += _indexedSize(v, {}, dynamic)
+        return size
+    if value is None:
+        return 0
+    size = len(unicode(value))
+    indexed = mapping.get("index", True) not in (False, "no")
+    docValues = mapping.get("doc_values", True) is not False
+    return size * (int(indexed) + int(docValues))
@@ -0,0 +1,176 @@
+# coding=utf-8
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+from threading import Lock, Thread
+
+from werkzeug.serving import make_server
+
+# Make the modules of the repository importable when running the benchmarks from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.stub_oembed import StubOEmbedServer
+
+# Index and document type used by the web app (see getAnnotationManager).
+ANNOTATION_INDEX = "ctrls_annotation_no_retweet"
+ANNOTATION_TYPE = "relevance"
+
+
+def populateTask(es, name, numItems, index=ANNOTATION_INDEX, docType=ANNOTATION_TYPE, seed=13):
+    """
+    Index numItems synthetic annotation items for the task with the given name, in the same format created by
+    create_annotation_task.
+
+    :return: list of ids of the created items.
+    """
+    rand = random.Random(seed)
+    ids = []
+    for i in xrange(numItems):
+        tweetId = str(rand.randint(10 ** 17, 10 ** 18))
+        res = es.index(index=index, doc_type=docType, body={
+            "name": name,
+            "created": "2017-02-20T16:33:25.093458-04:00",
+            "docId": tweetId,
+            "doc": {
+                "tweet": {
+                    "id_str": tweetId,
+                    "text": u"Tweet sintético %d da tarefa %s" % (i, name),
+                    "user": {
+                        "screen_name": "user%d" % rand.randint(0, 1000)
+                    }
+                }
+            },
+            "context": {
+                "name": name,
+                "description": u"Contexto %s" % name
+            }
+        })
+        ids.append(res["_id"])
+    return ids
+
+
+class AppHarness:
+    """
+    Run the Flask app of tweet_annotation.py in a background HTTP server, backed by a FakeElasticsearch and a
+    StubOEmbedServer. The app reads its configuration files from the working directory, so the harness writes them to
+    a temporary directory and changes into it before importing the app. Thus, only one harness per process is supported.
+    """
+
+    def __init__(self, contexts, esLatency=0.0, oEmbedLatency=0.0, deadRatio=0.0, numItems=1000, contextConfig=None):
+        """
+        :param contexts: list of context keys (each one becomes an annotation task with the same name).
+        :param esLatency: latency (in seconds) added to every Elasticsearch call.
+        :param oEmbedLatency: latency (in seconds) of the oEmbed stub.
+        :param deadRatio: fraction of the tweets considered deleted by the oEmbed stub.
+        :param numItems: number of items created for each context.
+        :param contextConfig: optional dictionary with additional settings of each context (by key), written to
+            context_config.json (e.g. {"bench0": {"numShards": 4}}).
+        """
+        self.contexts = contexts
+        self.contextConfig = contextConfig or {}
+        self.es = FakeElasticsearch(latency=0.0)
+        self.esLatency = esLatency
+        self.oEmbed = StubOEmbedServer(latency=oEmbedLatency, deadRatio=deadRatio)
+        self.numItems = numItems
+        self.app = None
+        self.module = None
+        self.__server = None
+        self.__thread = None
+
+    @property
+    def baseUrl(self):
+        return "http://127.0.0.1:%d" % self.__server.server_port
+
+    def start(self):
+        for key in self.contexts:
+            populateTask(self.es, key, self.numItems)
+        # Latency only applies to the calls issued by the app.
+        self.es.latency = self.esLatency
+
+        workDir = tempfile.mkdtemp(prefix="annotation-bench-")
+        with open(os.path.join(workDir, "context_config.json"), "w") as f:
+            json.dump(dict((key, dict(self.contextConfig.get(key, {}), name=key)) for key in self.contexts), f)
+        with open(os.path.join(workDir, "app_secret_key"), "w") as f:
+            f.write("benchmark-secret-key")
+        os.chdir(workDir)
+
+        import tweet_annotation
+        from instrumented_client import InstrumentedElasticsearch
+        from oembed import OEmbedClient
+        from session_manager import ElasticsearchSessionInterface
+
+        self.module = tweet_annotation
+        self.app = tweet_annotation.app
+        self.app.esClient = InstrumentedElasticsearch(self.es)
+        self.app.oEmbedClient = OEmbedClient(endpoint=self.oEmbed.endpoint)
+        self.app.session_interface = ElasticsearchSessionInterface(tweet_annotation.getElasticsearchClient(),
+                                                                   index='ctrls', docType='annotator')
+
+        # Keep the benchmark output clean (one log line per request otherwise).
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+        self.oEmbed.startInBackground()
+        self.__server = make_server("127.0.0.1", 0, self.app, threaded=True)
+        self.__thread = Thread(target=self.__server.serve_forever, name="BenchmarkHTTPServer")
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.oEmbed.stop()
+        self.module.getAnnotationScheduler().stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class LatencyRecorder:
+    """
+    Thread-safe collection of latencies (in seconds) per route.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.latencies = defaultdict(list)
+
+    def record(self, route, latency):
+        with self.__lock:
+            self.latencies[route].append(latency)
+
+    def count(self):
+        with self.__lock:
+            return sum(len(l) for l in self.latencies.itervalues())
+
+    def report(self, elapsed, out=sys.stdout):
+        """
+        Write the throughput and p50/p95/p99 latencies (in milliseconds) per route.
+        """
+        with self.__lock:
+            routes = sorted(self.latencies.iteritems())
+        total = sum(len(l) for (_, l) in routes)
+        out.write("%d requests in %.1fs (%.1f req/s)\n" % (total, elapsed, total / elapsed))
+        out.write("%-28s %8s %9s %9s %9s %9s %9s\n" % ("route", "count", "req/s", "p50", "p95", "p99", "max"))
+        for (route, latencies) in routes:
+            latencies = sorted(latencies)
+            out.write("%-28s %8d %9.1f %9.2f %9.2f %9.2f %9.2f\n" % (
+                route, len(latencies), len(latencies) / elapsed, percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000, latencies[-1] * 1000))
+
+
+def percentile(sortedValues, p):
+    """
+    Return the p-th percentile (nearest rank) of the given sorted list.
+    """
+    if len(sortedValues) == 0:
+        return float('nan')
+    rank = int(round(p / 100.0 * len(sortedValues) + 0.5)) - 1
+    return sortedValues[max(0, min(len(sortedValues) - 1, rank))]
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End-to-end load test of the annotation web app.
+
+Runs the Flask app against an in-process fake Elasticsearch and a stub oEmbed server, drives it with N concurrent
+simulated annotators (login -> index -> annotate loops) and reports throughput and p50/p95/p99 latencies per route.
+With --api, annotators use the JSON API instead (login -> api/next -> api/annotate loops) and, with --batch K, they
+lease K items at a time and submit their annotations in batches (login -> api/lease -> api/annotate_batch loops).
+
+Usage (from the repository root):
+
+    python -m benchmarks.load_test --annotators 20 --duration 30
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from threading import Thread
+
+import requests
+
+from benchmarks.harness import AppHarness, LatencyRecorder
+
+TWEET_ID_RE = re.compile(r'name="tweetId" value="([^"]*)"')
+USER_ID_RE = re.compile(r'name="userId" value="([^"]*)"')
+
+
+class SimulatedAnnotator(Thread):
+    """
+    Annotator that logs in and annotates items until the deadline or until there is no item left.
+    """
+
+    def __init__(self, number, baseUrl, key, recorder, deadline, skipRatio, thinkTime, seed, useApi=False,
+                 batchSize=0):
+        super(SimulatedAnnotator, self).__init__(name="Annotator-%d" % number)
+        self.daemon = True
+        self.email = "annotator%d@bench.local" % number
+        self.baseUrl = baseUrl
+        self.key = key
+        self.recorder = recorder
+        self.deadline = deadline
+        self.skipRatio = skipRatio
+        self.thinkTime = thinkTime
+        self.useApi = useApi
+        self.batchSize = batchSize
+        self.rand = random.Random(seed)
+        self.http = requests.Session()
+        self.numAnnotations = 0
+
+    def request(self, method, route, **kwargs):
+        url = self.baseUrl + route.replace("<key>", self.key)
+        start = time.time()
+        resp = self.http.request(method, url, allow_redirects=False, **kwargs)
+        self.recorder.record("%s %s" % (method, route), time.time() - start)
+        return resp
+
+    def chooseAnnotation(self):
+        if self.thinkTime > 0:
+            time.sleep(self.rand.expovariate(1.0 / self.thinkTime))
+
+        if self.rand.random() < self.skipRatio:
+            return "Nao Sei"
+        return self.rand.choice(["Sim", "Nao"])
+
+    def run(self):
+        self.request("GET", "/<key>/login")
+        self.request("POST", "/<key>/login", data={"email": self.email})
+
+        if self.batchSize > 0:
+            self.runBatch()
+        elif self.useApi:
+            self.runApi()
+        else:
+            self.runForms()
+
+    def runApi(self):
+        item = self.request("GET", "/<key>/api/next").json()["item"]
+        while item is not None and time.time() < self.deadline:
+            res = self.request("POST", "/<key>/api/annotate", json={
+                "itemId": item["id"],
+                "annotation": self.chooseAnnotation()
+            }).json()
+            item = res["item"]
+            self.numAnnotations += 1
+
+    def runBatch(self):
+        items = self.request("GET", "/<key>/api/lease", params={"size": self.batchSize}).json()["items"]
+        while len(items) > 0 and time.time() < self.deadline:
+            annotations = [{"itemId": item["id"], "annotation": self.chooseAnnotation()} for item in items]
+            items = self.request("POST", "/<key>/api/annotate_batch", json={
+                "annotations": annotations,
+                "size": self.batchSize
+            }).json()["items"]
+            self.numAnnotations += len(annotations)
+
+    def runForms(self):
+        while time.time() < self.deadline:
+            resp = self.request("GET", "/<key>/")
+            if resp.status_code == 302:
+                # The item was invalidated (dead tweet). Get the next one.
+                continue
+
+            tweetId = TWEET_ID_RE.search(resp.text)
+            if tweetId is None:
+                # No item left.
+                break
+
+            self.request("POST", "/<key>/annotate", data={
+                "userId": USER_ID_RE.search(resp.text).group(1),
+                "tweetId": tweetId.group(1),
+                "submit": self.chooseAnnotation()
+            })
+            self.numAnnotations += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the annotation web app.")
+    parser.add_argument("--annotators", type=int, default=10, help="number of concurrent annotators")
+    parser.add_argument("--contexts", type=int, default=1, help="number of contexts (annotators are spread among them)")
+    parser.add_argument("--items", type=int, default=2000, help="number of items per context")
+    parser.add_argument("--duration", type=float, default=20, help="duration of the test (in seconds)")
+    parser.add_argument("--skip-ratio", type=float, default=0.05, help="fraction of items skipped by annotators")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean time (in seconds) to annotate an item")
+    parser.add_argument("--es-latency", type=float, default=0.001, help="latency (in seconds) of each ES call")
+    parser.add_argument("--oembed-latency", type=float, default=0.05, help="latency (in seconds) of the oEmbed stub")
+    parser.add_argument("--dead-ratio", type=float, default=0.02, help="fraction of deleted tweets")
+    parser.add_argument("--seed", type=int, default=13, help="random seed")
+    parser.add_argument("--api", action="store_true", help="use the JSON API instead of the HTML forms")
+    parser.add_argument("--batch", type=int, default=0, help="lease and annotate items in batches of this size")
+    args = parser.parse_args()
+
+    keys = ["bench%d" % i for i in xrange(args.contexts)]
+    harness = AppHarness(keys, esLatency=args.es_latency, oEmbedLatency=args.oembed_latency,
+                         deadRatio=args.dead_ratio, numItems=args.items)
+    with harness:
+        recorder = LatencyRecorder()
+        start = time.time()
+        deadline = start + args.duration
+        annotators = [SimulatedAnnotator(i, harness.baseUrl, keys[i % len(keys)], recorder, deadline,
+                                         args.skip_ratio, args.think_time, args.seed + i, args.api,
+                                         args.batch)
+                      for i in xrange(args.annotators)]
+        for annotator in annotators:
+            annotator.start()
+        for annotator in annotators:
+            annotator.join()
+        elapsed = time.time() - start
+
+        numAnnotations = sum(a.numAnnotations for a in annotators)
+        sys.stdout.write("%d annotators, %d contexts: %d annotations (%.1f annotations/s)\n" % (
+            args.annotators, args.contexts, numAnnotations, numAnnotations / elapsed))
+        recorder.report(elapsed)
+
+
+if __name__ == "__main__":
+    main()
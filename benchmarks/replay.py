@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Replay of a recorded request log (see request_log.RequestLog) against a local instance of the annotation web app.
+
+Runs the Flask app against an in-process fake Elasticsearch and a stub oEmbed server (see harness.AppHarness), with
+one annotation task per context of the log. Each recorded annotator becomes a simulated annotator that issues the
+same sequence of requests at the recorded times (relative to the first request of the log), divided by the speed
+factor. The items are not the recorded ones (the fake index has its own items), so each annotator annotates the
+items it is served with the recorded annotations, keeping the shape of the traffic: arrival times, routes, batch
+sizes and skip ratio. Requests that fall behind schedule (the app is slower than the recorded one) are issued
+immediately and the maximum lag is reported.
+
+Only the requests of logged annotators are replayed. Each annotator logs in (again) before its first request, unless
+its first request is the login itself.
+
+Usage (from the repository root):
+
+    python -m benchmarks.replay request_log.jsonl --speed 10
+
+The latencies of the replay are reported next to the recorded ones. With --request-log, the replayed requests are
+also logged, so two runs (e.g. before and after a scheduler or cache change) can be compared request by request.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+from threading import Thread
+
+import requests
+
+from benchmarks.harness import AppHarness, LatencyRecorder
+from benchmarks.load_test import TWEET_ID_RE, USER_ID_RE
+from request_log import RequestLog, readRequestLog
+
+
+class ReplayedAnnotator(Thread):
+    """
+    Annotator that replays the recorded requests of one annotator of one context.
+    """
+
+    def __init__(self, number, baseUrl, key, records, recorder, startTime, origin, speed):
+        """
+        :param number: number of the annotator (used in its e-mail).
+        :param key: context of the annotator.
+        :param records: recorded requests of the annotator (sorted by time).
+        :param recorder: LatencyRecorder of the replayed requests.
+        :param startTime: time the replay started.
+        :param origin: time of the first recorded request (of all annotators).
+        :param speed: speed factor (0 means no waiting between requests).
+        """
+        super(ReplayedAnnotator, self).__init__(name="Replay-%d" % number)
+        self.daemon = True
+        self.email = "replay%d@bench.local" % number
+        self.baseUrl = baseUrl
+        self.key = key
+        self.records = records
+        self.recorder = recorder
+        self.startTime = startTime
+        self.origin = origin
+        self.speed = speed
+        self.http = requests.Session()
+        self.maxLag = 0.0
+        self.numRequests = 0
+
+        # Items currently shown to the annotator (forms page, JSON API or leased batch).
+        self.formUserId = None
+        self.formItem = None
+        self.item = None
+        self.items = []
+
+    def request(self, method, route, **kwargs):
+        url = self.baseUrl + route.replace("<key>", self.key)
+        start = time.time()
+        resp = self.http.request(method, url, allow_redirects=False, **kwargs)
+        self.recorder.record("%s %s" % (method, route), time.time() - start)
+        self.numRequests += 1
+        return resp
+
+    def run(self):
+        if (self.records[0]["method"], self.records[0]["route"]) != ("POST", "/<key>/login"):
+            self.request("POST", "/<key>/login", data={"email": self.email})
+
+        for record in self.records:
+            if self.speed > 0:
+                delay = self.startTime + (record["time"] - self.origin) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.maxLag = max(self.maxLag, -delay)
+            self.replay(record)
+
+    def replay(self, record):
+        method, route = record["method"], record["route"]
+
+        if (method, route) == ("POST", "/<key>/login"):
+            self.request(method, route, data={"email": self.email})
+
+        elif (method, route) == ("GET", "/<key>/"):
+            resp = self.request(method, route)
+            tweetId = TWEET_ID_RE.search(resp.text)
+            userId = USER_ID_RE.search(resp.text)
+            self.formItem = tweetId.group(1) if tweetId is not None else None
+            self.formUserId = userId.group(1) if userId is not None else self.formUserId
+
+        elif (method, route) == ("POST", "/<key>/annotate"):
+            self.request(method, route, data={
+                "userId": self.formUserId,
+                "tweetId": self.formItem,
+                "submit": record.get("annotation")
+            })
+
+        elif (method, route) == ("GET", "/<key>/api/next"):
+            self.item = self.__itemId(self.request(method, route))
+
+        elif (method, route) == ("POST", "/<key>/api/annotate"):
+            self.item = self.__itemId(self.request(method, route, json={
+                "itemId": self.item,
+                "annotation": record.get("annotation")
+            }))
+
+        elif (method, route) == ("GET", "/<key>/api/lease"):
+            self.items = self.__itemIds(self.request(method, route, params={"size": record.get("size", 5)}))
+
+        elif (method, route) == ("POST", "/<key>/api/annotate_batch"):
+            # The recorded annotations are applied to the items currently leased in this replay.
+            annotations = [{"itemId": itemId, "annotation": ann.get("annotation")}
+                           for (itemId, ann) in zip(self.items, record.get("annotations", []))]
+            self.items = self.__itemIds(self.request(method, route, json={
+                "annotations": annotations,
+                "size": record.get("size", 5)
+            }))
+
+        else:
+            # Pages and statistics: the same request without parameters.
+            self.request(method, route)
+
+    @staticmethod
+    def __itemId(resp):
+        if resp.status_code not in (200, 409):
+            return None
+        item = resp.json().get("item")
+        return item["id"] if item is not None else None
+
+    @staticmethod
+    def __itemIds(resp):
+        if resp.status_code != 200:
+            return []
+        return [item["id"] for item in resp.json().get("items", [])]
+
+
+def groupByAnnotator(records):
+    """
+    Group the requests of logged annotators by context and annotator (in the order of their first request).
+
+    :return: ordered dictionary whose keys are pairs (context, annotator) and values are lists of records.
+    """
+    groups = OrderedDict()
+    for record in records:
+        if record.get("loggedIn"):
+            groups.setdefault((record["context"], record["annotator"]), []).append(record)
+    return groups
+
+
+def recordedLatencies(records):
+    """
+    Return a LatencyRecorder with the recorded latencies and the recorded duration (in seconds) of the given requests.
+    """
+    recorder = LatencyRecorder()
+    for record in records:
+        recorder.record("%s %s" % (record["method"], record["route"]), record["durationMs"] / 1000.0)
+    if len(records) == 0:
+        return recorder, 0.0
+    end = max(record["time"] + record["durationMs"] / 1000.0 for record in records)
+    return recorder, end - records[0]["time"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded request log against a local instance.")
+    parser.add_argument("log", help="request log (JSONL) to be replayed")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="speed factor (e.g. 10 replays ten times faster; 0 replays without waiting)")
+    parser.add_argument("--items", type=int, default=2000, help="number of items per context")
+    parser.add_argument("--es-latency", type=float, default=0.001, help="latency (in seconds) of each ES call")
+    parser.add_argument("--oembed-latency", type=float, default=0.05, help="latency (in seconds) of the oEmbed stub")
+    parser.add_argument("--dead-ratio", type=float, default=0.02, help="fraction of deleted tweets")
+    parser.add_argument("--request-log", help="log the replayed requests to this file")
+    args = parser.parse_args()
+
+    records = [record for record in readRequestLog(args.log) if record.get("loggedIn")]
+    if len(records) == 0:
+        sys.stderr.write("No request of logged annotators in %s\n" % args.log)
+        sys.exit(1)
+    groups = groupByAnnotator(records)
+    keys = sorted(set(key for (key, _) in groups))
+    # The harness changes the working directory.
+    requestLogPath = os.path.abspath(args.request_log) if args.request_log is not None else None
+
+    harness = AppHarness(keys, esLatency=args.es_latency, oEmbedLatency=args.oembed_latency,
+                         deadRatio=args.dead_ratio, numItems=args.items)
+    with harness:
+        if requestLogPath is not None:
+            harness.module.requestLog = RequestLog(outputFile=requestLogPath)
+
+        recorder = LatencyRecorder()
+        start = time.time()
+        annotators = [ReplayedAnnotator(i, harness.baseUrl, key, annotatorRecords, recorder, start,
+                                        records[0]["time"], args.speed)
+                      for (i, ((key, _), annotatorRecords)) in enumerate(groups.iteritems())]
+        for annotator in annotators:
+            annotator.start()
+        for annotator in annotators:
+            annotator.join()
+        elapsed = time.time() - start
+
+        if harness.module.requestLog is not None:
+            harness.module.requestLog.close()
+
+    sys.stdout.write("%d annotators, %d contexts, speed %gx: %d requests replayed (max lag %.2fs)\n" % (
+        len(annotators), len(keys), args.speed, sum(a.numRequests for a in annotators),
+        max(a.maxLag for a in annotators)))
+    sys.stdout.write("\nReplay:\n")
+    recorder.report(elapsed)
+
+    recorded, recordedElapsed = recordedLatencies(records)
+    sys.stdout.write("\nRecorded:\n")
+    recorded.report(max(recordedElapsed, 1e-3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# coding=utf-8
+import hashlib
+import json
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from threading import Thread
+from urlparse import urlparse, parse_qs
+
+
+class StubOEmbedServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for the Twitter oEmbed API. It answers any GET with a small embed HTML, after an optional latency.
+    A deterministic fraction of the tweets (chosen by hashing the tweet URL) is answered with 404, like deleted or
+    protected tweets, in order to exercise the invalidation path of the web app.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, deadRatio=0.0):
+        """
+        :param port: port to listen (0 picks a free port).
+        :param latency: time (in seconds) spent on each request.
+        :param deadRatio: fraction of the tweets answered with 404.
+        """
+        HTTPServer.__init__(self, ("127.0.0.1", port), _OEmbedHandler)
+        self.latency = latency
+        self.deadRatio = deadRatio
+        self.__thread = None
+
+    @property
+    def endpoint(self):
+        return "http://127.0.0.1:%d/oembed" % self.server_address[1]
+
+    def isDead(self, tweetUrl):
+        digest = hashlib.md5(tweetUrl).hexdigest()
+        return int(digest[:8], 16) / float(0xffffffff) < self.deadRatio
+
+    def startInBackground(self):
+        self.__thread = Thread(target=self.serve_forever, name="StubOEmbedServer")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _OEmbedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+
+        tweetUrl = parse_qs(urlparse(self.path).query).get("url", [""])[0]
+        if self.server.isDead(tweetUrl):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = json.dumps({
+            "url": tweetUrl,
+            "html": '<blockquote class="twitter-tweet"><a href="%s">%s</a></blockquote>' % (tweetUrl, tweetUrl)
+        })
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the benchmark output clean.
+        pass
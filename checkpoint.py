@@ -0,0 +1,25 @@
+# coding=utf-8
+import json
+import os
+
+
+def loadCheckpoint(path):
+    """
+    Return the checkpoint saved in the given file (JSON) or an empty dictionary if there is none.
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def saveCheckpoint(path, checkpoint):
+    """
+    Save the checkpoint atomically (write to a temporary file and rename it).
+    """
+    if path is None:
+        return
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.rename(tmpPath, path)
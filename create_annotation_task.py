@@ -1,99 +1,40 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import argparse
 from datetime import datetime
 from sys import stdout
 
 from dateutil import tz
-from elasticsearch import Elasticsearch
-from elasticsearch.client import IndicesClient
 from elasticsearch.helpers import scan, bulk
 
+from annotation_mappings import checkIndexAndType, checkDuplicateType
+from es_client import createElasticsearchClient
+from file_source import readDocuments
+from ingest_lifecycle import bulkLoading, publishTaskIndex, taskIndexName
+from near_duplicates import NearDuplicateDetector
 
-def checkIndexAndType(es, index, docType):
-    """
-    Check if the given index and type exist. If the doc type or the index do not exist, create them and the
-    corresponding mappings.
 
-    :param es: Elasticsearch client.
-    :param index:
-    :param docType:
-    :return:
+def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, query, numberOfDocs=float('inf'),
+                           deduplicator=None, duplicateType="duplicate", documents=None, alias=None,
+                           replaceIndices=None, forceMerge=False, numberOfShards=None):
     """
-    ic = IndicesClient(es)
-    if not ic.exists(index=index):
-        ic.create(index=index)
-
-    if not ic.exists_type(index=index, doc_type=docType):
-        # Create type.
-        ic.put_mapping(index=index, doc_type=docType, body={
-            "properties": {}
-        })
-
-    mapping = ic.get_mapping(index=index, doc_type=docType)
-    properties = mapping[index]["mappings"][docType]
-    if len(properties) == 0:
-        ic.put_mapping(index=index, doc_type=docType, body={
-            "properties": {
-                "name": {
-                    "type": "keyword"
-                },
-                "created": {
-                    "type": "date"
-                },
-                "docId": {
-                    "type": "keyword"
-                },
-                "context": {
-                    "properties": {
-                        "name": {
-                            "type": "keyword"
-                        },
-                        "terms": {
-                            "type": "keyword"
-                        },
-                        "description": {
-                            "type": "text"
-                        }
-                    }
-                },
-                "numValidAnnotations": {
-                    "type": "long"
-                },
-                "annotations": {
-                    "properties": {
-                        "annotatorId": {
-                            "type": "keyword"
-                        },
-                        "annotation": {
-                            "type": "keyword"
-                        },
-                        "time": {
-                            "type": "date"
-                        }
-                    }
-                },
-                "invalid": {
-                    "properties": {
-                        "annotatorId": {
-                            "type": "keyword"
-                        },
-                        "cause": {
-                            "type": "text"
-                        },
-                        "time": {
-                            "type": "date"
-                        }
-                    }
-                }
-            }
-        })
+    Create an annotation item for each doc in the given query.
 
-    return True
+    Instead of querying an index, the docs can be given by an iterable of documents in the format of the scan hits
+    (e.g. file_source.readDocuments, which streams JSONL dumps). Documents are consumed as the bulk indexer sends
+    them, so memory usage does not depend on the number of documents.
 
+    If a deduplicator (NearDuplicateDetector) is given, only one item is created for each cluster of near-duplicate
+    tweets. For the other tweets of the cluster, a document of type duplicateType records the docId of the
+    representative item, so that its annotations can be propagated at export (see export_annotations).
 
-def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, query, numberOfDocs=float('inf')):
-    """
-    Create an annotation item for each doc in the given query.
+    If the index does not exist, it is created and prepared for the bulk load (no refresh and no replicas until the
+    load finishes; see ingest_lifecycle.bulkLoading). When an alias is given, the index should hold only this task
+    (see ingest_lifecycle.taskIndexName). After the load, it is published in the task alias (e.g.
+    ctrls_annotation_supernatural for the alias ctrls_annotation) and in the given alias, replacing the previous indices
+    of the task (see ingest_lifecycle.publishTaskIndex). Thus, annotation managers reading the task alias never see a
+    partially created task, and their queries search only the shards of the task instead of the shards of all tasks.
+    Aliases and indices share the same namespace, so no index may be named as the alias or the task alias.
 
     :param es:
     :param index:
@@ -103,33 +44,68 @@ def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, qu
     :param sourceIndex:
     :param query:
     :param numberOfDocs:
-    :return:
+    :param deduplicator: optional NearDuplicateDetector.
+    :param duplicateType: document type of the near-duplicate records.
+    :param documents: optional iterable of source documents (dictionaries with _id and _source) used instead of
+        querying sourceIndex.
+    :param alias: optional alias shared by all tasks, whose task alias the index is published in after the load.
+    :param replaceIndices: indices removed from the aliases (default is the previous indices of the task alias).
+    :param forceMerge: force-merge the new index to one segment after the load.
+    :param numberOfShards: number of shards of the index, if it is created (default is the cluster default). Small
+        tasks need a single shard.
+    :return: name of the task alias or None if no alias is given.
     """
-    checkIndexAndType(es, index=index, docType=docType)
+    newIndex = not es.indices.exists(index=index)
+    checkIndexAndType(es, index=index, docType=docType,
+                      settings={"number_of_shards": numberOfShards} if numberOfShards is not None else None)
+    if deduplicator is not None:
+        checkDuplicateType(es, index=index, docType=duplicateType)
 
     created = datetime.now(tz.tzlocal())
 
+    if documents is None:
+        documents = scan(es, index=sourceIndex, doc_type=sourceType, query=query)
+
     def generator():
         count = 0
-        for doc in scan(es, index=sourceIndex, doc_type=sourceType, query=query):
-            annDoc = {
-                "name": name,
-                "created": created,
-                "docId": doc["_id"],
-                "doc": doc["_source"],
-                "context": {
-                    "name": "supernatural",
-                    # "terms": [u"sam", u"dean"],
-                    "description": u"Série Supernatural"
+        for doc in documents:
+            representative = doc["_id"]
+            if deduplicator is not None:
+                representative, similarity = deduplicator.assign(doc["_id"], doc["_source"]["tweet"]["text"])
+
+            if representative != doc["_id"]:
+                # Near-duplicate: record the cluster membership instead of creating an item.
+                action = {
+                    '_op_type': 'index',
+                    '_index': index,
+                    '_type': duplicateType,
+                    '_source': {
+                        "name": name,
+                        "created": created,
+                        "docId": doc["_id"],
+                        "representativeDocId": representative,
+                        "similarity": similarity
+                    }
+                }
+            else:
+                annDoc = {
+                    "name": name,
+                    "created": created,
+                    "docId": doc["_id"],
+                    "doc": doc["_source"],
+                    "context": {
+                        "name": "supernatural",
+                        # "terms": [u"sam", u"dean"],
+                        "description": u"Série Supernatural"
+                    }
                 }
-            }
 
-            action = {
-                '_op_type': 'index',
-                '_index': index,
-                '_type': docType,
-                '_source': annDoc
-            }
+                action = {
+                    '_op_type': 'index',
+                    '_index': index,
+                    '_type': docType,
+                    '_source': annDoc
+                }
 
             yield action
 
@@ -143,15 +119,49 @@ def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, qu
                 break
 
         stdout.write('\n')
-        print 'Created %d items' % count
+        if deduplicator is not None:
+            print 'Created %d items (%d near-duplicates collapsed)' % (count - deduplicator.numDuplicates,
+                                                                        deduplicator.numDuplicates)
+        else:
+            print 'Created %d items' % count
 
-    bulk(es, generator())
+    if newIndex:
+        with bulkLoading(es, index, forceMerge=forceMerge):
+            bulk(es, generator())
+    else:
+        bulk(es, generator())
 
+    if alias is not None:
+        taskAlias = publishTaskIndex(es, alias, name, index, replaceIndices)
+        print 'Task published in the aliases %s and %s' % (alias, taskAlias)
+        return taskAlias
 
-def main():
-    es = Elasticsearch(['http://localhost:9200'])
 
-    checkIndexAndType(es, index="ctrls_annotation", docType="relevance")
+def main():
+    parser = argparse.ArgumentParser(description="Create the Supernatural annotation task.")
+    parser.add_argument("--file", action="append",
+                        help="JSONL file (or glob pattern) with the tweets, optionally compressed (.gz or .zst); can "
+                             "be given several times. By default, tweets are read from the ctrls_no_retweet index")
+    parser.add_argument("--mmap", action="store_true", help="memory-map uncompressed files")
+    parser.add_argument("--dedup", action="store_true", help="collapse near-duplicate tweets")
+    parser.add_argument("--alias",
+                        help="create the task in its own index and publish it in this alias and in the task alias "
+                             "(<alias>_<task name>) after the load, replacing previous indices of the task. No index "
+                             "may have the name of the alias. By default, items are added to the shared index "
+                             "ctrls_annotation_no_retweet")
+    parser.add_argument("--force-merge", action="store_true", help="force-merge the new index after the load")
+    parser.add_argument("--shards", type=int, help="number of shards of the new index (default is the cluster default)")
+    args = parser.parse_args()
+
+    es = createElasticsearchClient()
+
+    index = "ctrls_annotation_no_retweet"
+    if args.alias is not None:
+        index = taskIndexName(args.alias, "supernatural", datetime.now())
+
+    documents = None
+    if args.file:
+        documents = readDocuments(args.file, useMmap=args.mmap)
 
     # created = datetime.now(tz.tzlocal())
     #
@@ -164,7 +174,7 @@ def main():
     #     }
     #     es.index(index="test_annotation_index", doc_type="test_annotation", body=annDoc)
 
-    create_annotation_task(es, index="ctrls_annotation_no_retweet", docType="relevance", name="supernatural",
+    create_annotation_task(es, index=index, docType="relevance", name="supernatural",
                            sourceIndex="ctrls_no_retweet", sourceType="twitter",
                            query={
                                "query": {
@@ -178,7 +188,10 @@ def main():
                                        ]
                                    }
                                }
-                           })
+                           },
+                           deduplicator=NearDuplicateDetector() if args.dedup else None,
+                           documents=documents, alias=args.alias, forceMerge=args.force_merge,
+                           numberOfShards=args.shards)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import argparse
 from datetime import datetime
 from sys import stdout
 
 from dateutil import tz
-from elasticsearch import Elasticsearch
-from elasticsearch.client import IndicesClient
 from elasticsearch.helpers import bulk
 from elasticsearch.helpers import scan
 
+from annotation_mappings import checkIndexAndType, checkDocumentIndex
+from es_client import createElasticsearchClient
+
 #
 # List of contexts for this task.
 #
@@ -31,91 +33,15 @@ contexts = [
 ]
 
 
-def checkIndexAndType(es, index, docType):
-    """
-    Check if the given index and type exist. If the doc type or the index do not exist, create them and the
-    corresponding mappings.
-
-    :param es: Elasticsearch client.
-    :param index:
-    :param docType:
-    :return:
+def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, query, numberOfDocs=float('inf'),
+                           documentIndex=None, documentType="tweet"):
     """
-    ic = IndicesClient(es)
-    if not ic.exists(index=index):
-        ic.create(index=index)
-
-    if not ic.exists_type(index=index, doc_type=docType):
-        # Create type.
-        ic.put_mapping(index=index, doc_type=docType, body={
-            "properties": {}
-        })
-
-    mapping = ic.get_mapping(index=index, doc_type=docType)
-    properties = mapping[index]["mappings"][docType]
-    if len(properties) == 0:
-        ic.put_mapping(index=index, doc_type=docType, body={
-            "properties": {
-                "name": {
-                    "type": "keyword"
-                },
-                "created": {
-                    "type": "date"
-                },
-                "docId": {
-                    "type": "keyword"
-                },
-                "context": {
-                    "properties": {
-                        "name": {
-                            "type": "keyword"
-                        },
-                        "terms": {
-                            "type": "keyword"
-                        },
-                        "description": {
-                            "type": "text"
-                        }
-                    }
-                },
-                "numValidAnnotations": {
-                    "type": "long"
-                },
-                "annotations": {
-                    "properties": {
-                        "annotatorId": {
-                            "type": "keyword"
-                        },
-                        "annotation": {
-                            "type": "keyword"
-                        },
-                        "time": {
-                            "type": "date"
-                        }
-                    }
-                },
-                "invalid": {
-                    "properties": {
-                        "annotatorId": {
-                            "type": "keyword"
-                        },
-                        "cause": {
-                            "type": "text"
-                        },
-                        "time": {
-                            "type": "date"
-                        }
-                    }
-                }
-            }
-        })
-
-    return True
+    Create an annotation item for each doc in the given query and each context whose terms occur in the doc.
 
-
-def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, query, numberOfDocs=float('inf')):
-    """
-    Create an annotation item for each doc in the given query.
+    By default, each item embeds a copy of its doc, so a tweet that matches several contexts is stored (and loaded by
+    the annotation manager) several times. If a document index is given, each doc is stored once in it (with the id
+    of the source doc) and the items only reference it by docId. The contexts of the task must then give the document
+    index (documentIndex key in context_config.json; see document_store.DocumentStore).
 
     :param es:
     :param index:
@@ -125,9 +51,13 @@ def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, qu
     :param sourceIndex:
     :param query:
     :param numberOfDocs:
+    :param documentIndex: optional index of the shared docs.
+    :param documentType: type of the shared docs.
     :return:
     """
     checkIndexAndType(es, index=index, docType=docType)
+    if documentIndex is not None:
+        checkDocumentIndex(es, index=documentIndex, docType=documentType)
 
     created = datetime.now(tz.tzlocal())
 
@@ -135,29 +65,41 @@ def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, qu
         count = 0
         for doc in scan(es, index=sourceIndex, doc_type=sourceType, query=query):
             # Analyse context.
-            for context in contexts:
-                text = doc["_source"]["tweet"]["text"].lower()
-                if any([text.find(t) != -1 for t in context["terms"]]):
-                    annDoc = {
-                        "name": name,
-                        "created": created,
-                        "docId": doc["_id"],
-                        "doc": doc["_source"],
-                        "context": context
-                    }
-
-                    # print json.dumps(annDoc, indent=2)
-
-                    action = {
-                        '_op_type': 'index',
-                        '_index': index,
-                        '_type': docType,
-                        '_source': annDoc
-                    }
-
-                    yield action
-
-                    # es.index(index=index, doc_type=docType, body=annDoc)
+            text = doc["_source"]["tweet"]["text"].lower()
+            matched = [context for context in contexts if any([text.find(t) != -1 for t in context["terms"]])]
+
+            if documentIndex is not None and len(matched) > 0:
+                # Store the doc once, shared by the items of all matched contexts (and by other tasks).
+                yield {
+                    '_op_type': 'index',
+                    '_index': documentIndex,
+                    '_type': documentType,
+                    '_id': doc["_id"],
+                    '_source': doc["_source"]
+                }
+
+            for context in matched:
+                annDoc = {
+                    "name": name,
+                    "created": created,
+                    "docId": doc["_id"],
+                    "context": context
+                }
+                if documentIndex is None:
+                    annDoc["doc"] = doc["_source"]
+
+                # print json.dumps(annDoc, indent=2)
+
+                action = {
+                    '_op_type': 'index',
+                    '_index': index,
+                    '_type': docType,
+                    '_source': annDoc
+                }
+
+                yield action
+
+                # es.index(index=index, doc_type=docType, body=annDoc)
 
             count += 1
 
@@ -175,7 +117,13 @@ def create_annotation_task(es, index, docType, name, sourceIndex, sourceType, qu
 
 
 def main():
-    es = Elasticsearch(['http://localhost:9200'])
+    parser = argparse.ArgumentParser(description="Create the Futebol annotation task.")
+    parser.add_argument("--doc-index",
+                        help="store each tweet once in this index, shared by the items of all its contexts. By "
+                             "default, each item embeds a copy of its tweet")
+    args = parser.parse_args()
+
+    es = createElasticsearchClient()
 
     targetIndex = "ctrls_annotation_no_retweet"
     targetType = "relevance"
@@ -224,7 +172,8 @@ def main():
                                        ]
                                    }
                                }
-                           })
+                           },
+                           documentIndex=args.doc_index)
 
 
 if __name__ == "__main__":
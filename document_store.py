@@ -0,0 +1,101 @@
+# coding=utf-8
+from collections import OrderedDict
+from threading import Lock
+
+import metrics
+
+# Default index of the shared documents.
+DOCUMENT_INDEX = "ctrls_annotation_docs"
+
+
+class DocumentStore:
+    """
+    Store of the documents (tweets) shared by annotation items.
+
+    A tweet that is annotated in several contexts (or tasks) is stored once in the document index, keyed by its source
+    id, and each annotation item only holds its docId (items created with the docs in a document index do not have the
+    doc field). The store resolves docIds to documents and keeps the most recently used ones in a LRU cache, so the
+    items of all contexts that reference the same tweet share a single dictionary in memory.
+
+    Documents are retrieved in batches (multi-get requests of at most batchSize documents missing in the cache).
+    Documents not found in the index are not cached.
+    """
+
+    def __init__(self, esClient, index=DOCUMENT_INDEX, docType="tweet", cacheSize=100000, batchSize=500):
+        """
+        :param esClient: Elasticsearch client.
+        :param index: index of the documents.
+        :param docType: type of the documents.
+        :param cacheSize: maximum number of documents kept in the cache.
+        :param batchSize: maximum number of documents retrieved by each multi-get request.
+        """
+        self.es = esClient
+        self.index = index
+        self.docType = docType
+        self.cacheSize = cacheSize
+        self.batchSize = batchSize
+
+        self.__lock = Lock()
+        self.__cache = OrderedDict()
+
+    def get(self, docId):
+        """
+        Return the document with the given id or None if it does not exist.
+        """
+        return self.getMany([docId]).get(docId)
+
+    def getMany(self, docIds):
+        """
+        Return a dictionary with the documents of the given ids (ids of missing documents are not included).
+        """
+        # Remove repeated ids keeping their order.
+        docIds = list(OrderedDict.fromkeys(docIds))
+
+        docs = {}
+        missing = []
+        with self.__lock:
+            for docId in docIds:
+                doc = self.__cache.get(docId)
+                if doc is not None:
+                    # Move the entry to the end (most recently used).
+                    del self.__cache[docId]
+                    self.__cache[docId] = doc
+                    docs[docId] = doc
+                else:
+                    missing.append(docId)
+
+        metrics.documentCacheRequests.labels("hit").inc(len(docIds) - len(missing))
+        if len(missing) == 0:
+            return docs
+        metrics.documentCacheRequests.labels("miss").inc(len(missing))
+
+        for start in xrange(0, len(missing), self.batchSize):
+            resp = self.es.mget(index=self.index, doc_type=self.docType,
+                                body={"ids": missing[start:start + self.batchSize]})
+
+            with self.__lock:
+                for hit in resp["docs"]:
+                    if not hit.get("found"):
+                        continue
+                    # Another thread may have cached the same document meanwhile; keep a single copy.
+                    doc = self.__cache.pop(hit["_id"], None)
+                    if doc is None:
+                        doc = hit["_source"]
+                    self.__cache[hit["_id"]] = doc
+                    docs[hit["_id"]] = doc
+                while len(self.__cache) > self.cacheSize:
+                    self.__cache.popitem(last=False)
+
+        return docs
+
+    def resolve(self, items):
+        """
+        Set the doc of the given items (AnnotatedItem objects) that only reference their document. The doc of items
+        whose document is not found remains None.
+        """
+        pending = [item for item in items if item.doc is None]
+        if len(pending) == 0:
+            return
+        docs = self.getMany([item.docId for item in pending])
+        for item in pending:
+            item.doc = docs.get(item.docId)
@@ -0,0 +1,84 @@
+# coding=utf-8
+import json
+import os
+from codecs import open
+
+from elasticsearch import Elasticsearch
+
+from instrumented_client import InstrumentedElasticsearch
+
+# Default configuration file (optional).
+CONFIG_FILE = 'es_config.json'
+
+DEFAULT_CONFIG = {
+    # Cluster nodes. Requests are spread over all (live) nodes.
+    "hosts": ["http://localhost:9200"],
+
+    # Maximum number of connections kept open to each node. It should not be smaller than the number of threads (or
+    # greenlets) issuing concurrent requests, otherwise requests wait for a free connection.
+    "maxsize": 50,
+
+    # Default timeout (in seconds) of each request.
+    "timeout": 10,
+
+    # Timeouts (in seconds) of specific operations (e.g. {"bulk": 120, "msearch": 5}), overriding the default.
+    "requestTimeouts": {},
+
+    # Number of retries of failed requests (connection errors, and timeouts if retryOnTimeout is set) on other nodes.
+    # A timed-out request may have been executed, so timeouts are retried only by clients whose requests are idempotent
+    # (see createElasticsearchClient) unless retryOnTimeout is set to true or false.
+    "maxRetries": 3,
+    "retryOnTimeout": None,
+
+    # Discover the cluster nodes at start, when a connection fails and/or every snifferTimeout seconds.
+    "sniffOnStart": False,
+    "sniffOnConnectionFail": False,
+    "snifferTimeout": None,
+    "sniffTimeout": 1
+}
+
+
+def loadElasticsearchConfig(path=CONFIG_FILE):
+    """
+    Return the client configuration: the default configuration (DEFAULT_CONFIG) updated by the given JSON file, if it
+    exists.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if path is not None and os.path.exists(path):
+        with open(path, encoding='utf8') as f:
+            config.update(json.load(f))
+    return config
+
+
+def createElasticsearchClient(config=None, idempotent=False):
+    """
+    Create the Elasticsearch client used by the web app, the session interface and the ingest/export tools, so all of
+    them share the same connection pool, timeout, retry and sniffing settings.
+
+    The client is an InstrumentedElasticsearch, which also applies the per-operation timeouts (requestTimeouts).
+
+    :param config: configuration dictionary (see DEFAULT_CONFIG) or None to load it from es_config.json.
+    :param idempotent: whether all requests of the caller are idempotent (searches, and writes by document id), so
+        timed-out requests can be retried (unless the configuration sets retryOnTimeout). Ingest tools that index
+        documents with generated ids must not retry them, since that could create duplicates.
+    :return: the Elasticsearch client.
+    """
+    if config is None:
+        config = loadElasticsearchConfig()
+    else:
+        config = dict(DEFAULT_CONFIG, **config)
+
+    retryOnTimeout = config["retryOnTimeout"]
+    if retryOnTimeout is None:
+        retryOnTimeout = idempotent
+
+    client = Elasticsearch(config["hosts"],
+                           maxsize=config["maxsize"],
+                           timeout=config["timeout"],
+                           max_retries=config["maxRetries"],
+                           retry_on_timeout=retryOnTimeout,
+                           sniff_on_start=config["sniffOnStart"],
+                           sniff_on_connection_fail=config["sniffOnConnectionFail"],
+                           sniffer_timeout=config["snifferTimeout"],
+                           sniff_timeout=config["sniffTimeout"])
+    return InstrumentedElasticsearch(client, requestTimeouts=config["requestTimeouts"])
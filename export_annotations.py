@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Export the items of an annotation task (with their annotations) and compute agreement statistics.
+
+Items are streamed from Elasticsearch with the scan helper and written one by one, so memory usage does not depend on
+the number of items. Only the fields needed by the export are retrieved (the indexed tweet is not, except its text).
+Label distributions and agreement statistics (percent agreement, Fleiss' kappa and Cohen's kappa of each pair of
+annotators) are computed per context and for the whole task by AgreementAccumulator.
+
+Tweets collapsed as near-duplicates when the task was created (see near_duplicates.py) can also be exported with the
+label of their representative item (--propagate-duplicates). Items and near-duplicate records are scanned sorted by
+docId and representativeDocId, respectively, and merged, so this also runs in constant memory. Propagated rows have
+the duplicateOf column set and do not count in the statistics.
+
+Items that only reference their tweets (tasks created with a document index; see document_store.py) get the text from
+the document index (--doc-index), retrieved with one multi-get request per scroll page.
+
+Incremental exports (--incremental DIR) only stream the items updated since the previous export (filtered by the
+updated field, set whenever the annotations or the invalid marker of an item are written), so frequent exports cost
+proportionally to the new annotations instead of the task size. The window of each export ends some time (--lag)
+before it starts, so updates not yet visible to searches (refresh interval) are left to the next export. Each export
+is written to a new file partitioned by date (DIR/date=YYYY-MM-DD/part-YYYYmmddTHHMMSS.<format>) and the end of its
+window is saved in a checkpoint (default DIR/checkpoint.json) only after the file is complete. The first export (no
+checkpoint) includes all items. Items updated several times are exported again, so consumers should keep the last
+record of each item id. The statistics cover only the exported items.
+
+Output formats:
+    - jsonl: one JSON object per item;
+    - csv: one row per item, annotations serialized as JSON;
+    - parquet: same columns as csv, written in row groups (requires pyarrow).
+
+Usage:
+
+    python export_annotations.py --name supernatural --format csv --output supernatural.csv --stats stats.json
+    python export_annotations.py --name supernatural --incremental exports/supernatural
+"""
+import argparse
+import csv
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from sys import stdout
+
+from dateutil import tz
+from elasticsearch.helpers import scan
+
+from annotation_agreement import AgreementAccumulator
+from annotation_manager import AnnotationManager
+from annotation_mappings import checkUpdatedField
+from checkpoint import loadCheckpoint, saveCheckpoint
+from document_store import DocumentStore
+from es_client import createElasticsearchClient
+from ingest_lifecycle import taskAliasName
+
+# Fields retrieved from each item.
+SOURCE_FIELDS = ["docId", "context.name", "numValidAnnotations", "annotations", "invalid", "doc.tweet.text"]
+
+# Columns of the flat formats (csv and parquet).
+COLUMNS = ["id", "docId", "context", "text", "numValidAnnotations", "label", "invalid", "annotations", "duplicateOf"]
+
+
+def majorityLabel(annotations):
+    """
+    Return the most frequent label among the given annotations (skips are ignored) or None if there is a tie.
+    """
+    counts = Counter(ann["annotation"] for ann in annotations if ann["annotation"] != AnnotationManager.SKIP)
+    if len(counts) == 0:
+        return None
+    ranking = counts.most_common(2)
+    if len(ranking) > 1 and ranking[0][1] == ranking[1][1]:
+        return None
+    return ranking[0][0]
+
+
+def itemRecord(hit):
+    """
+    Build the exported record of an item from its search hit.
+    """
+    source = hit["_source"]
+    annotations = source.get("annotations", [])
+    invalid = source.get("invalid")
+    return {
+        "id": hit["_id"],
+        "docId": source.get("docId"),
+        "context": source.get("context", {}).get("name"),
+        "text": source.get("doc", {}).get("tweet", {}).get("text"),
+        "numValidAnnotations": source.get("numValidAnnotations", 0),
+        "label": majorityLabel(annotations) if invalid is None else None,
+        "invalid": invalid["cause"] if invalid is not None else None,
+        "annotations": annotations,
+        "duplicateOf": None
+    }
+
+
+def flatRecord(record):
+    """
+    Return a copy of the given record with annotations serialized as JSON.
+    """
+    flat = dict(record)
+    flat["annotations"] = json.dumps(record["annotations"])
+    return flat
+
+
+class JsonlWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, record):
+        self.f.write(json.dumps(record) + "\n")
+
+    def close(self):
+        pass
+
+
+class CsvWriter:
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, record):
+        record = flatRecord(record)
+        row = []
+        for col in COLUMNS:
+            value = record[col]
+            if value is None:
+                value = ""
+            elif isinstance(value, unicode):
+                value = value.encode("utf-8")
+            row.append(value)
+        self.writer.writerow(row)
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """
+    Buffer records and write them in row groups of rowGroupSize rows.
+    """
+
+    def __init__(self, f, rowGroupSize=100000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("Parquet export requires pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+            ("id", pyarrow.string()),
+            ("docId", pyarrow.string()),
+            ("context", pyarrow.string()),
+            ("text", pyarrow.string()),
+            ("numValidAnnotations", pyarrow.int64()),
+            ("label", pyarrow.string()),
+            ("invalid", pyarrow.string()),
+            ("annotations", pyarrow.string()),
+            ("duplicateOf", pyarrow.string())
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(f, self.schema)
+        self.rowGroupSize = rowGroupSize
+        self.columns = dict((col, []) for col in COLUMNS)
+
+    def write(self, record):
+        record = flatRecord(record)
+        for col in COLUMNS:
+            self.columns[col].append(record[col])
+        if len(self.columns["id"]) >= self.rowGroupSize:
+            self.flush()
+
+    def flush(self):
+        if len(self.columns["id"]) == 0:
+            return
+        arrays = [self.pa.array(self.columns[col], type=self.schema.field(col).type) for col in COLUMNS]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.columns = dict((col, []) for col in COLUMNS)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {
+    "jsonl": JsonlWriter,
+    "csv": CsvWriter,
+    "parquet": ParquetWriter
+}
+
+
+def withDocuments(hits, documentStore, batchSize=1000):
+    """
+    Generate the given item hits, setting the doc of the items that only reference it (retrieved in batches from the
+    given DocumentStore). Only the text of the tweet is kept.
+    """
+    batch = []
+    for hit in hits:
+        batch.append(hit)
+        if len(batch) >= batchSize:
+            for h in _resolveBatch(batch, documentStore):
+                yield h
+            batch = []
+    for h in _resolveBatch(batch, documentStore):
+        yield h
+
+
+def _resolveBatch(batch, documentStore):
+    docIds = [hit["_source"]["docId"] for hit in batch if "doc" not in hit["_source"]]
+    docs = documentStore.getMany(docIds) if len(docIds) > 0 else {}
+    for hit in batch:
+        source = hit["_source"]
+        if "doc" not in source and source["docId"] in docs:
+            source["doc"] = {"tweet": {"text": docs[source["docId"]].get("tweet", {}).get("text")}}
+    return batch
+
+
+def taskFilter(name, query=None):
+    """
+    Return the query filter of the documents of the given task (and the optional extra filter).
+    """
+    filters = [{"term": {"name": name}}]
+    if query is not None:
+        filters.append(query)
+    return {"bool": {"filter": filters}}
+
+
+def duplicateRecords(es, index, docType, duplicateType, name, scanSize=1000):
+    """
+    Generate the records of the near-duplicates of the given task, labeled as their representative items.
+    """
+    items = scan(es, index=index, doc_type=docType, size=scanSize, preserve_order=True,
+                 _source_include=",".join(SOURCE_FIELDS),
+                 query={"query": taskFilter(name), "sort": [{"docId": "asc"}]})
+    duplicates = scan(es, index=index, doc_type=duplicateType, size=scanSize, preserve_order=True,
+                      query={"query": taskFilter(name), "sort": [{"representativeDocId": "asc"}]})
+
+    # Records of the current representative (one per item, since a tweet may be an item in more than one context).
+    representativeDocId = None
+    representatives = []
+    nextItem = next(items, None)
+    for hit in duplicates:
+        dup = hit["_source"]
+        if dup["representativeDocId"] != representativeDocId:
+            representativeDocId = dup["representativeDocId"]
+            representatives = []
+            while nextItem is not None and nextItem["_source"]["docId"] < representativeDocId:
+                nextItem = next(items, None)
+            while nextItem is not None and nextItem["_source"]["docId"] == representativeDocId:
+                representatives.append(itemRecord(nextItem))
+                nextItem = next(items, None)
+
+        for record in representatives:
+            yield dict(record, id=None, docId=dup["docId"], text=None, annotations=[], duplicateOf=representativeDocId)
+
+
+def export_annotations(es, index, docType, name, out, outputFormat="jsonl", query=None, scanSize=1000,
+                       duplicateType=None, documentIndex=None):
+    """
+    Export all items of the given annotation task and return their agreement statistics.
+
+    :param es: Elasticsearch client.
+    :param index: index of the annotation items.
+    :param docType: type of the annotation items.
+    :param name: name of the annotation task.
+    :param out: output file (opened in binary mode).
+    :param outputFormat: one of jsonl, csv and parquet.
+    :param query: optional extra filter of the exported items.
+    :param scanSize: number of items retrieved per scroll request.
+    :param duplicateType: if given, also export the near-duplicates recorded with this document type.
+    :param documentIndex: index of the tweets referenced by the items (if the task was created with a document index).
+    :return: dictionary with the statistics of the whole task ("all") and of each context ("contexts").
+    """
+    writer = WRITERS[outputFormat](out)
+    overall = AgreementAccumulator()
+    contexts = {}
+
+    hits = scan(es, index=index, doc_type=docType, size=scanSize, _source_include=",".join(SOURCE_FIELDS),
+                query={"query": taskFilter(name, query)})
+    if documentIndex is not None:
+        # Small cache: each tweet is referenced by a few items of the task, usually close to each other.
+        hits = withDocuments(hits, DocumentStore(es, index=documentIndex, cacheSize=10 * scanSize), scanSize)
+
+    count = 0
+    for hit in hits:
+        record = itemRecord(hit)
+        writer.write(record)
+
+        if record["invalid"] is None:
+            annotations = [(ann["annotatorId"], ann["annotation"]) for ann in record["annotations"]]
+            overall.add(annotations)
+            acc = contexts.get(record["context"])
+            if acc is None:
+                acc = contexts[record["context"]] = AgreementAccumulator()
+            acc.add(annotations)
+
+        count += 1
+        if count % 10000 == 0:
+            stdout.write('.')
+            stdout.flush()
+
+    numDuplicates = 0
+    if duplicateType is not None:
+        for record in duplicateRecords(es, index, docType, duplicateType, name, scanSize):
+            writer.write(record)
+            numDuplicates += 1
+
+    writer.close()
+    if count >= 10000:
+        stdout.write('\n')
+    print 'Exported %d items and %d near-duplicates' % (count, numDuplicates)
+
+    return {
+        "all": overall.summary(),
+        "contexts": dict((context, acc.summary()) for (context, acc) in contexts.iteritems())
+    }
+
+
+def partitionPath(outputDir, until, outputFormat):
+    """
+    Return the path of the file of the export whose window ends at the given time.
+    """
+    return os.path.join(outputDir, until.strftime("date=%Y-%m-%d"),
+                        "part-%s.%s" % (until.strftime("%Y%m%dT%H%M%S"), outputFormat))
+
+
+def export_incremental(es, index, docType, name, outputDir, checkpointPath=None, outputFormat="jsonl", lag=60.0,
+                       scanSize=1000, documentIndex=None):
+    """
+    Export the items of the given annotation task updated since the previous incremental export (all items in the
+    first one) to a new file of the given output directory and return their agreement statistics (see the module
+    docstring).
+
+    :param outputDir: output directory of the task (files are partitioned by date).
+    :param checkpointPath: checkpoint of the incremental exports (default is checkpoint.json in outputDir).
+    :param lag: time (in seconds) between the end of the window of the export and its start.
+    :return: dictionary with the statistics of the exported items ("all") and of each context ("contexts").
+    """
+    if checkpointPath is None:
+        checkpointPath = os.path.join(outputDir, "checkpoint.json")
+    checkpoint = loadCheckpoint(checkpointPath)
+    if len(checkpoint) > 0 and (checkpoint["name"], checkpoint["index"]) != (name, index):
+        raise Exception("Checkpoint %s belongs to task %s (index %s)" % (
+            checkpointPath, checkpoint["name"], checkpoint["index"]))
+
+    # Updates after the mapping change are searchable. Older ones are included in the first (full) export.
+    checkUpdatedField(es, index, docType)
+
+    since = checkpoint.get("until")
+    until = datetime.now(tz.tzlocal()) - timedelta(seconds=lag)
+    query = None
+    if since is not None:
+        query = {"range": {"updated": {"gte": since, "lt": until.isoformat()}}}
+        print 'Exporting items updated from %s to %s' % (since, until.isoformat())
+    else:
+        print 'No checkpoint: exporting all items'
+
+    path = partitionPath(outputDir, until, outputFormat)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    # Write to a temporary file, so consumers never read a partial export.
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as out:
+        stats = export_annotations(es, index=index, docType=docType, name=name, out=out, outputFormat=outputFormat,
+                                   query=query, scanSize=scanSize, documentIndex=documentIndex)
+    os.rename(tmpPath, path)
+
+    saveCheckpoint(checkpointPath, {"name": name, "index": index, "since": since, "until": until.isoformat(),
+                                    "file": path})
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the items of an annotation task.")
+    parser.add_argument("--name", required=True, help="name of the annotation task")
+    parser.add_argument("--index", default="ctrls_annotation_no_retweet", help="index of the annotation items")
+    parser.add_argument("--alias",
+                        help="alias shared by the tasks (see create_annotation_task.py --alias); items are read from "
+                             "the task alias (<alias>_<task name>) instead of --index")
+    parser.add_argument("--type", default="relevance", help="type of the annotation items")
+    parser.add_argument("--format", choices=sorted(WRITERS.keys()), default="jsonl", help="output format")
+    parser.add_argument("--output", help="output file")
+    parser.add_argument("--incremental", metavar="DIR",
+                        help="export only the items updated since the previous incremental export to a new file of "
+                             "this directory (instead of --output)")
+    parser.add_argument("--checkpoint", help="checkpoint of the incremental exports (default is DIR/checkpoint.json)")
+    parser.add_argument("--lag", type=float, default=60.0,
+                        help="time (in seconds) between the end of the window of an incremental export and its start")
+    parser.add_argument("--stats", help="file to write the agreement statistics (JSON); default is stdout")
+    parser.add_argument("--propagate-duplicates", action="store_true",
+                        help="also export near-duplicates labeled as their representatives")
+    parser.add_argument("--duplicate-type", default="duplicate", help="type of the near-duplicate records")
+    parser.add_argument("--doc-index", help="index of the tweets referenced by the items (see document_store.py)")
+    args = parser.parse_args()
+
+    if (args.output is None) == (args.incremental is None):
+        parser.error("exactly one of --output and --incremental is required")
+    if args.incremental is not None and args.propagate_duplicates:
+        parser.error("--propagate-duplicates requires a full export (--output)")
+
+    es = createElasticsearchClient(idempotent=True)
+
+    index = args.index
+    if args.alias is not None:
+        index = taskAliasName(args.alias, args.name)
+
+    if args.incremental is not None:
+        stats = export_incremental(es, index=index, docType=args.type, name=args.name, outputDir=args.incremental,
+                                   checkpointPath=args.checkpoint, outputFormat=args.format, lag=args.lag,
+                                   documentIndex=args.doc_index)
+    else:
+        with open(args.output, "wb") as out:
+            stats = export_annotations(es, index=index, docType=args.type, name=args.name, out=out,
+                                       outputFormat=args.format,
+                                       duplicateType=args.duplicate_type if args.propagate_duplicates else None,
+                                       documentIndex=args.doc_index)
+
+    if args.stats is not None:
+        with open(args.stats, "w") as f:
+            json.dump(stats, f, indent=2)
+    else:
+        print json.dumps(stats, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# coding=utf-8
+import glob
+import gzip
+import io
+import json
+import mmap
+from contextlib import closing
+
+
+def openLines(path, useMmap=False):
+    """
+    Return an iterator over the lines of the given file. Files ending with .gz and .zst are decompressed on the fly
+    (zstd requires the zstandard package). Uncompressed files can be memory-mapped (useMmap), which avoids copying
+    their content through Python file buffers.
+    """
+    if path.endswith(".gz"):
+        return _fileLines(gzip.open(path, "rb"))
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("Reading %s requires zstandard (pip install zstandard)" % path)
+        f = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(f)
+        return _fileLines(io.BufferedReader(reader, buffer_size=1 << 20), f)
+    if useMmap:
+        return _mmapLines(path)
+    return _fileLines(open(path, "rb", 1 << 20))
+
+
+def _fileLines(f, *others):
+    try:
+        for line in f:
+            yield line
+    finally:
+        f.close()
+        for o in others:
+            o.close()
+
+
+def _mmapLines(path):
+    with open(path, "rb") as f:
+        # Empty files cannot be mapped.
+        f.seek(0, 2)
+        if f.tell() == 0:
+            return
+        with closing(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) as m:
+            line = m.readline()
+            while line:
+                yield line
+                line = m.readline()
+
+
+def readDocuments(paths, useMmap=False, logger=None):
+    """
+    Generate source documents from JSONL files, in the same format of the hits returned by elasticsearch.helpers.scan
+    over the tweet indices (dictionaries with _id and _source), so that they can be fed to create_annotation_task
+    instead of an Elasticsearch scan.
+
+    Each line is either a document as stored in the tweet indices (including the tweet key) or a raw tweet from the
+    Twitter API, which is wrapped in a document ({"tweet": tweet}). The document id is the id_str of the tweet. Lines
+    are parsed one by one, so memory usage does not depend on the file sizes.
+
+    :param paths: list of file paths or glob patterns (e.g. dumps/*.jsonl.gz).
+    :param useMmap: memory-map uncompressed files.
+    :param logger: optional logger to report lines that cannot be parsed (they are skipped).
+    """
+    if isinstance(paths, basestring):
+        paths = [paths]
+    for pattern in paths:
+        files = sorted(glob.glob(pattern)) or [pattern]
+        for path in files:
+            for (num, line) in enumerate(openLines(path, useMmap)):
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    doc = json.loads(line)
+                except ValueError:
+                    if logger is not None:
+                        logger.warning("Invalid JSON in %s:%d" % (path, num + 1))
+                    continue
+                if "tweet" not in doc:
+                    doc = {"tweet": doc}
+                yield {
+                    "_id": doc["tweet"]["id_str"],
+                    "_source": doc
+                }
@@ -0,0 +1,101 @@
+# coding=utf-8
+import re
+from contextlib import contextmanager
+
+_INVALID_INDEX_CHARS = re.compile(r"[^a-z0-9_\-]+")
+
+
+def taskAliasName(prefix, name):
+    """
+    Return the alias of the given task, e.g. ctrls_annotation_supernatural (lowercase, without invalid characters).
+    The task alias points only to the index of the task, so queries through it search only the shards of the task.
+    """
+    return "%s_%s" % (prefix, _INVALID_INDEX_CHARS.sub("_", name.lower()))
+
+
+def taskIndexPrefix(prefix, name):
+    """
+    Return the common prefix of the indices of the given task.
+    """
+    return taskAliasName(prefix, name) + "_"
+
+
+def taskIndexName(prefix, name, created):
+    """
+    Return the name of a new index for the items of the given task, e.g. ctrls_annotation_supernatural_20170220163325.
+    """
+    return taskIndexPrefix(prefix, name) + created.strftime("%Y%m%d%H%M%S")
+
+
+@contextmanager
+def bulkLoading(es, index, forceMerge=False, maxNumSegments=1, logger=None):
+    """
+    Prepare the given index for a bulk load and restore it afterwards.
+
+    During the load, the index is not refreshed (refresh_interval -1) and has no replicas, so each document is indexed
+    once and segments are not flushed every second. Afterwards, the previous refresh interval and number of replicas
+    are restored (even if the load fails) and the index is refreshed. Optionally, the index is force-merged to
+    maxNumSegments segments, so the serving queries search a few large segments instead of many small ones.
+    """
+    settings = es.indices.get_settings(index=index)[index]["settings"]["index"]
+    refreshInterval = settings.get("refresh_interval")
+    numReplicas = settings.get("number_of_replicas")
+
+    es.indices.put_settings(index=index, body={
+        "index": {
+            "refresh_interval": "-1",
+            "number_of_replicas": 0
+        }
+    })
+    try:
+        yield
+    finally:
+        # A null refresh interval resets it to the default.
+        es.indices.put_settings(index=index, body={
+            "index": {
+                "refresh_interval": refreshInterval,
+                "number_of_replicas": numReplicas
+            }
+        })
+        es.indices.refresh(index=index)
+
+    if forceMerge:
+        if logger is not None:
+            logger.info("Force-merging %s to %d segment(s)" % (index, maxNumSegments))
+        es.indices.forcemerge(index=index, max_num_segments=maxNumSegments)
+
+
+def publishTaskIndex(es, prefix, name, index, previousIndices=None):
+    """
+    Publish the index of the given task: in a single atomic request, the index replaces the previous indices of the
+    task both in the task alias (taskAliasName) and in the shared alias (prefix), which spans all tasks. Readers of
+    either alias see the previous indices or the new one, never both nor a partially loaded index. Aliases and
+    indices share the same namespace, so neither alias may be the name of an index.
+
+    :param previousIndices: indices replaced by the new one (default is the current indices of the task alias).
+    :return: name of the task alias.
+    """
+    taskAlias = taskAliasName(prefix, name)
+    for alias in (prefix, taskAlias):
+        if not es.indices.exists_alias(name=alias) and es.indices.exists(index=alias):
+            raise Exception("Cannot publish task %s in alias %s: there is an index with this name" % (name, alias))
+    if previousIndices is None:
+        previousIndices = aliasIndices(es, taskAlias)
+    actions = _swapActions(prefix, index, previousIndices) + _swapActions(taskAlias, index, previousIndices)
+    es.indices.update_aliases(body={"actions": actions})
+    return taskAlias
+
+
+def _swapActions(alias, index, previousIndices):
+    actions = [{"remove": {"index": previous, "alias": alias}} for previous in previousIndices if previous != index]
+    actions.append({"add": {"index": index, "alias": alias}})
+    return actions
+
+
+def aliasIndices(es, alias):
+    """
+    Return the list of indices of the given alias (empty if the alias does not exist).
+    """
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias).keys())
@@ -0,0 +1,51 @@
+# coding=utf-8
+import time
+
+import metrics
+from tracing import tracer
+
+
+class InstrumentedElasticsearch(object):
+    """
+    Proxy to an Elasticsearch client that measures the latency of each call. Any attribute not related to the
+    measured operations (e.g. transport, indices) is delegated to the wrapped client, so this proxy can be used
+    wherever an Elasticsearch client is expected (including elasticsearch.helpers and IndicesClient).
+
+    Calls issued by elasticsearch.helpers.scan (search with scroll, scroll and clear_scroll) are accounted as the
+    "scan" operation. Each call is also recorded as a span of the active trace (if tracing is enabled).
+
+    Optionally, the proxy sets the timeout of specific operations (request_timeout), unless the caller gives one.
+    """
+
+    OPERATIONS = ("search", "scroll", "clear_scroll", "update", "get", "index", "bulk", "mget", "msearch", "count",
+                  "delete")
+
+    def __init__(self, client, requestTimeouts=None):
+        """
+        :param client: Elasticsearch client.
+        :param requestTimeouts: dictionary with the timeout (in seconds) of some operations (e.g. {"bulk": 120}).
+        """
+        self.client = client
+        self.requestTimeouts = requestTimeouts or {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name not in self.OPERATIONS:
+            return attr
+
+        timeout = self.requestTimeouts.get(name)
+
+        def measured(*args, **kwargs):
+            if timeout is not None:
+                kwargs.setdefault("request_timeout", timeout)
+            operation = name
+            if name in ("scroll", "clear_scroll") or (name == "search" and "scroll" in kwargs):
+                operation = "scan"
+            start = time.time()
+            try:
+                with tracer.span("es." + name, index=kwargs.get("index")):
+                    return attr(*args, **kwargs)
+            finally:
+                metrics.esRequestSeconds.labels(operation).observe(time.time() - start)
+
+        return measured
@@ -0,0 +1,266 @@
+# coding=utf-8
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+
+class Metric(object):
+    """
+    Base class for metrics exported in the Prometheus text format. A metric has a name, a help text and a list of
+    label names. Each combination of label values is a child of the metric that stores its own value(s).
+    """
+
+    type = None
+
+    def __init__(self, name, help, labelNames=()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self._lock = Lock()
+        self._children = {}
+
+    def labels(self, *labelValues):
+        """
+        Return the child associated with the given label values (in the same order of self.labelNames).
+        """
+        if len(labelValues) != len(self.labelNames):
+            raise ValueError("Metric %s expects labels %s" % (self.name, self.labelNames))
+        labelValues = tuple(unicode(v) for v in labelValues)
+        with self._lock:
+            child = self._children.get(labelValues)
+            if child is None:
+                child = self._children[labelValues] = self._newChild()
+            return child
+
+    def samples(self):
+        """
+        Return a list of (suffix, labels, value) tuples, where labels is a list of (name, value) pairs.
+        """
+        with self._lock:
+            children = self._children.items()
+        samples = []
+        for (labelValues, child) in sorted(children):
+            labels = zip(self.labelNames, labelValues)
+            samples += child.samples(labels)
+        return samples
+
+    def _newChild(self):
+        raise NotImplementedError()
+
+
+class _CounterChild:
+    def __init__(self):
+        self.__lock = Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.value += amount
+
+    def samples(self, labels):
+        return [("_total", labels, self.value)]
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value (e.g. number of annotations). Use the PromQL rate() function to get per-second
+    values.
+    """
+
+    type = "counter"
+
+    def _newChild(self):
+        return _CounterChild()
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, labels):
+        return [("", labels, self.value)]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down.
+    """
+
+    type = "gauge"
+
+    def _newChild(self):
+        return _GaugeChild()
+
+
+class CallbackGauge(Metric):
+    """
+    Gauge whose values are computed by a callback at scrape time. The callback returns a list of
+    (labelValues, value) pairs, in which labelValues is a tuple ordered as self.labelNames.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelNames, callback):
+        super(CallbackGauge, self).__init__(name, help, labelNames)
+        self.callback = callback
+
+    def samples(self):
+        samples = []
+        for (labelValues, value) in self.callback():
+            samples.append(("", zip(self.labelNames, labelValues), value))
+        return samples
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.__lock = Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with self.__lock:
+            for i in xrange(len(self.buckets)):
+                if value <= self.buckets[i]:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """
+        Observe the time (in seconds) spent within the context.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start)
+
+    def samples(self, labels):
+        with self.__lock:
+            counts = list(self.counts)
+            count = self.count
+            _sum = self.sum
+        samples = []
+        cumulative = 0
+        for (bound, n) in zip(self.buckets, counts):
+            cumulative += n
+            samples.append(("_bucket", labels + [("le", _formatValue(bound))], cumulative))
+        samples.append(("_bucket", labels + [("le", "+Inf")], count))
+        samples.append(("_sum", labels, _sum))
+        samples.append(("_count", labels, count))
+        return samples
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values (e.g. latencies in seconds) within fixed buckets.
+    """
+
+    type = "histogram"
+
+    DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, help, labelNames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labelNames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _newChild(self):
+        return _HistogramChild(self.buckets)
+
+
+class Registry:
+    """
+    Set of metrics exported by the application.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__metrics = []
+
+    def register(self, metric):
+        with self.__lock:
+            self.__metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelNames=()):
+        return self.register(Counter(name, help, labelNames))
+
+    def gauge(self, name, help, labelNames=()):
+        return self.register(Gauge(name, help, labelNames))
+
+    def callbackGauge(self, name, help, labelNames, callback):
+        return self.register(CallbackGauge(name, help, labelNames, callback))
+
+    def histogram(self, name, help, labelNames=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelNames, buckets))
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        with self.__lock:
+            metrics = list(self.__metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append(u"# HELP %s %s" % (metric.name, metric.help))
+            lines.append(u"# TYPE %s %s" % (metric.name, metric.type))
+            for (suffix, labels, value) in metric.samples():
+                if len(labels) > 0:
+                    labelStr = u",".join(u'%s="%s"' % (k, _escape(v)) for (k, v) in labels)
+                    lines.append(u"%s%s{%s} %s" % (metric.name, suffix, labelStr, _formatValue(value)))
+                else:
+                    lines.append(u"%s%s %s" % (metric.name, suffix, _formatValue(value)))
+        return u"\n".join(lines) + u"\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return unicode(value).replace(u"\\", u"\\\\").replace(u"\n", u"\\n").replace(u'"', u'\\"')
+
+
+def _formatValue(value):
+    if value is None:
+        return u"NaN"
+    return repr(float(value))
+
+
+#
+# Application-wide registry and metrics.
+#
+registry = Registry()
+
+annotationsTotal = registry.counter(
+    "annotation_annotations", "Number of annotation actions (annotate, skip or invalidate) per context.",
+    ("context", "action"))
+
+lockWaitSeconds = registry.histogram(
+    "annotation_lock_wait_seconds", "Time spent waiting for the annotation manager lock.", ("context",),
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1.0, 5.0))
+
+esRequestSeconds = registry.histogram(
+    "elasticsearch_request_duration_seconds", "Latency of Elasticsearch calls per operation.", ("operation",))
+
+oEmbedRequestSeconds = registry.histogram(
+    "oembed_request_duration_seconds", "Latency of the requests to the Twitter oEmbed API.")
+
+oEmbedCacheRequests = registry.counter(
+    "oembed_cache_requests", "Lookups in the oEmbed cache by result (hit or miss).", ("result",))
+
+documentCacheRequests = registry.counter(
+    "document_cache_requests", "Lookups in the shared document cache by result (hit or miss).", ("result",))
+
+httpRequestSeconds = registry.histogram(
+    "http_request_duration_seconds", "Latency of the web app requests per route.", ("route", "method", "status"))
+
+requestLogRecords = registry.counter(
+    "request_log_records", "Records of the structured request log by result (written or dropped).", ("result",))
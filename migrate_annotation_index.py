@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copy the annotation items (and near-duplicate records) of an index to a new index with the lean mappings of
+annotation_mappings.py, and report the size of both indices and the ingest rate of the copy.
+
+Items keep their ids, so the target index can replace the source one in context_config.json (index key) once the
+migration is done. Optionally, the index template is also installed, so that indices created later by the task
+creation scripts get the lean mappings even if they are created by bulk requests.
+
+A task of the shared index can also be moved to its own index: with --name and --alias, only the items of the task are
+copied and the target index is published in the task alias (see ingest_lifecycle.publishTaskIndex), which the context
+of the task should then use (alias key in context_config.json). Aliases and indices share the same namespace, so the
+alias (and the task alias) must not be the name of an existing index.
+
+Usage:
+
+    python migrate_annotation_index.py --source ctrls_annotation_no_retweet --target ctrls_annotation_v2 \\
+        --template "ctrls_annotation*"
+
+    python migrate_annotation_index.py --source ctrls_annotation_no_retweet \\
+        --target ctrls_annotation_supernatural_20170220163325 --name supernatural --alias ctrls_annotation --shards 1
+"""
+import argparse
+import time
+from sys import stdout
+
+from elasticsearch.helpers import scan, bulk
+
+from annotation_mappings import checkIndexAndType, checkDuplicateType, putAnnotationTemplate
+from es_client import createElasticsearchClient
+from ingest_lifecycle import publishTaskIndex
+
+
+def indexStats(es, index):
+    """
+    Return the number of documents and the store size (in bytes) of the given index.
+    """
+    stats = es.indices.stats(index=index, metric="docs,store")["indices"][index]["primaries"]
+    return stats["docs"]["count"], stats["store"]["size_in_bytes"]
+
+
+def copyType(es, source, target, docType, name=None, chunkSize=1000):
+    """
+    Copy all documents (optionally, only the ones of the given task) of the given type from the source index to the
+    target index, keeping their ids.
+
+    :return: pair (number of copied documents, elapsed time in seconds).
+    """
+    query = {"query": {"match_all": {}}}
+    if name is not None:
+        query = {"query": {"bool": {"filter": [{"term": {"name": name}}]}}}
+
+    counter = [0]
+
+    def actions():
+        for hit in scan(es, index=source, doc_type=docType, query=query, size=chunkSize):
+            yield {
+                '_op_type': 'index',
+                '_index': target,
+                '_type': docType,
+                '_id': hit["_id"],
+                '_source': hit["_source"]
+            }
+            counter[0] += 1
+            if counter[0] % 10000 == 0:
+                stdout.write('.')
+                stdout.flush()
+
+    start = time.time()
+    bulk(es, actions(), chunk_size=chunkSize)
+    elapsed = time.time() - start
+    if counter[0] >= 10000:
+        stdout.write('\n')
+    return counter[0], elapsed
+
+
+def migrate(es, source, target, docType="relevance", duplicateType="duplicate", name=None, chunkSize=1000,
+            numberOfShards=None):
+    """
+    Migrate the given index and print the before/after numbers.
+    """
+    checkIndexAndType(es, index=target, docType=docType,
+                      settings={"number_of_shards": numberOfShards} if numberOfShards is not None else None)
+
+    (numItems, itemsTime) = copyType(es, source, target, docType, name, chunkSize)
+    print 'Copied %d items in %.1fs (%.0f docs/s)' % (numItems, itemsTime, numItems / max(itemsTime, 1e-9))
+
+    if es.indices.exists_type(index=source, doc_type=duplicateType):
+        checkDuplicateType(es, index=target, docType=duplicateType)
+        (numDuplicates, duplicatesTime) = copyType(es, source, target, duplicateType, name, chunkSize)
+        print 'Copied %d near-duplicate records in %.1fs (%.0f docs/s)' % (
+            numDuplicates, duplicatesTime, numDuplicates / max(duplicatesTime, 1e-9))
+
+    es.indices.refresh(index=target)
+
+    print
+    print '%-40s %12s %14s %10s' % ("index", "docs", "size (bytes)", "bytes/doc")
+    for index in (source, target):
+        (count, size) = indexStats(es, index)
+        print '%-40s %12d %14d %10.0f' % (index, count, size, size / float(max(count, 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate annotation items to an index with lean mappings.")
+    parser.add_argument("--source", required=True, help="current index of the annotation items")
+    parser.add_argument("--target", required=True, help="new index (created with the lean mappings)")
+    parser.add_argument("--type", default="relevance", help="type of the annotation items")
+    parser.add_argument("--duplicate-type", default="duplicate", help="type of the near-duplicate records")
+    parser.add_argument("--name", help="migrate only the items of this task")
+    parser.add_argument("--template", help="also install the index template for indices matching this pattern")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="number of documents per scroll/bulk request")
+    parser.add_argument("--alias", help="publish the target index in the task alias (<alias>_<name>); requires --name. "
+                                        "No index may have the name of the alias")
+    parser.add_argument("--shards", type=int, help="number of shards of the target index")
+    args = parser.parse_args()
+
+    if args.alias is not None and args.name is None:
+        parser.error("--alias requires --name")
+
+    es = createElasticsearchClient(idempotent=True)
+
+    if args.template is not None:
+        putAnnotationTemplate(es, args.template, docType=args.type, duplicateType=args.duplicate_type)
+
+    migrate(es, args.source, args.target, docType=args.type, duplicateType=args.duplicate_type, name=args.name,
+            chunkSize=args.chunk_size, numberOfShards=args.shards)
+
+    if args.alias is not None:
+        taskAlias = publishTaskIndex(es, args.alias, args.name, args.target)
+        print
+        print 'Task %s published in the aliases %s and %s' % (args.name, args.alias, taskAlias)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# coding=utf-8
+import re
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Mersenne prime used by the MinHash permutations.
+_PRIME = (1 << 31) - 1
+
+_URL = re.compile(r"https?://\S+", re.UNICODE)
+_MENTION = re.compile(r"@\w+", re.UNICODE)
+_RETWEET = re.compile(r"^rt\b", re.UNICODE)
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalizeText(text):
+    """
+    Normalize a tweet text for near-duplicate detection: lowercase, without URLs, mentions, retweet marks and
+    punctuation.
+    """
+    text = text.lower()
+    text = _URL.sub(u" ", text)
+    text = _MENTION.sub(u" ", text)
+    text = _NON_WORD.sub(u" ", text).strip()
+    text = _RETWEET.sub(u"", text).strip()
+    return text
+
+
+class NearDuplicateDetector:
+    """
+    Cluster near-duplicate texts of a stream with MinHash and locality-sensitive hashing (LSH).
+
+    Each text is normalized (normalizeText) and represented by the set of its character shingles. Its MinHash
+    signature (numPerm values) estimates the Jaccard similarity between shingle sets, and it is split in bands of
+    numPerm / numBands values. Two texts with some identical band are candidates, and a candidate is a near-duplicate
+    when the similarity estimated by the whole signatures is at least threshold. The first text of each cluster is its
+    representative; later texts are assigned to the cluster of their most similar representative.
+
+    Memory is bounded: at most maxRepresentatives representatives (with their signatures and band buckets) are kept,
+    and the least recently matched ones are forgotten first. Thus, near-duplicates of a forgotten representative start
+    a new cluster, which is acceptable for streams of tweets where duplicates are close in time.
+    """
+
+    def __init__(self, numPerm=64, numBands=16, shingleSize=5, threshold=0.7, maxRepresentatives=200000, seed=13):
+        """
+        :param numPerm: number of hash functions (size of the signatures).
+        :param numBands: number of LSH bands (must divide numPerm).
+        :param shingleSize: number of characters in each shingle.
+        :param threshold: minimum estimated Jaccard similarity of near-duplicates.
+        :param maxRepresentatives: maximum number of cluster representatives kept in memory.
+        :param seed: random seed of the hash functions.
+        """
+        if numPerm % numBands != 0:
+            raise ValueError("numBands (%d) must divide numPerm (%d)" % (numBands, numPerm))
+        self.numPerm = numPerm
+        self.numBands = numBands
+        self.rowsPerBand = numPerm / numBands
+        self.shingleSize = shingleSize
+        self.threshold = threshold
+        self.maxRepresentatives = maxRepresentatives
+
+        rand = np.random.RandomState(seed)
+        self.__a = rand.randint(1, _PRIME, size=numPerm).astype(np.uint64)
+        self.__b = rand.randint(0, _PRIME, size=numPerm).astype(np.uint64)
+
+        # Signature of each representative (least recently matched first).
+        self.__representatives = OrderedDict()
+
+        # One dictionary per band from the band values to a representative.
+        self.__buckets = [{} for _ in xrange(numBands)]
+
+        self.numTexts = 0
+        self.numDuplicates = 0
+
+    def signature(self, text):
+        """
+        Return the MinHash signature of the given text or None if the normalized text is empty.
+        """
+        text = normalizeText(text)
+        if len(text) == 0:
+            return None
+        k = min(self.shingleSize, len(text))
+        shingles = set(text[i:i + k] for i in xrange(len(text) - k + 1))
+        x = np.array([zlib.crc32(s.encode("utf-8")) & 0xffffffff for s in shingles], dtype=np.uint64) % _PRIME
+        return ((self.__a[:, None] * x[None, :] + self.__b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def assign(self, key, text):
+        """
+        Assign the given text to a cluster.
+
+        :param key: identifier of the text (e.g. the tweet id).
+        :param text: text to be clustered.
+        :return: pair (representative, similarity). The representative is the key of the representative of the
+            cluster (the given key itself when the text starts a new cluster) and similarity is the estimated similarity
+            between both texts.
+        """
+        self.numTexts += 1
+        sig = self.signature(text)
+        if sig is None:
+            return key, 1.0
+
+        bands = self.__bands(sig)
+
+        # Most similar candidate.
+        best = None
+        bestSimilarity = 0.0
+        for (i, band) in enumerate(bands):
+            candidate = self.__buckets[i].get(band)
+            if candidate is None or candidate == best:
+                continue
+            candidateSig = self.__representatives.get(candidate)
+            if candidateSig is None:
+                continue
+            similarity = float(np.count_nonzero(candidateSig == sig)) / self.numPerm
+            if similarity > bestSimilarity:
+                best = candidate
+                bestSimilarity = similarity
+
+        if best is not None and bestSimilarity >= self.threshold:
+            # Mark the representative as recently used.
+            self.__representatives[best] = self.__representatives.pop(best)
+            self.numDuplicates += 1
+            return best, bestSimilarity
+
+        # New cluster.
+        self.__representatives[key] = sig
+        for (i, band) in enumerate(bands):
+            self.__buckets[i][band] = key
+        if len(self.__representatives) > self.maxRepresentatives:
+            self.__forget()
+        return key, 1.0
+
+    def __bands(self, sig):
+        r = self.rowsPerBand
+        return [sig[i * r:(i + 1) * r].tostring() for i in xrange(self.numBands)]
+
+    def __forget(self):
+        """
+        Remove the least recently matched representative.
+        """
+        (key, sig) = self.__representatives.popitem(last=False)
+        for (i, band) in enumerate(self.__bands(sig)):
+            if self.__buckets[i].get(band) == key:
+                del self.__buckets[i][band]
+
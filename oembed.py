@@ -0,0 +1,126 @@
+# coding=utf-8
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import requests
+
+import metrics
+from tracing import tracer
+
+
+class OEmbedClient:
+    """
+    Client to the Twitter oEmbed API that returns the HTML used to embed a tweet in the annotation page.
+
+    Successful responses are kept in a LRU cache, since the same tweet is usually rendered several times (page reloads,
+    one time for each annotator of the item, etc.) and the embed HTML does not change. Failed responses are not cached,
+    because the caller invalidates the corresponding item anyway.
+    """
+
+    # Status codes of tweets that cannot be embedded anymore (removed tweets, protected or suspended accounts).
+    DEAD_STATUS_CODES = (403, 404)
+
+    def __init__(self, endpoint='https://publish.twitter.com/oembed', cacheSize=10000, timeout=10):
+        """
+        :param endpoint: URL of the oEmbed API.
+        :param cacheSize: maximum number of embed HTMLs kept in the cache.
+        :param timeout: timeout (in seconds) for each request to the oEmbed API.
+        """
+        self.endpoint = endpoint
+        self.cacheSize = cacheSize
+        self.timeout = timeout
+
+        # Reuse HTTP connections among requests.
+        self.__http = requests.Session()
+
+        self.__lock = Lock()
+        self.__cache = OrderedDict()
+
+    def getTweetHtml(self, tweet):
+        """
+        Return the embed HTML of the given tweet.
+
+        :param tweet: tweet dictionary (as returned by the Twitter API).
+        :return: a pair (html, cause). If the HTML could not be retrieved, html is None and cause describes the
+            problem.
+        """
+        tweetUrl = self.tweetUrl(tweet)
+
+        with self.__lock:
+            html = self.__cache.get(tweetUrl)
+            if html is not None:
+                # Move the entry to the end (most recently used).
+                del self.__cache[tweetUrl]
+                self.__cache[tweetUrl] = html
+
+        if html is not None:
+            metrics.oEmbedCacheRequests.labels("hit").inc()
+            return html, None
+
+        metrics.oEmbedCacheRequests.labels("miss").inc()
+
+        (statusCode, html, cause) = self.__fetch(tweetUrl)
+        if html is None:
+            return None, cause
+
+        with self.__lock:
+            self.__cache[tweetUrl] = html
+            if len(self.__cache) > self.cacheSize:
+                # Remove the least recently used entry.
+                self.__cache.popitem(last=False)
+
+        return html, None
+
+    def checkTweet(self, tweet):
+        """
+        Check whether the given tweet can still be embedded. The cache is not used, so this always queries the oEmbed
+        API (see sweep_dead_tweets.py).
+
+        :param tweet: tweet dictionary (as returned by the Twitter API).
+        :return: a pair (alive, cause). alive is True if the tweet can be embedded, False if it cannot anymore (cause
+            describes the problem in the same way as getTweetHtml) and None if the check failed for another reason
+            (e.g. rate limit, server or connection errors), so the tweet must be checked again later.
+        """
+        try:
+            (statusCode, html, cause) = self.__fetch(self.tweetUrl(tweet))
+        except requests.RequestException as e:
+            return None, "Request error: %s" % e
+        if html is not None:
+            return True, None
+        if statusCode == 200 or statusCode in self.DEAD_STATUS_CODES:
+            return False, cause
+        return None, cause
+
+    @staticmethod
+    def tweetUrl(tweet):
+        return 'https://twitter.com/%s/status/%s' % (tweet["user"]["screen_name"], tweet["id_str"])
+
+    def __fetch(self, tweetUrl):
+        """
+        Request the embed HTML of the given tweet to the oEmbed API.
+
+        :return: a triple (status code, html, cause). If the HTML could not be retrieved, html is None and cause
+            describes the problem.
+        """
+        start = time.time()
+        try:
+            with tracer.span("oembed.get", url=tweetUrl):
+                oEmbedResp = self.__http.get(self.endpoint, params={"hide_thread": "t", "url": tweetUrl},
+                                             timeout=self.timeout)
+        finally:
+            metrics.oEmbedRequestSeconds.labels().observe(time.time() - start)
+
+        if oEmbedResp.status_code != 200:
+            # Não retornou com sucesso (por alguma razão que desconheço).
+            return oEmbedResp.status_code, None, "Unexpected status code %d" % oEmbedResp.status_code
+
+        # Load the returned tweet JSON.
+        tweetJson = json.loads(oEmbedResp.content)
+
+        if 'html' not in tweetJson:
+            # A API do Twitter retornou algum erro. Em geral, o tweet foi removido ou não é mais público.
+            return oEmbedResp.status_code, None, "Tweet nulo!"
+
+        return oEmbedResp.status_code, tweetJson['html'], None
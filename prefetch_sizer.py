@@ -0,0 +1,143 @@
+# coding=utf-8
+import time
+from collections import deque
+from math import ceil
+
+
+class PrefetchSizer:
+    """
+    Decide how many unannotated items an annotation manager should keep prefetched in memory.
+
+    The sizer measures two quantities: the rate (items/sec) in which annotators consume unannotated items and the
+    latency of the queries that refill the buffer. The buffer must hold, at least, the items that will be consumed while
+    a refill is running (otherwise annotators block waiting for the producer) plus the items consumed during a refill
+    horizon (so that the producer does not need to query Elasticsearch too frequently). Both bounds are multiplied by a
+    safety factor and the resulting size is clamped to [minSize, maxSize].
+
+    All methods must be called while holding the manager refill lock.
+    """
+
+    def __init__(self, initialSize=100, minSize=20, maxSize=2000, window=60, horizon=30.0, safetyFactor=2.0,
+                 smoothing=0.3):
+        """
+        :param initialSize: buffer size used before any throughput is measured.
+        :param minSize: minimum buffer size.
+        :param maxSize: maximum buffer size.
+        :param window: length (in seconds) of the sliding window used to measure the consumption rate.
+        :param horizon: number of seconds of consumption that each refill should cover.
+        :param safetyFactor: multiplier applied to the number of items consumed during a refill.
+        :param smoothing: weight of the last observation in the moving average of the refill latency.
+        """
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.window = window
+        self.horizon = horizon
+        self.safetyFactor = safetyFactor
+        self.smoothing = smoothing
+
+        # Current buffer size.
+        self.size = self.__clamp(initialSize)
+
+        # Moving average of the refill latency (in seconds). None until the first refill.
+        self.refillLatency = None
+
+        # Number of items retrieved by the last refill.
+        self.lastRefillSize = 0
+
+        # Consumption counts per second within the sliding window. Each entry is a list [second, count].
+        self.__consumptions = deque()
+
+        # Time when the measurement started. Used to compute the rate before the first window is complete.
+        self.__start = time.time()
+
+    def consumed(self, numItems=1):
+        """
+        Register that some items were removed from the buffer by annotators.
+
+        :param numItems: number of consumed items.
+        """
+        second = int(time.time())
+        if len(self.__consumptions) > 0 and self.__consumptions[-1][0] == second:
+            self.__consumptions[-1][1] += numItems
+        else:
+            self.__consumptions.append([second, numItems])
+        self.__resize()
+
+    def refilled(self, latency, numItems):
+        """
+        Register a finished refill.
+
+        :param latency: time (in seconds) spent to retrieve the new items.
+        :param numItems: number of retrieved items.
+        """
+        if self.refillLatency is None:
+            self.refillLatency = latency
+        else:
+            self.refillLatency = self.smoothing * latency + (1 - self.smoothing) * self.refillLatency
+        self.lastRefillSize = numItems
+        self.__resize()
+
+    def consumptionRate(self):
+        """
+        Return the number of items consumed per second within the sliding window.
+        """
+        now = time.time()
+        self.__expire(now)
+        elapsed = min(self.window, max(1.0, now - self.__start))
+        return sum(count for (_, count) in self.__consumptions) / elapsed
+
+    def lowWatermark(self):
+        """
+        Return the buffer length below which the producer must refill the buffer. It is half of the buffer size (as
+        it has always been) but never less than the number of items expected to be consumed during one refill.
+        """
+        return min(self.size, max(self.size // 2, self.__itemsDuringRefill()))
+
+    def batchSize(self, numAvailable):
+        """
+        Return the number of items to be retrieved by a refill, given the number of items still in the buffer.
+        """
+        return max(0, self.size - numAvailable)
+
+    def getState(self):
+        """
+        Return a dictionary describing the current sizing.
+        """
+        return {
+            "size": self.size,
+            "minSize": self.minSize,
+            "maxSize": self.maxSize,
+            "lowWatermark": self.lowWatermark(),
+            "consumptionRate": self.consumptionRate(),
+            "refillLatency": self.refillLatency,
+            "lastRefillSize": self.lastRefillSize
+        }
+
+    def __itemsDuringRefill(self):
+        """
+        Estimate (with the safety factor) how many items are consumed while a refill query is running.
+        """
+        if self.refillLatency is None:
+            return 0
+        return int(ceil(self.consumptionRate() * self.refillLatency * self.safetyFactor))
+
+    def __resize(self):
+        """
+        Recompute the buffer size from the current measurements.
+        """
+        if self.refillLatency is None:
+            # Keep the initial size until the refill latency is known.
+            return
+        target = self.consumptionRate() * self.horizon + 2 * self.__itemsDuringRefill()
+        self.size = self.__clamp(int(ceil(target)))
+
+    def __expire(self, now):
+        """
+        Remove consumption counts older than the sliding window.
+        """
+        limit = int(now) - self.window
+        while len(self.__consumptions) > 0 and self.__consumptions[0][0] <= limit:
+            self.__consumptions.popleft()
+
+    def __clamp(self, size):
+        return max(self.minSize, min(self.maxSize, size))
@@ -0,0 +1,120 @@
+# coding=utf-8
+import os
+import re
+import sys
+import thread
+import threading
+import time
+from collections import Counter
+
+# Suffix of numbered thread names (e.g. Thread-12), removed so that equivalent threads are merged in the profile.
+_THREAD_NUMBER = re.compile(r"[-_ ]?\d+$")
+
+
+def threadNames():
+    """
+    Return a dictionary with the name of each thread (key is the thread ident).
+    """
+    return dict((t.ident, t.name) for t in threading.enumerate())
+
+
+def _nativeThreadFunctions():
+    """
+    Return the functions to start an OS thread and to sleep it. When gevent monkey-patched the standard library (see
+    serve_gevent.py), the original functions are returned, so the sampler runs in a real thread and samples whatever
+    greenlet is running, instead of only running when other greenlets yield.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("thread"):
+            return monkey.get_original("thread", "start_new_thread"), monkey.get_original("time", "sleep")
+    except ImportError:
+        pass
+    return thread.start_new_thread, time.sleep
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler of a running process. A background thread takes a snapshot of the stack of
+    every thread (sys._current_frames) at a fixed interval and counts how many times each stack was seen. Threads
+    that wait (for a lock, a refill or I/O) are sampled too, so the profile shows wall-clock time, not only CPU time.
+
+    The result is in the collapsed-stack format read by flamegraph.pl and speedscope: one line per distinct stack,
+    with the frames from the root (the thread name) to the leaf separated by semicolons, followed by the number of
+    samples.
+
+    Only one profile runs at a time.
+    """
+
+    def __init__(self, interval=0.005):
+        """
+        :param interval: default time (in seconds) between two samples.
+        """
+        self.interval = interval
+        self.__lock = threading.Lock()
+
+    def profile(self, duration, interval=None):
+        """
+        Sample all threads for the given duration (in seconds) and return the collapsed stacks, or None if another
+        profile is running.
+
+        :param duration: time (in seconds) to sample.
+        :param interval: time (in seconds) between two samples (default is self.interval).
+        """
+        if not self.__lock.acquire(False):
+            return None
+        try:
+            return collapsedStacks(self.__sample(duration, interval or self.interval))
+        finally:
+            self.__lock.release()
+
+    def __sample(self, duration, interval):
+        startThread, sleep = _nativeThreadFunctions()
+        counts = Counter()
+        state = {"done": False, "error": None}
+
+        def sampler():
+            try:
+                ident = thread.get_ident()
+                end = time.time() + duration
+                while time.time() < end:
+                    names = threadNames()
+                    for (threadId, frame) in sys._current_frames().items():
+                        if threadId != ident:
+                            counts[_stack(names.get(threadId, "thread"), frame)] += 1
+                    sleep(interval)
+            except Exception as e:
+                state["error"] = e
+            finally:
+                state["done"] = True
+
+        startThread(sampler, ())
+
+        # Poll instead of joining: under gevent, time.sleep only suspends the current greenlet.
+        while not state["done"]:
+            time.sleep(0.05)
+        if state["error"] is not None:
+            raise state["error"]
+        return counts
+
+
+def _stack(threadName, frame):
+    """
+    Return the given stack as a tuple of frame labels, from the root (thread name) to the leaf.
+    """
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    labels.append(_THREAD_NUMBER.sub("", threadName))
+    labels.reverse()
+    return tuple(labels)
+
+
+def collapsedStacks(counts):
+    """
+    Return the given stack counts in the collapsed-stack format (most frequent stacks first).
+    """
+    lines = ["%s %d" % (";".join(label.replace(";", ",") for label in stack), n) for (stack, n) in counts.most_common()]
+    return "\n".join(lines) + "\n"
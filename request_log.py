@@ -0,0 +1,79 @@
+# coding=utf-8
+import json
+import logging
+import threading
+from Queue import Queue, Full
+
+import metrics
+
+
+class RequestLog:
+    """
+    Structured log of the requests of the annotation contexts. Each request is appended as one JSON object per line
+    to a JSONL file: start time, context, route, method, status, annotator, duration and the fields related to the
+    items (item id, annotation, batch size, etc.). Unlike the free-text log of the web app, this log can be replayed
+    against a local instance (see benchmarks/replay.py).
+
+    The request threads only enqueue the records. A background thread writes them, so the request path never waits
+    for the disk. If the queue is full (the disk is slower than the traffic), records are dropped and counted in the
+    request_log_records metric.
+    """
+
+    def __init__(self, outputFile="request_log.jsonl", maxQueueSize=10000):
+        """
+        :param outputFile: JSONL file where records are appended.
+        :param maxQueueSize: maximum number of records waiting to be written.
+        """
+        self.outputFile = outputFile
+        self.logger = logging.getLogger(__name__)
+        self.__queue = Queue(maxsize=maxQueueSize)
+        self.__writer = threading.Thread(target=self.__run, name="RequestLogWriter")
+        self.__writer.daemon = True
+        self.__writer.start()
+
+    def log(self, record):
+        """
+        Enqueue the given record (a JSON-serializable dictionary) to be written. It never blocks.
+        """
+        try:
+            self.__queue.put_nowait(record)
+        except Full:
+            metrics.requestLogRecords.labels("dropped").inc()
+
+    def close(self):
+        """
+        Write the records already enqueued and stop the writer thread.
+        """
+        self.__queue.put(None)
+        self.__writer.join()
+
+    def __run(self):
+        with open(self.outputFile, "a") as f:
+            while True:
+                record = self.__queue.get()
+                if record is None:
+                    break
+                try:
+                    f.write(json.dumps(record, ensure_ascii=True) + "\n")
+                    metrics.requestLogRecords.labels("written").inc()
+                except Exception:
+                    self.logger.exception("Error writing the request log")
+                    metrics.requestLogRecords.labels("dropped").inc()
+
+                # Flush only when the queue is drained, so bursts are written at once.
+                if self.__queue.empty():
+                    f.flush()
+
+
+def readRequestLog(path):
+    """
+    Return the records of the given request log (sorted by start time).
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) > 0:
+                records.append(json.loads(line))
+    records.sort(key=lambda record: record["time"])
+    return records
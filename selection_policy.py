@@ -0,0 +1,217 @@
+# coding=utf-8
+import copy
+import heapq
+from itertools import count
+
+
+class SelectionPolicy(object):
+    """
+    Priority queue of partially annotated items, i.e., items that still need annotations. The policy decides which
+    item is returned to an annotator asking for a new one (see AnnotationManager), and subclasses define the priority
+    of items (priority method; lower values come first).
+
+    The queue is a binary heap with one entry per item and the number of missing annotations (copies) of each item.
+    The best item eligible for an annotator (not annotated nor held by it) is found in O(log N), except for the items
+    skipped on the way because the annotator already annotated or holds them. Entries are invalidated lazily: removing
+    an item or changing its priority (update) just makes its current heap entry stale, and stale entries are discarded
+    when they reach the top of the heap.
+
+    Policies may also change the order of unannotated items (refillSort) and request extra annotations for some items
+    (requiredAnnotations). None of the methods is thread-safe: the annotation manager calls them holding the lock of
+    the shard that owns the queue.
+    """
+
+    # Maximum number of annotations requested beyond the number of annotations per item of the task.
+    maxExtraAnnotations = 0
+
+    def __init__(self):
+        self.__heap = []
+        self.__seq = count()
+
+        # Current heap entry and number of copies of each item in the queue.
+        self.__entries = {}
+        self.__copies = {}
+
+        # Total number of copies in the queue.
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def emptyCopy(self):
+        """
+        Return a new, empty queue with the same policy and parameters as this one (e.g. for each shard of the pools of
+        an annotation manager).
+        """
+        policy = copy.copy(self)
+        SelectionPolicy.__init__(policy)
+        return policy
+
+    def priority(self, item):
+        """
+        Return the priority of the given item (lower values are selected first).
+        """
+        return 0
+
+    def refillSort(self):
+        """
+        Return the sort clause of the search for unannotated items or None to get them in random order.
+        """
+        return None
+
+    def requiredAnnotations(self, item, numAnnotationsPerItem):
+        """
+        Return the number of valid annotations required for the given item.
+        """
+        return numAnnotationsPerItem
+
+    def add(self, item, numCopies=1):
+        """
+        Include numCopies copies of the given item in the queue, i.e., the item will be returned to numCopies more
+        annotators.
+        """
+        if numCopies <= 0:
+            return
+        if item not in self.__copies:
+            self.__copies[item] = 0
+            self.__push(item)
+        self.__copies[item] += numCopies
+        self.__size += numCopies
+
+    def update(self, item):
+        """
+        Recompute the priority of the given item (e.g. after it received an annotation).
+        """
+        entry = self.__entries.get(item)
+        if entry is not None and entry[0] != self.priority(item):
+            self.__push(item)
+
+    def remove(self, item):
+        """
+        Remove all copies of the given item.
+        """
+        copies = self.__copies.pop(item, None)
+        if copies is not None:
+            self.__size -= copies
+            del self.__entries[item]
+
+    def pop(self, annotatorId):
+        """
+        Remove one copy of the best item that the given annotator neither annotated nor holds and return it, or return
+        None if there is no such item.
+        """
+        skipped = []
+        selected = None
+        while len(self.__heap) > 0:
+            entry = heapq.heappop(self.__heap)
+            item = entry[2]
+            if self.__entries.get(item) is not entry:
+                # Stale entry.
+                continue
+            if annotatorId in item.annotations or annotatorId in item.holdingAnnotators:
+                skipped.append(entry)
+                continue
+            selected = item
+            self.__size -= 1
+            self.__copies[item] -= 1
+            if self.__copies[item] > 0:
+                skipped.append(entry)
+            else:
+                del self.__copies[item]
+                del self.__entries[item]
+            break
+
+        for entry in skipped:
+            heapq.heappush(self.__heap, entry)
+        return selected
+
+    def __push(self, item):
+        entry = (self.priority(item), next(self.__seq), item)
+        self.__entries[item] = entry
+        heapq.heappush(self.__heap, entry)
+
+
+class FinishPartialsFirstPolicy(SelectionPolicy):
+    """
+    Return partially annotated items in the order they were included in the queue (first in, first out).
+    """
+    pass
+
+
+class PrioritizeDisagreementsPolicy(SelectionPolicy):
+    """
+    Prefer items whose annotations conflict. Besides, an item whose required annotations conflict receives up to
+    maxExtraAnnotations extra annotations (one more annotator by default) to break the tie.
+    """
+
+    def __init__(self, maxExtraAnnotations=1):
+        super(PrioritizeDisagreementsPolicy, self).__init__()
+        self.maxExtraAnnotations = maxExtraAnnotations
+
+    def priority(self, item):
+        return 0 if self.disagreement(item) else 1
+
+    def requiredAnnotations(self, item, numAnnotationsPerItem):
+        if self.disagreement(item):
+            return numAnnotationsPerItem + self.maxExtraAnnotations
+        return numAnnotationsPerItem
+
+    @staticmethod
+    def disagreement(item):
+        """
+        Return whether the valid (not skipped) annotations of the given item include different labels.
+        """
+        # Skipped items are annotated with AnnotationManager.SKIP.
+        labels = set(ann["annotation"] for ann in item.annotations.itervalues() if ann["annotation"] != "skip")
+        return len(labels) > 1
+
+
+class UncertaintyFirstPolicy(SelectionPolicy):
+    """
+    Prefer items with higher scores written by an offline model (e.g. the uncertainty of a classifier) in the scores
+    field of the items. Both partially annotated and unannotated items follow this order. Items without score come
+    last.
+    """
+
+    def __init__(self, scoreField="uncertainty"):
+        super(UncertaintyFirstPolicy, self).__init__()
+        self.scoreField = scoreField
+
+    def priority(self, item):
+        score = item.scores.get(self.scoreField)
+        return -score if score is not None else float("inf")
+
+    def refillSort(self):
+        return [
+            {
+                "scores.%s" % self.scoreField: {
+                    "order": "desc",
+                    "missing": "_last",
+                    "unmapped_type": "float"
+                }
+            }
+        ]
+
+
+# Policies by name (used in context_config.json).
+POLICIES = {
+    "partials-first": FinishPartialsFirstPolicy,
+    "disagreements": PrioritizeDisagreementsPolicy,
+    "uncertainty": UncertaintyFirstPolicy
+}
+
+
+def createSelectionPolicy(config):
+    """
+    Create a selection policy from its configuration: the name of the policy or a dictionary with the name (key name)
+    and the constructor arguments of the policy (e.g. {"name": "uncertainty", "scoreField": "entropy"}).
+    """
+    if config is None:
+        return FinishPartialsFirstPolicy()
+    if isinstance(config, basestring):
+        config = {"name": config}
+    args = dict(config)
+    name = args.pop("name")
+    if name not in POLICIES:
+        raise ValueError("Unknown selection policy %s" % name)
+    return POLICIES[name](**args)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Serve the annotation web app with gevent instead of Flask's threaded development server.
+
+Every request runs in a greenlet and all blocking I/O (Elasticsearch calls through urllib3, oEmbed calls through
+requests) is cooperative, so one process serves many concurrent annotators without one OS thread per request. The
+standard library is monkey-patched before anything else is imported, so the threads and condition variables used by
+AnnotationManager become greenlets and greenlet-aware locks: the scheduling logic is reused as is, and waiting for the
+manager lock or for a refill only suspends the waiting greenlet.
+
+Usage:
+
+    python serve_gevent.py --port 5000 --max-connections 1000
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+import tweet_annotation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the annotation web app with gevent.")
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen")
+    parser.add_argument("--port", type=int, default=5000, help="port to listen")
+    parser.add_argument("--max-connections", type=int, default=1000,
+                        help="maximum number of concurrent connections (greenlets)")
+    args = parser.parse_args()
+
+    tweet_annotation.initSessionInterface()
+
+    server = WSGIServer((args.host, args.port), tweet_annotation.app, spawn=Pool(args.max_connections),
+                        log=tweet_annotation.app.logger, error_log=tweet_annotation.app.logger)
+    tweet_annotation.app.logger.info("Serving on %s:%d (gevent)" % (args.host, args.port))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@ from datetime import datetime
 from uuid import uuid4
 
 from dateutil import tz
-from elasticsearch.client import IndicesClient
 from flask.sessions import SessionInterface, SessionMixin
 from werkzeug.datastructures import CallbackDict
 
@@ -107,7 +106,7 @@ class ElasticsearchSessionInterface(SessionInterface):
 
         :return:
         """
-        ic = IndicesClient(self.es)
+        ic = self.es.indices
         if not ic.exists(index=self.index):
             ic.create(index=self.index)
 
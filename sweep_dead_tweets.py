@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Invalidate the items of an annotation task whose tweets cannot be embedded anymore (removed tweets, protected or
+suspended accounts), so that annotators are only served live tweets.
+
+The web app only finds such tweets when an annotator is served one. This tool checks the tweets of all items that are
+not complete yet (invalid items and items with the required number of annotations are not checked) with a pool of
+threads that query the oEmbed API at a bounded rate. Items of the same tweet (one for each context) are checked once.
+Dead tweets are marked as invalid in the same format used by AnnotationManager.invalidate (the annotator id is
+SWEEPER_ID), with bulk update requests.
+
+Items are scanned sorted by docId, and the docId up to which all tweets were checked (and their invalid markers
+written) is saved to a checkpoint file, so an interrupted sweep resumes from that point (a finished sweep starts
+over). Tweets whose check fails for other reasons (rate limit, server or connection errors) are retried a few times
+and then left for the next sweep.
+
+Usage:
+
+    python sweep_dead_tweets.py --name supernatural --threads 8 --rate 5
+"""
+import argparse
+import json
+import sys
+import time
+from Queue import Queue
+from datetime import datetime
+from threading import Lock, Thread
+
+from dateutil import tz
+from elasticsearch.helpers import scan, bulk
+
+from checkpoint import loadCheckpoint, saveCheckpoint
+from document_store import DocumentStore
+from es_client import createElasticsearchClient
+from oembed import OEmbedClient
+
+# Annotator id of the invalid markers written by the sweeper.
+SWEEPER_ID = "sweeper"
+
+# Fields retrieved from each item.
+SOURCE_FIELDS = ["docId", "doc.tweet.id_str", "doc.tweet.user.screen_name"]
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads: at most rate acquisitions per second on average, with bursts of at most burst
+    acquisitions.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self.__lock = Lock()
+        self.__tokens = float(burst)
+        self.__last = time.time()
+
+    def acquire(self):
+        """
+        Wait until a token is available and take it.
+        """
+        while True:
+            with self.__lock:
+                now = time.time()
+                self.__tokens = min(self.burst, self.__tokens + (now - self.__last) * self.rate)
+                self.__last = now
+                if self.__tokens >= 1.0:
+                    self.__tokens -= 1.0
+                    return
+                wait = (1.0 - self.__tokens) / self.rate
+            time.sleep(wait)
+
+
+def pendingItemsQuery(name, numAnnotationsPerItem, afterDocId=None):
+    """
+    Return the query of the items of the given task that are neither invalid nor complete, sorted by docId (and only
+    those after the given docId).
+    """
+    filters = [
+        {
+            "term": {
+                "name": name
+            }
+        },
+        {
+            "bool": {
+                "should": [
+                    {
+                        "range": {
+                            "numValidAnnotations": {
+                                "lt": numAnnotationsPerItem
+                            }
+                        }
+                    },
+                    {
+                        "bool": {
+                            "must_not": {
+                                "exists": {
+                                    "field": "numValidAnnotations"
+                                }
+                            }
+                        }
+                    }
+                ]
+            }
+        }
+    ]
+    if afterDocId is not None:
+        filters.append({"range": {"docId": {"gt": afterDocId}}})
+    return {
+        "query": {
+            "bool": {
+                "filter": filters,
+                "must_not": {
+                    "exists": {
+                        "field": "invalid"
+                    }
+                }
+            }
+        },
+        "sort": [{"docId": "asc"}]
+    }
+
+
+def tweetGroups(hits):
+    """
+    Group consecutive hits (sorted by docId) of the same tweet. Generate pairs (docId, list of hits).
+    """
+    docId = None
+    group = []
+    for hit in hits:
+        if hit["_source"]["docId"] != docId:
+            if len(group) > 0:
+                yield docId, group
+            docId = hit["_source"]["docId"]
+            group = []
+        group.append(hit)
+    if len(group) > 0:
+        yield docId, group
+
+
+class DeadTweetSweeper:
+    """
+    Check the tweets of the pending items of a task and invalidate the items of dead tweets (see the module docstring).
+
+    The main thread scans the items and feeds the groups of items of each tweet to the checker threads through a
+    bounded queue, so memory usage does not depend on the task size. A single writer thread collects the results,
+    writes the invalid markers in bulk and advances the checkpoint.
+    """
+
+    def __init__(self, es, oEmbed, index, docType, name, numAnnotationsPerItem=2, numThreads=8, rate=5.0,
+                 maxRetries=3, bulkSize=500, checkpointPath=None, documentStore=None, logger=None):
+        """
+        :param es: Elasticsearch client.
+        :param oEmbed: OEmbedClient used to check the tweets.
+        :param index: index (or alias) of the annotation items.
+        :param docType: type of the annotation items.
+        :param name: name of the annotation task.
+        :param numAnnotationsPerItem: number of annotations of complete items.
+        :param numThreads: number of concurrent oEmbed checks.
+        :param rate: maximum number of oEmbed requests per second (shared by all threads).
+        :param maxRetries: number of retries of checks that fail for reasons other than a dead tweet.
+        :param bulkSize: number of invalid markers per bulk request.
+        :param checkpointPath: file where the progress is saved (None to disable resuming).
+        :param documentStore: DocumentStore of the tweets referenced by the items (tasks created with a document index).
+        :param logger: optional logger.
+        """
+        self.es = es
+        self.oEmbed = oEmbed
+        self.index = index
+        self.docType = docType
+        self.name = name
+        self.numAnnotationsPerItem = numAnnotationsPerItem
+        self.numThreads = numThreads
+        self.limiter = RateLimiter(rate, burst=numThreads)
+        self.maxRetries = maxRetries
+        self.bulkSize = bulkSize
+        self.checkpointPath = checkpointPath
+        self.documentStore = documentStore
+        self.logger = logger
+
+        self.stats = {"tweets": 0, "items": 0, "live": 0, "dead": 0, "invalidated": 0, "unknown": 0}
+
+    def check(self, docId, hits):
+        """
+        Check the tweet of the given items, retrying checks that fail for reasons other than a dead tweet.
+
+        :return: a pair (alive, cause) as returned by OEmbedClient.checkTweet.
+        """
+        tweet = hits[0]["_source"].get("doc", {}).get("tweet")
+        if tweet is None and self.documentStore is not None:
+            doc = self.documentStore.get(docId)
+            tweet = doc["tweet"] if doc is not None else None
+        if tweet is None:
+            return False, u"Documento %s não encontrado" % docId
+
+        for attempt in xrange(self.maxRetries + 1):
+            self.limiter.acquire()
+            (alive, cause) = self.oEmbed.checkTweet(tweet)
+            if alive is not None:
+                return alive, cause
+            if attempt < self.maxRetries:
+                # Exponential backoff (rate limit or server errors).
+                time.sleep(min(2 ** attempt, 60))
+        return None, cause
+
+    def run(self, restart=False):
+        """
+        Sweep the task and return the counters of checked tweets and items. If the invalid markers cannot be written,
+        the sweep stops (the checkpoint is not advanced past them) and the error is raised.
+        """
+        self.__writeError = None
+        checkpoint = {} if restart else loadCheckpoint(self.checkpointPath)
+        if checkpoint.get("name") not in (None, self.name):
+            raise ValueError("Checkpoint %s belongs to task %s" % (self.checkpointPath, checkpoint["name"]))
+        if checkpoint.get("done"):
+            # The previous sweep finished, so start a new one.
+            checkpoint = {}
+        afterDocId = checkpoint.get("lastDocId")
+        if afterDocId is not None:
+            self.__log("Resuming after docId %s" % afterDocId)
+            self.stats = checkpoint.get("stats", self.stats)
+
+        groups = Queue(maxsize=4 * self.numThreads)
+        results = Queue()
+
+        def checker():
+            while True:
+                task = groups.get()
+                if task is None:
+                    return
+                (seq, docId, hits) = task
+                try:
+                    (alive, cause) = self.check(docId, hits)
+                except Exception as e:
+                    # Leave the tweet for the next sweep, but keep the checker alive.
+                    (alive, cause) = (None, "Error: %s" % e)
+                results.put((seq, docId, hits, alive, cause))
+
+        checkers = [Thread(target=checker, name="sweeper-%d" % i) for i in xrange(self.numThreads)]
+        for t in checkers:
+            t.daemon = True
+            t.start()
+
+        writer = Thread(target=self.__write, name="sweeper-writer", args=(results, afterDocId))
+        writer.daemon = True
+        writer.start()
+
+        hits = scan(self.es, index=self.index, doc_type=self.docType, preserve_order=True,
+                    _source_include=",".join(SOURCE_FIELDS),
+                    query=pendingItemsQuery(self.name, self.numAnnotationsPerItem, afterDocId))
+        numGroups = 0
+        for (docId, group) in tweetGroups(hits):
+            if self.__writeError is not None:
+                # The writer stopped: checking more tweets is useless.
+                break
+            groups.put((numGroups, docId, group))
+            numGroups += 1
+
+        for _ in checkers:
+            groups.put(None)
+        for t in checkers:
+            t.join()
+        results.put(None)
+        writer.join()
+
+        if self.__writeError is not None:
+            (errorType, error, traceback) = self.__writeError
+            raise errorType, error, traceback
+        return self.stats
+
+    def __write(self, results, lastDocId):
+        """
+        Run the writer (see __writeResults) and keep its error, if any, to be raised by run().
+        """
+        try:
+            self.__writeResults(results, lastDocId)
+        except Exception:
+            if self.logger is not None:
+                self.logger.exception("Error writing the invalid markers")
+            self.__writeError = sys.exc_info()
+
+    def __writeResults(self, results, lastDocId):
+        """
+        Collect the check results, write the invalid markers and save the checkpoint. The checkpoint is the docId up to
+        which all tweets (in scan order) were checked and whose invalid markers were written.
+        """
+        actions = []
+        # Results that finished out of order (by sequence number) and the next expected sequence number.
+        finished = {}
+        nextSeq = 0
+
+        while True:
+            result = results.get()
+            if result is not None:
+                (seq, docId, hits, alive, cause) = result
+                self.stats["tweets"] += 1
+                self.stats["items"] += len(hits)
+                if alive:
+                    self.stats["live"] += 1
+                elif alive is None:
+                    self.stats["unknown"] += 1
+                    self.__log("Could not check tweet %s: %s" % (docId, cause))
+                else:
+                    self.stats["dead"] += 1
+                    invalid = {
+                        "annotatorId": SWEEPER_ID,
+                        "cause": cause,
+                        "time": datetime.now(tz.tzlocal())
+                    }
+                    for hit in hits:
+                        actions.append({
+                            '_op_type': 'update',
+                            '_index': hit.get("_index", self.index),
+                            '_type': self.docType,
+                            '_id': hit["_id"],
+                            'doc': {"invalid": invalid, "updated": invalid["time"]}
+                        })
+                finished[seq] = docId
+                while nextSeq in finished:
+                    lastDocId = finished.pop(nextSeq)
+                    nextSeq += 1
+
+            if result is None or len(actions) >= self.bulkSize or self.stats["tweets"] % self.bulkSize == 0:
+                if len(actions) > 0:
+                    bulk(self.es, actions)
+                    self.stats["invalidated"] += len(actions)
+                    actions = []
+                # Only tweets whose markers were written are included in the checkpoint.
+                self.__save(lastDocId, done=result is None)
+                self.__log("%(tweets)d tweets checked (%(dead)d dead, %(unknown)d unknown)" % self.stats)
+
+            if result is None:
+                return
+
+    def __save(self, lastDocId, done):
+        saveCheckpoint(self.checkpointPath, {
+            "name": self.name,
+            "lastDocId": lastDocId,
+            "done": done,
+            "stats": self.stats
+        })
+
+    def __log(self, msg):
+        if self.logger is not None:
+            self.logger.info(msg)
+        else:
+            print msg
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Invalidate the items of dead tweets of an annotation task.")
+    parser.add_argument("--name", required=True, help="name of the annotation task")
+    parser.add_argument("--index", default="ctrls_annotation_no_retweet", help="index (or alias) of the items")
+    parser.add_argument("--type", default="relevance", help="type of the annotation items")
+    parser.add_argument("--annotations-per-item", type=int, default=2,
+                        help="number of annotations of complete items (these are not checked)")
+    parser.add_argument("--doc-index", help="index of the tweets referenced by the items (see document_store.py)")
+    parser.add_argument("--threads", type=int, default=8, help="number of concurrent oEmbed checks")
+    parser.add_argument("--rate", type=float, default=5.0, help="maximum number of oEmbed requests per second")
+    parser.add_argument("--retries", type=int, default=3, help="retries of checks that fail (e.g. rate limit)")
+    parser.add_argument("--bulk-size", type=int, default=500, help="number of invalid markers per bulk request")
+    parser.add_argument("--checkpoint", help="checkpoint file (default is sweep_<name>.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and sweep the whole task")
+    parser.add_argument("--oembed-endpoint", default="https://publish.twitter.com/oembed", help="oEmbed API URL")
+    args = parser.parse_args()
+
+    es = createElasticsearchClient(idempotent=True)
+    documentStore = None
+    if args.doc_index is not None:
+        documentStore = DocumentStore(es, index=args.doc_index)
+
+    sweeper = DeadTweetSweeper(es, OEmbedClient(endpoint=args.oembed_endpoint), index=args.index, docType=args.type,
+                               name=args.name, numAnnotationsPerItem=args.annotations_per_item,
+                               numThreads=args.threads, rate=args.rate, maxRetries=args.retries,
+                               bulkSize=args.bulk_size,
+                               checkpointPath=args.checkpoint or "sweep_%s.json" % args.name,
+                               documentStore=documentStore)
+    start = time.time()
+    stats = sweeper.run(restart=args.restart)
+    print json.dumps(stats, indent=2)
+    print 'Elapsed: %.1fs' % (time.time() - start)
+
+
+if __name__ == "__main__":
+    main()
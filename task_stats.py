@@ -0,0 +1,125 @@
+# coding=utf-8
+import time
+from datetime import datetime
+from threading import Lock
+
+from dateutil import tz
+
+
+class TaskStatistics:
+    """
+    Progress statistics of an annotation task: number of items (total, unannotated, partially annotated, complete and
+    invalid), number of items annotated by each annotator and number of annotations over time.
+
+    All statistics are computed by one search request with aggregations (no hits are retrieved). The result is cached
+    for ttl seconds, so dashboards polling the statistics do not load the cluster: concurrent requests arriving when
+    the cache expires wait for one single refresh instead of issuing one search each.
+    """
+
+    def __init__(self, esClient, index, annotationType, annotationName, numAnnotationsPerItem, ttl=10.0,
+                 interval="1h", maxAnnotators=100):
+        """
+        :param esClient: Elasticsearch client.
+        :param index: index of the annotation items.
+        :param annotationType: type of the annotation items.
+        :param annotationName: name of the annotation task.
+        :param numAnnotationsPerItem: number of valid annotations required to complete an item.
+        :param ttl: time (in seconds) that computed statistics are reused.
+        :param interval: interval of the annotation rate histogram (Elasticsearch date_histogram interval).
+        :param maxAnnotators: maximum number of annotators reported (the most active ones).
+        """
+        self.es = esClient
+        self.index = index
+        self.annotationType = annotationType
+        self.annotationName = annotationName
+        self.numAnnotationsPerItem = numAnnotationsPerItem
+        self.ttl = ttl
+        self.interval = interval
+        self.maxAnnotators = maxAnnotators
+
+        self.__lock = Lock()
+        self.__stats = None
+        self.__expiration = 0.0
+
+    def get(self):
+        """
+        Return the statistics of the task, computing them if the cached ones are expired.
+        """
+        with self.__lock:
+            if self.__stats is None or time.time() >= self.__expiration:
+                self.__stats = self.__compute()
+                self.__expiration = time.time() + self.ttl
+            return self.__stats
+
+    def query(self):
+        """
+        Return the body of the aggregation request.
+        """
+        annotated = {"exists": {"field": "annotations"}}
+        invalid = {"exists": {"field": "invalid"}}
+        complete = {"range": {"numValidAnnotations": {"gte": self.numAnnotationsPerItem}}}
+        return {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "term": {
+                                "name": self.annotationName
+                            }
+                        }
+                    ]
+                }
+            },
+            "aggs": {
+                "status": {
+                    "filters": {
+                        "filters": {
+                            "invalid": invalid,
+                            "unannotated": {"bool": {"must_not": [annotated, invalid]}},
+                            "partial": {"bool": {"filter": [annotated], "must_not": [complete, invalid]}},
+                            "complete": {"bool": {"filter": [complete], "must_not": [invalid]}}
+                        }
+                    }
+                },
+                "annotators": {
+                    "terms": {
+                        "field": "annotations.annotatorId",
+                        "size": self.maxAnnotators
+                    }
+                },
+                "rate": {
+                    "date_histogram": {
+                        "field": "annotations.time",
+                        "interval": self.interval,
+                        "min_doc_count": 1
+                    }
+                }
+            }
+        }
+
+    def __compute(self):
+        start = time.time()
+        res = self.es.search(index=self.index, doc_type=self.annotationType, body=self.query())
+        aggs = res["aggregations"]
+        status = aggs["status"]["buckets"]
+        return {
+            "name": self.annotationName,
+            "updated": datetime.now(tz.tzlocal()).isoformat(),
+            "took": time.time() - start,
+            "numAnnotationsPerItem": self.numAnnotationsPerItem,
+            "items": {
+                "total": res["hits"]["total"],
+                "unannotated": status["unannotated"]["doc_count"],
+                "partial": status["partial"]["doc_count"],
+                "complete": status["complete"]["doc_count"],
+                "invalid": status["invalid"]["doc_count"]
+            },
+            # Annotations are not nested documents, so each bucket counts items (annotated by the annotator).
+            "annotators": [{"annotatorId": b["key"], "items": b["doc_count"]} for b in aggs["annotators"]["buckets"]],
+            # Number of items annotated in each interval.
+            "rate": {
+                "interval": self.interval,
+                "buckets": [{"time": b["key_as_string"], "items": b["doc_count"]} for b in aggs["rate"]["buckets"]]
+            }
+        }
@@ -0,0 +1,98 @@
+# coding=utf-8
+"""
+Concurrency tests of the annotation manager, against the fake Elasticsearch of the benchmarks.
+
+Usage (from the repository root):
+
+    python -m unittest discover tests
+"""
+import logging
+import os
+import sys
+import unittest
+from threading import Event, Thread
+
+# Make the modules of the repository importable when running the tests from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from annotation_manager import AnnotationManager
+from annotation_scheduler import AnnotationScheduler
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.harness import populateTask, ANNOTATION_INDEX, ANNOTATION_TYPE
+
+
+class ConcurrentRequestsTest(unittest.TestCase):
+    """
+    Concurrent requests of the same annotator must not take more items than it may hold.
+    """
+
+    NUM_THREADS = 16
+
+    def createManager(self, numShards):
+        es = FakeElasticsearch()
+        populateTask(es, "test", 500)
+        manager = AnnotationManager("test", es, ANNOTATION_INDEX, ANNOTATION_TYPE, "test", numAnnotationsPerItem=2,
+                                    logger=logging.getLogger("test"), numShards=numShards)
+        scheduler = AnnotationScheduler(es, logging.getLogger("test"), interval=0.1)
+        self.addCleanup(scheduler.stop)
+        scheduler.register(manager)
+        return manager
+
+    def runConcurrently(self, function):
+        start = Event()
+        errors = []
+
+        def run():
+            start.wait()
+            try:
+                function()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=run) for _ in xrange(self.NUM_THREADS)]
+        for t in threads:
+            t.start()
+        start.set()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+
+    def testGetItem(self):
+        for numShards in (1, 4):
+            # The requests arrive before the first refill, so all of them wait for the items at the same time.
+            manager = self.createManager(numShards)
+            items = []
+            self.runConcurrently(lambda: items.append(manager.getItem("annotator")))
+            self.assertEqual(1, len(set(item.id for item in items)))
+            self.assertEqual(1, manager.getPoolSizes()["held"])
+
+    def testLeaseItems(self):
+        for numShards in (1, 4):
+            manager = self.createManager(numShards)
+            self.runConcurrently(lambda: manager.leaseItems("annotator", 5))
+            self.assertEqual(5, manager.getPoolSizes()["held"])
+            self.assertEqual(5, len(manager.leaseItems("annotator", 5)))
+
+    def testAnnotateBatch(self):
+        for numShards in (1, 4):
+            # Each annotator saves a batch spanning several shards while the others save theirs.
+            manager = self.createManager(numShards)
+            batches = {}
+            for i in xrange(self.NUM_THREADS):
+                batches["annotator%d" % i] = [item.id for item in manager.leaseItems("annotator%d" % i, 5)]
+            annotators = iter(sorted(batches))
+            self.runConcurrently(lambda: self.annotateBatch(manager, batches, next(annotators)))
+
+            self.assertEqual(0, manager.getPoolSizes()["held"])
+            for (annotatorId, itemIds) in batches.iteritems():
+                for itemId in itemIds:
+                    source = manager.es.get(index=ANNOTATION_INDEX, id=itemId)["_source"]
+                    self.assertIn(annotatorId, [annotation["annotatorId"] for annotation in source["annotations"]])
+
+    @staticmethod
+    def annotateBatch(manager, batches, annotatorId):
+        manager.annotateBatch(annotatorId, [(itemId, "Sim") for itemId in batches[annotatorId]], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
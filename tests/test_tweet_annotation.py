@@ -0,0 +1,64 @@
+# coding=utf-8
+"""
+Tests of the web app (tweet_annotation.py), run against the fake Elasticsearch and the stub oEmbed server of the
+benchmarks (see benchmarks.harness.AppHarness). The app is imported once per process, so all tests share one harness.
+
+Usage (from the repository root):
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from threading import Thread
+
+# Make the modules of the repository importable when running the tests from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import AppHarness
+
+
+class DocumentIndexContextTest(unittest.TestCase):
+    """
+    Contexts whose items reference a document index get a manager with the shared document store.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cwd = os.getcwd()
+        cls.harness = AppHarness(["plain", "docs"], numItems=50,
+                                 contextConfig={"docs": {"documentIndex": "ctrls_annotation_docs"}}).start()
+        # The harness changes into the directory of the app configuration files.
+        os.chdir(cwd)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.harness.stop()
+
+    def getAnnotationManager(self, key, timeout=10.0):
+        """
+        Call getAnnotationManager in another thread, so a deadlock fails the test instead of hanging it.
+        """
+        result = []
+        t = Thread(target=lambda: result.append(self.harness.module.getAnnotationManager(key)))
+        t.daemon = True
+        t.start()
+        t.join(timeout)
+        self.assertFalse(t.is_alive(), "getAnnotationManager(%r) did not return in %.0fs" % (key, timeout))
+        return result[0]
+
+    def testDocumentIndexContext(self):
+        manager = self.getAnnotationManager("docs")
+        self.assertIsNotNone(manager.documentStore)
+        self.assertIs(self.harness.module.getDocumentStore("ctrls_annotation_docs"), manager.documentStore)
+        self.assertIs(manager, self.getAnnotationManager("docs"))
+        self.assertIsNotNone(manager.getItem("annotator"))
+
+    def testPlainContext(self):
+        manager = self.getAnnotationManager("plain")
+        self.assertIsNone(manager.documentStore)
+        self.assertIsNotNone(manager.getItem("annotator"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+# coding=utf-8
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from dateutil import tz
+
+
+class Tracer:
+    """
+    Opt-in tracing of the hot path. A trace covers one web request (or one refill of an annotation manager) and is
+    made of spans, each one recording the timing of some operation (Elasticsearch call, oEmbed fetch, lock wait, etc.)
+    executed by the same thread. Traces longer than a threshold are appended to a JSONL file for offline analysis.
+
+    When the tracer is disabled (default), span() and trace() cost only a flag check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.slowThresholdMs = 500
+        self.outputFile = "slow_traces.jsonl"
+
+        self.__local = threading.local()
+        self.__fileLock = threading.Lock()
+
+    def configure(self, enabled=True, slowThresholdMs=500, outputFile="slow_traces.jsonl"):
+        """
+        :param enabled: whether traces are recorded.
+        :param slowThresholdMs: only traces longer than this (in milliseconds) are dumped.
+        :param outputFile: JSONL file where slow traces are appended.
+        """
+        self.enabled = enabled
+        self.slowThresholdMs = slowThresholdMs
+        self.outputFile = outputFile
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """
+        Record a trace covering the execution of the context by the current thread.
+
+        :param name: trace name (e.g. method and path of the request).
+        :param attributes: additional attributes stored with the trace.
+        """
+        if not self.enabled or getattr(self.__local, "trace", None) is not None:
+            yield
+            return
+
+        start = time.time()
+        trace = {
+            "name": name,
+            "thread": threading.current_thread().name,
+            "start": datetime.now(tz.tzlocal()).isoformat(),
+            "attributes": attributes,
+            "spans": []
+        }
+        self.__local.trace = trace
+        self.__local.start = start
+        try:
+            yield
+        finally:
+            self.__local.trace = None
+            trace["durationMs"] = (time.time() - start) * 1000
+            if trace["durationMs"] >= self.slowThresholdMs:
+                self.__dump(trace)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Record a span within the trace of the current thread. If there is no active trace, do nothing.
+
+        :param name: span name (e.g. es.search).
+        :param attributes: additional attributes stored with the span.
+        """
+        trace = getattr(self.__local, "trace", None) if self.enabled else None
+        if trace is None:
+            yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            span = {
+                "name": name,
+                "offsetMs": (start - self.__local.start) * 1000,
+                "durationMs": (time.time() - start) * 1000
+            }
+            if len(attributes) > 0:
+                span["attributes"] = attributes
+            trace["spans"].append(span)
+
+    def setAttribute(self, key, value):
+        """
+        Set an attribute of the active trace of the current thread (if any).
+        """
+        trace = getattr(self.__local, "trace", None) if self.enabled else None
+        if trace is not None:
+            trace["attributes"][key] = value
+
+    def __dump(self, trace):
+        line = json.dumps(trace)
+        with self.__fileLock:
+            with open(self.outputFile, "ab") as f:
+                f.write(line + "\n")
+
+
+class TracingMiddleware:
+    """
+    WSGI middleware that records one trace for each request, including the session handling done by Flask before the
+    view is called.
+    """
+
+    def __init__(self, wsgiApp, tracer):
+        self.wsgiApp = wsgiApp
+        self.tracer = tracer
+
+    def __call__(self, environ, start_response):
+        name = "%s %s" % (environ.get("REQUEST_METHOD"), environ.get("PATH_INFO"))
+        with self.tracer.trace(name):
+            def tracedStartResponse(status, headers, exc_info=None):
+                self.tracer.setAttribute("status", status)
+                return start_response(status, headers, exc_info)
+
+            return self.wsgiApp(environ, tracedStartResponse)
+
+
+# Application-wide tracer (disabled until configured).
+tracer = Tracer()
@@ -1,14 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import hmac
 import json
-import requests
+import os
+import time
 from codecs import open
+from threading import Lock
 
-from elasticsearch import Elasticsearch
-from flask import Flask, render_template, request, session, redirect, flash, current_app, abort
+from flask import Flask, render_template, request, session, redirect, flash, current_app, abort, g, Response, jsonify
 
+import metrics
 from annotation_manager import AnnotationManager
+from annotation_scheduler import AnnotationScheduler
+from document_store import DocumentStore
+from es_client import createElasticsearchClient
+from ingest_lifecycle import taskAliasName
+from oembed import OEmbedClient
+from profiler import SamplingProfiler
+from request_log import RequestLog
+from selection_policy import createSelectionPolicy
 from session_manager import ElasticsearchSessionInterface
+from task_stats import TaskStatistics
+from tracing import tracer, TracingMiddleware
 
 app = Flask(__name__)
 
@@ -21,21 +34,101 @@ app.secret_key = None
 with open('app_secret_key', 'rt', encoding='utf8') as f:
     app.secret_key = f.read()
 
+# Load the token of the admin endpoints (optional). The admin endpoints are disabled when this file does not exist.
+adminToken = None
+if os.path.exists('admin_token'):
+    with open('admin_token', 'rt', encoding='utf8') as f:
+        adminToken = f.read().strip() or None
+
+# Sampling profiler of the admin endpoint (only one profile runs at a time).
+profiler = SamplingProfiler()
+
+# Load tracing configuration (optional). Tracing is disabled when this file does not exist.
+if os.path.exists('tracing_config.json'):
+    with open('tracing_config.json') as f:
+        tracer.configure(**json.load(f))
+    if tracer.enabled:
+        app.wsgi_app = TracingMiddleware(app.wsgi_app, tracer)
+
+# Load the configuration of the structured request log (optional; see request_log.RequestLog). The requests are not
+# logged when this file does not exist.
+requestLog = None
+if os.path.exists('request_log_config.json'):
+    with open('request_log_config.json') as f:
+        requestLog = RequestLog(**json.load(f))
+
 
 def getElasticsearchClient():
     """
-    Elasticsearch client is bounded to the request (flask.g).
+    Elasticsearch client is bounded to the web app (app context) and shared by all requests, the annotation managers
+    and the session interface. Its connection pool, timeouts, retries and nodes are given by es_config.json (see
+    es_client.createElasticsearchClient).
     This function returns the bounded client or create a new one.
 
-    :return: the Elasticsearch client bounded to this request.
+    :return: the Elasticsearch client bounded to the web app.
     """
     with app.app_context():
         _es = getattr(current_app, 'esClient', None)
         if _es is None:
-            _es = current_app.esClient = Elasticsearch(['http://localhost:9200'])
+            _es = current_app.esClient = createElasticsearchClient(idempotent=True)
         return _es
 
 
+def getOEmbedClient():
+    """
+    The oEmbed client (and its cache of tweet HTMLs) is bounded to the web app (app context).
+
+    :return: the oEmbed client.
+    """
+    with app.app_context():
+        _oEmbed = getattr(current_app, 'oEmbedClient', None)
+        if _oEmbed is None:
+            _oEmbed = current_app.oEmbedClient = OEmbedClient()
+        return _oEmbed
+
+
+def getAnnotationScheduler():
+    """
+    The annotation scheduler is the single thread that refills the lists of unannotated items of all annotation
+    managers. It is bounded to the web app (app context).
+
+    :return: the annotation scheduler.
+    """
+    with app.app_context():
+        _scheduler = getattr(current_app, 'annotationScheduler', None)
+        if _scheduler is None:
+            _scheduler = current_app.annotationScheduler = AnnotationScheduler(esClient=getElasticsearchClient(),
+                                                                               logger=app.logger)
+        return _scheduler
+
+
+# Avoid creating two managers for the same context when concurrent requests arrive.
+_managersLock = Lock()
+
+# Avoid creating two document stores for the same index. It is a different lock, since the stores are created while
+# holding _managersLock (see getAnnotationManager).
+_documentStoresLock = Lock()
+
+
+def getDocumentStore(index):
+    """
+    The document stores (and their caches of documents) are bounded to the web app (app context), one for each
+    document index, so the contexts whose tasks share a document index also share the cached documents.
+
+    :param index: index of the documents.
+    :return: the document store.
+    """
+    with app.app_context():
+        _stores = getattr(current_app, 'documentStores', None)
+        if _stores is None:
+            _stores = current_app.documentStores = {}
+        with _documentStoresLock:
+            _store = _stores.get(index)
+            if _store is None:
+                _store = _stores[index] = DocumentStore(getElasticsearchClient(), index=index)
+        return _store
+
+
 def getAnnotationManager(key):
     """
     The annotation manager object manages which tweets are available for annotation and return one tweet for each
@@ -45,6 +138,15 @@ def getAnnotationManager(key):
     and it is responsible for managing the lists of tweets for all users. Thus, it needs to deal with race conditions,
     caused by the request threads.
 
+    Each context in context_config.json may specify the index (default ctrls_annotation_no_retweet), the document type
+    (default relevance), the number of annotations per item (default 2) of its task and the selection policy of items
+    (selectionPolicy; see selection_policy.createSelectionPolicy). If the task was created in its own index (see
+    create_annotation_task.py --alias), the context should give the alias shared by the tasks (alias) instead of the
+    index, so the manager (and the statistics) query the task alias, which searches only the shards of the task. If
+    the items of the task only reference their tweets (see create_annotation_task_futebol.py --doc-index), the context
+    must give the index of the documents (documentIndex). Contexts with many concurrent annotators may partition the
+    pools of the manager in shards (numShards, default 1).
+
     :param key: key to the current context (this should be part of the request URL).
 
     :return: the annotation manager object.
@@ -60,14 +162,184 @@ def getAnnotationManager(key):
         _context = _contextConfig[key]
         _annManager = _context.get("annotationManager")
         if _annManager is None:
-            _annManager = AnnotationManager(name=_context["name"], esClient=getElasticsearchClient(),
-                                            index="ctrls_annotation_no_retweet", annotationType="relevance",
-                                            annotationName=_context["name"], numAnnotationsPerItem=2, logger=app.logger)
-            _context["annotationManager"] = _annManager
+            with _managersLock:
+                _annManager = _context.get("annotationManager")
+                if _annManager is None:
+                    if "alias" in _context:
+                        index = taskAliasName(_context["alias"], _context["name"])
+                    else:
+                        index = _context.get("index", "ctrls_annotation_no_retweet")
+                    documentStore = None
+                    if "documentIndex" in _context:
+                        documentStore = getDocumentStore(_context["documentIndex"])
+                    _annManager = AnnotationManager(name=_context["name"], esClient=getElasticsearchClient(),
+                                                    index=index,
+                                                    annotationType=_context.get("type", "relevance"),
+                                                    annotationName=_context["name"],
+                                                    numAnnotationsPerItem=_context.get("numAnnotationsPerItem", 2),
+                                                    logger=app.logger,
+                                                    selectionPolicy=createSelectionPolicy(
+                                                        _context.get("selectionPolicy")),
+                                                    documentStore=documentStore,
+                                                    numShards=_context.get("numShards", 1))
+                    getAnnotationScheduler().register(_annManager)
+                    _context["annotationManager"] = _annManager
 
         return _annManager
 
 
+def getTaskStatistics(key):
+    """
+    The task statistics object computes (and caches) the progress statistics of the annotation task of the given
+    context. It is bounded to the web app (app context), so all requests share its cache. The cache TTL (in seconds)
+    can be given by the statsTtl key of the context (default 10).
+
+    :param key: key to the current context.
+    :return: the task statistics object or None if the context does not exist.
+    """
+    annManager = getAnnotationManager(key)
+    if annManager is None:
+        return None
+
+    _context = contextConfig[key]
+    _stats = _context.get("taskStatistics")
+    if _stats is None:
+        with _managersLock:
+            _stats = _context.get("taskStatistics")
+            if _stats is None:
+                _stats = _context["taskStatistics"] = TaskStatistics(
+                    esClient=getElasticsearchClient(), index=annManager.index, annotationType=annManager.annotationType,
+                    annotationName=annManager.annotationName, numAnnotationsPerItem=annManager.numAnnotationsPerItem,
+                    ttl=_context.get("statsTtl", 10.0))
+    return _stats
+
+
+def getAnnotationManagers():
+    """
+    Return the annotation managers created so far (managers are lazily created by getAnnotationManager).
+
+    :return: list of annotation managers.
+    """
+    return [c["annotationManager"] for c in contextConfig.itervalues() if c.get("annotationManager") is not None]
+
+
+def _poolSizes():
+    for annManager in getAnnotationManagers():
+        for (pool, size) in annManager.getPoolSizes().iteritems():
+            yield (annManager.name, pool), size
+
+
+def _prefetchSizing():
+    for annManager in getAnnotationManagers():
+        stats = annManager.getPrefetchStats()
+        for param in ("size", "lowWatermark", "lastRefillSize", "consumptionRate", "refillLatency"):
+            yield (annManager.name, param), stats[param]
+
+
+metrics.registry.callbackGauge("annotation_pool_items", "Number of items in each pool of the annotation manager.",
+                               ("context", "pool"), _poolSizes)
+metrics.registry.callbackGauge("annotation_prefetch", "Current sizing of the queue of unannotated items.",
+                               ("context", "parameter"), _prefetchSizing)
+
+
+@app.before_request
+def startRequestTimer():
+    g.requestStart = time.time()
+    if request.url_rule is not None:
+        tracer.setAttribute("route", request.url_rule.rule)
+
+
+@app.after_request
+def observeRequestLatency(response):
+    start = getattr(g, 'requestStart', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        duration = time.time() - start
+        metrics.httpRequestSeconds.labels(route, request.method, response.status_code).observe(duration)
+
+        # Only the requests of the annotation contexts are logged (not the metrics and admin endpoints).
+        if requestLog is not None and request.view_args is not None and 'key' in request.view_args:
+            record = {
+                "time": start,
+                "context": request.view_args['key'],
+                "route": route,
+                "method": request.method,
+                "status": response.status_code,
+                "annotator": session.userId,
+                "loggedIn": session.userEmail is not None,
+                "durationMs": duration * 1000
+            }
+            record.update(g.get('requestLogFields', {}))
+            requestLog.log(record)
+    return response
+
+
+def logRequest(**fields):
+    """
+    Add the given fields (item ids, annotations, etc.) to the record of the current request in the request log.
+    """
+    if requestLog is not None:
+        g.setdefault('requestLogFields', {}).update(fields)
+
+
+@app.route('/metrics', methods=['GET'])
+def exportMetrics():
+    """
+    Export the application metrics in the Prometheus text format.
+    """
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def checkAdminToken():
+    """
+    Abort the request unless it gives the admin token in the header "Authorization: Bearer <token>". The token is not
+    accepted in the query string, which is written to the access logs. The admin endpoints do not exist (404) when no
+    token is configured (file admin_token).
+    """
+    if adminToken is None:
+        abort(404)
+    token = u''
+    authorization = request.headers.get('Authorization', u'')
+    if authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):].strip()
+    if not hmac.compare_digest(token.encode('utf8'), adminToken.encode('utf8')):
+        abort(403)
+
+
+@app.route('/admin/profile', methods=['GET'])
+def adminProfile():
+    """
+    Profile the running server (all request threads, the scheduler and the annotation managers) for the given
+    duration (parameter duration, in seconds, default 10, at most 120) and return the collapsed stacks, which can be
+    rendered as a flame graph by flamegraph.pl or speedscope. The sampling interval (parameter interval, in seconds,
+    default 0.005) gives the trade-off between precision and overhead.
+    """
+    checkAdminToken()
+    try:
+        duration = min(max(float(request.args.get('duration', 10)), 0.1), 120.0)
+        interval = min(max(float(request.args.get('interval', profiler.interval)), 0.001), 1.0)
+    except ValueError:
+        return jsonify(error=u'Parâmetro inválido!'), 400
+
+    stacks = profiler.profile(duration, interval)
+    if stacks is None:
+        return jsonify(error=u'Já existe um perfil em execução!'), 409
+
+    filename = 'profile-%s.folded' % time.strftime('%Y%m%d-%H%M%S')
+    return Response(stacks, content_type='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': 'attachment; filename=%s' % filename})
+
+
+@app.route('/admin/locks', methods=['GET'])
+def adminLocks():
+    """
+    Return, for each annotation manager created so far, the threads holding and waiting for the locks of its shards
+    (see AnnotationManager.getLockSnapshot).
+    """
+    checkAdminToken()
+    return jsonify(dict((annManager.name, annManager.getLockSnapshot()) for annManager in getAnnotationManagers()))
+
+
 @app.route('/<key>/login', methods=['GET', 'POST'])
 def login(key):
     if getAnnotationManager(key) is None:
@@ -112,34 +384,13 @@ def index(key):
         session.userEmail = None
         return redirect('/%s/login' % key)
 
-    # Get current item for the logged user.
-    item = annManager.getItem(session.userId)
+    # Get current item for the logged user and its HTML content.
+    item, tweetHtml = resolveItem(annManager, session.userId, annManager.getItem(session.userId))
     if item is None:
         app.logger.error("No item to be annotated!")
         return render_template('tweet_annotation.html', userId=session.userId, email=session.userEmail, key=key,
                                message="Todos os tweets foram anotados. Obrigado!")
-
-    tweet = item.doc["tweet"]
-
-    tweetUrl = 'https://twitter.com/%s/status/%s' % (tweet["user"]["screen_name"], tweet["id_str"])
-    oEmbedUrl = 'https://publish.twitter.com/oembed?hide_thread=t&url=%s' % tweetUrl
-    oEmbedResp = requests.get(oEmbedUrl)
-
-    if oEmbedResp.status_code != 200:
-        # Não retornou com sucesso (por alguma razão que desconheço).
-        annManager.invalidate(session.userId, item.id, "Unexpected status code %d" % oEmbedResp.status_code)
-        return redirect('/%s' % key)
-
-    # Load the returned tweet JSON.
-    tweetJson = json.loads(oEmbedResp.content)
-
-    if 'html' not in tweetJson:
-        # A API do Twitter retornou algum erro. Em geral, o tweet foi removido ou não é mais público.
-        annManager.invalidate(session.userId, tweet.id, "Tweet nulo!")
-        return redirect('/%s' % key)
-
-    # Get the HTML content.
-    tweetHtml = tweetJson['html']
+    logRequest(nextItem=item.id)
 
     # Render the annotation page.
     return render_template('tweet_annotation.html', userId=session.userId, tweetId=item.id, key=key,
@@ -184,6 +435,7 @@ def annotateTweet(key):
 
     # Get the provided annotation.
     annotation = request.form.get("submit")
+    logRequest(item=item.id, annotation=annotation)
 
     if annotation in ("Sim", "Nao"):
         # Save it to ES.
@@ -201,6 +453,270 @@ def annotateTweet(key):
     return redirect('/%s' % key)
 
 
-if __name__ == '__main__':
+@app.route('/<key>/stats', methods=['GET'])
+def taskStatistics(key):
+    """
+    Render the progress page of the annotation task (the page polls /<key>/api/stats).
+    """
+    if getAnnotationManager(key) is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return redirect('/%s/login' % key)
+
+    return render_template('task_stats.html', key=key, email=session.userEmail)
+
+
+@app.route('/<key>/api/stats', methods=['GET'])
+def apiTaskStatistics(key):
+    """
+    Return the progress statistics of the annotation task.
+    """
+    stats = getTaskStatistics(key)
+    if stats is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return jsonify(error=u'Usuário não está logado!', login='/%s/login' % key), 401
+
+    return jsonify(stats.get())
+
+
+def itemTweetHtml(item):
+    """
+    Return a pair (html, cause) with the embed HTML of the tweet of the given item (see OEmbedClient.getTweetHtml).
+    """
+    if item.doc is None:
+        # O documento referenciado pelo item não existe no índice de documentos.
+        return None, u"Documento %s não encontrado" % item.docId
+    return getOEmbedClient().getTweetHtml(item.doc["tweet"])
+
+
+def resolveItem(annManager, userId, item):
+    """
+    Get the embed HTML of the given item. Items whose tweet cannot be embedded (removed or protected tweets) are
+    invalidated and replaced by the next item of the annotator.
+
+    :return: a pair (item, html) or (None, None) if there is no item left.
+    """
+    while item is not None:
+        tweetHtml, cause = itemTweetHtml(item)
+        if tweetHtml is not None:
+            return item, tweetHtml
+        # O tweet não pôde ser recuperado (em geral, foi removido ou não é mais público).
+        item = annManager.invalidate(userId, item.id, cause)
+    return None, None
+
+
+def resolveItems(annManager, userId, items, numItems):
+    """
+    Get the embed HTML of the given items (leased by the given annotator). Items whose tweet cannot be embedded are
+    invalidated and new items are leased to replace them.
+
+    :return: list of pairs (item, html).
+    """
+    while True:
+        resolved = []
+        for item in items:
+            tweetHtml, cause = itemTweetHtml(item)
+            if tweetHtml is None:
+                # O tweet não pôde ser recuperado (em geral, foi removido ou não é mais público).
+                annManager.invalidate(userId, item.id, cause)
+            else:
+                resolved.append((item, tweetHtml))
+
+        if len(resolved) == len(items):
+            return resolved
+
+        # Replace the invalidated items.
+        items = annManager.leaseItems(userId, numItems)
+
+
+def itemJson(item, tweetHtml):
+    """
+    Return the JSON representation of an item sent to the annotation client.
+    """
+    if item is None:
+        return {"item": None, "message": u"Todos os tweets foram anotados. Obrigado!"}
+    return {
+        "item": {
+            "id": item.id,
+            "context": item.contextDescription,
+            "html": tweetHtml
+        }
+    }
+
+
+@app.route('/<key>/app', methods=['GET'])
+def annotationApp(key):
+    """
+    Render the annotation page that uses the JSON API (one request per annotation).
+    """
+    if getAnnotationManager(key) is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return redirect('/%s/login' % key)
+
+    return render_template('tweet_annotation_app.html', key=key, email=session.userEmail)
+
+
+@app.route('/<key>/api/next', methods=['GET'])
+def apiNextItem(key):
+    """
+    Return the current item (and its embed HTML) of the logged user.
+    """
+    annManager = getAnnotationManager(key)
+    if annManager is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return jsonify(error=u'Usuário não está logado!', login='/%s/login' % key), 401
+
+    item, tweetHtml = resolveItem(annManager, session.userId, annManager.getItem(session.userId))
+    if item is None:
+        app.logger.error("No item to be annotated!")
+    logRequest(nextItem=item.id if item is not None else None)
+    return jsonify(itemJson(item, tweetHtml))
+
+
+@app.route('/<key>/api/annotate', methods=['POST'])
+def apiAnnotate(key):
+    """
+    Process an annotation and return the next item (and its embed HTML) of the logged user, so the client does not
+    need another request to get it.
+
+    The request body (JSON or form) includes the annotated item id (itemId) and the annotation (Sim, Nao or Nao Sei).
+    """
+    annManager = getAnnotationManager(key)
+    if annManager is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return jsonify(error=u'Usuário não está logado!', login='/%s/login' % key), 401
+
+    params = request.get_json(silent=True) or request.form
+    userId = session.userId
+    itemId = params.get('itemId')
+    annotation = params.get('annotation')
+    logRequest(item=itemId, annotation=annotation)
+
+    # Check if the given annotation is related to the current item of the logged user.
+    item = annManager.getItem(userId)
+    if item is None or itemId != item.id:
+        app.logger.error(u'Anotação de tweet com ID inconsistente (%s != %s) / userId: %s' % (
+            item.id if item is not None else None, itemId, userId))
+        item, tweetHtml = resolveItem(annManager, userId, item)
+        res = itemJson(item, tweetHtml)
+        res["error"] = u'Anotação de tweet com ID inconsistente!'
+        return jsonify(res), 409
+
+    if annotation in ("Sim", "Nao"):
+        nextItem = annManager.annotate(userId, item.id, annotation)
+    elif annotation == "Nao Sei":
+        nextItem = annManager.skip(userId, item.id)
+    else:
+        app.logger.error("Unknown annotation %s" % annotation)
+        return jsonify(error=u'Anotação desconhecida!'), 400
+
+    app.logger.info(u'Usuário %s anotou o item %s como %s' % (userId, item.id, annotation))
+
+    nextItem, tweetHtml = resolveItem(annManager, userId, nextItem)
+    logRequest(nextItem=nextItem.id if nextItem is not None else None)
+    return jsonify(itemJson(nextItem, tweetHtml))
+
+
+@app.route('/<key>/batch', methods=['GET'])
+def batchAnnotationApp(key):
+    """
+    Render the annotation page that leases a batch of items, prefetches their embeds and submits annotations in
+    batches.
+    """
+    if getAnnotationManager(key) is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return redirect('/%s/login' % key)
+
+    return render_template('tweet_annotation_batch.html', key=key, email=session.userEmail,
+                           batchSize=request.args.get('size', 5, type=int))
+
+
+@app.route('/<key>/api/lease', methods=['GET'])
+def apiLeaseItems(key):
+    """
+    Return a batch of items (and their embed HTMLs) held by the logged user. The number of items is given by the size
+    argument (default 5).
+    """
+    annManager = getAnnotationManager(key)
+    if annManager is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return jsonify(error=u'Usuário não está logado!', login='/%s/login' % key), 401
+
+    numItems = request.args.get('size', 5, type=int)
+    items = resolveItems(annManager, session.userId, annManager.leaseItems(session.userId, numItems), numItems)
+    logRequest(size=numItems, nextItems=[item.id for (item, _) in items])
+    return jsonify(items=[itemJson(item, tweetHtml)["item"] for (item, tweetHtml) in items])
+
+
+@app.route('/<key>/api/annotate_batch', methods=['POST'])
+def apiAnnotateBatch(key):
+    """
+    Process a batch of annotations and return the items (and their embed HTMLs) held by the logged user afterwards.
+
+    The request body is a JSON object with a list of annotations ({"itemId": ..., "annotation": ...}, where annotation
+    is Sim, Nao or Nao Sei) and the number of items to be held afterwards (size, default 5).
+    """
+    annManager = getAnnotationManager(key)
+    if annManager is None:
+        abort(404)
+
+    if session.userEmail is None:
+        return jsonify(error=u'Usuário não está logado!', login='/%s/login' % key), 401
+
+    params = request.get_json(silent=True)
+    if params is None and len(request.get_data()) == 0:
+        params = {}
+    if not isinstance(params, dict):
+        return jsonify(error=u'O corpo da requisição deve ser um objeto JSON!'), 400
+    try:
+        numItems = int(params.get('size', 5))
+    except (TypeError, ValueError):
+        return jsonify(error=u'Tamanho inválido!'), 400
+    received = params.get('annotations', [])
+    if not isinstance(received, list):
+        return jsonify(error=u'As anotações devem ser uma lista!'), 400
+    if not all(isinstance(ann, dict) for ann in received):
+        return jsonify(error=u'Anotação mal formada!'), 400
+
+    userId = session.userId
+    annotations = []
+    for ann in received:
+        itemId = ann.get('itemId')
+        annotation = ann.get('annotation')
+        if annotation in ("Sim", "Nao"):
+            annotations.append((itemId, annotation))
+        elif annotation == "Nao Sei":
+            annotations.append((itemId, AnnotationManager.SKIP))
+        else:
+            app.logger.error("Unknown annotation %s" % annotation)
+            continue
+        app.logger.info(u'Usuário %s anotou o item %s como %s' % (userId, itemId, annotation))
+
+    items = resolveItems(annManager, userId, annManager.annotateBatch(userId, annotations, numItems), numItems)
+    logRequest(size=numItems, annotations=received, nextItems=[item.id for (item, _) in items])
+    return jsonify(items=[itemJson(item, tweetHtml)["item"] for (item, tweetHtml) in items])
+
+
+def initSessionInterface():
+    """
+    Store the annotators' sessions in Elasticsearch.
+    """
     app.session_interface = ElasticsearchSessionInterface(getElasticsearchClient(), index='ctrls', docType='annotator')
+
+
+if __name__ == '__main__':
+    initSessionInterface()
     app.run(host='0.0.0.0')